@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.utils import timezone
 from .models import *
 
 @admin.register(CourseCategory)
@@ -12,12 +13,12 @@ class CourseAdmin(admin.ModelAdmin):
 
 @admin.register(Video)
 class VideoAdmin(admin.ModelAdmin):
-    list_display = ('title', 'course', 'duration', 'order')
-    list_filter = ('course',)
+    list_display = ('title', 'course', 'duration', 'order', 'hls_status')
+    list_filter = ('course', 'hls_status')
 
 @admin.register(StudentCourse)
 class StudentCourseAdmin(admin.ModelAdmin):
-    list_display = ('student', 'course', 'enrolled_at', 'completed')
+    list_display = ('student', 'course', 'enrolled_at', 'completed', 'progress_percentage')
     list_filter = ('course', 'completed')
 
 @admin.register(VideoProgress)
@@ -30,7 +31,31 @@ class RatingAdmin(admin.ModelAdmin):
     list_display = ('student', 'video', 'trainer', 'rating', 'created_at')
     list_filter = ('rating',)
 
+@admin.register(RatingSummary)
+class RatingSummaryAdmin(admin.ModelAdmin):
+    list_display = ('key', 'rating_count', 'rating_sum', 'stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5')
+    search_fields = ('key',)
+
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ('student', 'course', 'amount', 'payment_status', 'created_at')
-    list_filter = ('payment_status',)
\ No newline at end of file
+    list_filter = ('payment_status',)
+@admin.register(DailyRevenue)
+class DailyRevenueAdmin(admin.ModelAdmin):
+    list_display = ('day', 'course', 'status', 'payment_count', 'amount')
+    list_filter = ('status',)
+    date_hierarchy = 'day'
+@admin.register(VideoUpload)
+class VideoUploadAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'course', 'trainer', 'size', 'created_at', 'updated_at')
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'queue', 'status', 'priority', 'run_at', 'attempts', 'max_attempts', 'locked_by')
+    list_filter = ('status', 'queue')
+    search_fields = ('name', 'last_error')
+    actions = ['retry']
+
+    @admin.action(description='Retry selected jobs now')
+    def retry(self, request, queryset):
+        count = queryset.update(status='queued', attempts=0, run_at=timezone.now(), locked_by='', locked_until=None)
+        self.message_user(request, f'{count} jobs queued again.')
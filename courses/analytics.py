@@ -0,0 +1,108 @@
+from collections import defaultdict
+
+from django.db.models import Count, Exists, Max, OuterRef, Q
+
+from .models import Course, StudentCourse, Video, VideoProgress
+
+
+def course_video_counts(courses=None):
+    videos = Video.objects.order_by()
+    if courses is not None:
+        videos = videos.filter(course__in=courses.values('pk'))
+    return dict(videos.values_list('course').annotate(n=Count('id')).values_list('course', 'n'))
+
+
+def _percentage(done, total):
+    return (done / total * 100) if total > 0 else 0
+
+
+def student_progress_report(students):
+    """
+    Per-student rows for the manager progress report, built from a fixed
+    number of grouped queries instead of several queries per student.
+    """
+    # Courses are few and shared by many enrollments, so load each one once
+    # rather than joining the course and trainer onto every enrollment row.
+    # In id order, as the per-student queries listed them.
+    enrollments = StudentCourse.objects.filter(student__in=students.values('pk')).order_by('id')
+    courses = Course.objects.filter(pk__in=enrollments.values('course')).select_related('trainer')
+    courses = {course.id: course for course in courses}
+
+    enrollments_by_student = defaultdict(list)
+    for enrollment in enrollments:
+        enrollment.course = courses[enrollment.course_id]
+        enrollments_by_student[enrollment.student_id].append(enrollment)
+
+    activity = VideoProgress.objects.filter(
+        student__in=students.values('pk')
+    ).order_by().values('student').annotate(
+        videos_watched=Count('id', filter=Q(completed=True)),
+        last_activity=Max('last_watched'),
+    )
+    activity = {row['student']: row for row in activity}
+
+    rows = []
+    for student in students:
+        student_enrollments = enrollments_by_student.get(student.id, [])
+        student_activity = activity.get(student.id, {})
+        total_videos_watched = student_activity.get('videos_watched', 0)
+        total_videos_assigned = sum(enrollment.total_videos for enrollment in student_enrollments)
+
+        rows.append({
+            'student': student,
+            'enrollments': student_enrollments,
+            'total_enrollments': len(student_enrollments),
+            'completed_courses': sum(1 for enrollment in student_enrollments if enrollment.completed),
+            'overall_progress': _percentage(total_videos_watched, total_videos_assigned),
+            'total_videos_watched': total_videos_watched,
+            'last_activity': student_activity.get('last_activity'),
+        })
+    return rows
+
+
+def course_progress_report(courses):
+    """
+    Per-course rows for the manager progress report. Average progress is
+    still the mean of each enrolled student's percentage, summed in
+    enrollment order, so the rendered figures match the per-row version.
+    """
+    video_counts = course_video_counts(courses)
+
+    enrolled = StudentCourse.objects.filter(student=OuterRef('student'), course=OuterRef('video__course'))
+    completed_by_enrollment = {
+        (student_id, course_id): n
+        for student_id, course_id, n in VideoProgress.objects.filter(
+            video__course__in=courses.values('pk'),
+            completed=True,
+        ).filter(Exists(enrolled)).order_by().values_list('student', 'video__course').annotate(
+            n=Count('id')
+        ).values_list('student', 'video__course', 'n')
+    }
+
+    enrollments_by_course = defaultdict(list)
+    for student_id, course_id, completed in StudentCourse.objects.filter(
+        course__in=courses.values('pk')
+    ).order_by('id').values_list('student_id', 'course_id', 'completed'):
+        enrollments_by_course[course_id].append((student_id, completed))
+
+    rows = []
+    for course in courses:
+        course_enrollments = enrollments_by_course.get(course.id, [])
+        total_students = len(course_enrollments)
+        total_videos = video_counts.get(course.id, 0)
+        avg_progress = 0
+
+        if total_students > 0:
+            total_progress = 0
+            for student_id, _ in course_enrollments:
+                completed_videos = completed_by_enrollment.get((student_id, course.id), 0)
+                total_progress += _percentage(completed_videos, total_videos)
+            avg_progress = total_progress / total_students
+
+        rows.append({
+            'course': course,
+            'total_students': total_students,
+            'completed_students': sum(1 for _, completed in course_enrollments if completed),
+            'avg_progress': avg_progress,
+        })
+    return rows
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CoursesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'courses'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .sqlite import configure_sqlite
+
+        connection_created.connect(configure_sqlite, dispatch_uid='courses.configure_sqlite')
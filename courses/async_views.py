@@ -0,0 +1,58 @@
+"""
+Helpers for ``async def`` views: counterparts of the decorators from
+django.contrib.auth and django.views.decorators.http and of
+get_object_or_404, which only gained async support in Django 5.0.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, HttpResponseNotAllowed
+
+
+async def aget_user(request):
+    """
+    ``request.user``, loaded without blocking the event loop. The lazy user
+    set by AuthenticationMiddleware reads the session and the database on
+    first access, which is not allowed from async code.
+    """
+    def load():
+        # Evaluates the lazy object; later attribute reads are plain.
+        request.user.is_authenticated
+        return request.user
+    return await sync_to_async(load)()
+
+
+async def aget_object_or_404(queryset, **lookup):
+    try:
+        return await queryset.aget(**lookup)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+
+
+def async_login_required(view_func):
+    """
+    Leaves ``request.user`` loaded, so the view can read it directly.
+    """
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), settings.LOGIN_URL)
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
+
+def async_require_http_methods(methods):
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return HttpResponseNotAllowed(methods)
+            return await view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async_require_safe = async_require_http_methods(['GET', 'HEAD'])
@@ -0,0 +1,28 @@
+"""
+Django's SQLite backend with the ``transaction_mode`` option of Django 5.1:
+atomic() opens its transaction with BEGIN IMMEDIATE (or EXCLUSIVE) when
+OPTIONS asks for it. A deferred transaction that reads and then writes
+fails with "database is locked" straight away if another connection wrote
+in between, whatever busy_timeout says; an immediate one takes the write
+lock up front and so waits its turn instead.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'EXCLUSIVE', 'IMMEDIATE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        transaction_mode = params.pop('transaction_mode', None)
+        if transaction_mode is not None and transaction_mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f'settings.DATABASES["{self.alias}"]["OPTIONS"]["transaction_mode"] is improperly configured '
+                f'to {transaction_mode!r}. Use one of {", ".join(TRANSACTION_MODES)}, or None.'
+            )
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        transaction_mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        self.cursor().execute(f'BEGIN {transaction_mode.upper()}' if transaction_mode else 'BEGIN')
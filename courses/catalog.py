@@ -0,0 +1,83 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from .models import Course, StudentCourse
+
+VERSION_KEY = 'catalog:version'
+# What the course list and trainer pages render of a catalog course; the
+# trainer fields match TRAINER_CATALOG_FIELDS in courses/signals.py.
+CATALOG_FIELDS = (
+    'title', 'description', 'price', 'duration', 'is_active', 'category__name',
+    'trainer__first_name', 'trainer__last_name', 'trainer__username',
+)
+
+
+def catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(VERSION_KEY, version, None):
+            version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    # A fresh timestamp rather than an increment, so a version key lost to
+    # eviction can never come back pointing at an old snapshot.
+    cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def course_version(course_id):
+    """
+    Stamp of the course's page fragments (its videos, trainer, category and
+    ratings), changed by bump_course_versions.
+    """
+    key = f'catalog:course:{course_id}'
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_course_versions(course_ids):
+    version = time.time_ns()
+    cache.set_many({f'catalog:course:{course_id}': version for course_id in course_ids}, None)
+
+
+def active_catalog():
+    """
+    All active courses with trainer and category loaded and ``video_count`` /
+    ``total_video_minutes`` annotated, cached as one snapshot per catalog
+    version. Only the fields the catalog pages show are loaded, so no
+    password hash or other private trainer field ends up in the cache.
+    """
+    key = f'catalog:snapshot:{catalog_version()}'
+    courses = cache.get(key)
+    if courses is None:
+        courses = list(
+            Course.objects.filter(is_active=True)
+            .select_related('trainer', 'category')
+            .only(*CATALOG_FIELDS)
+            .annotate(video_count=Count('videos'), total_video_minutes=Sum('videos__duration'))
+            .order_by('id')
+        )
+        cache.set(key, courses, settings.CATALOG_CACHE_TIMEOUT)
+    return courses
+
+
+def enrolled_course_ids(student):
+    key = f'catalog:enrolled:{student.id}'
+    course_ids = cache.get(key)
+    if course_ids is None:
+        course_ids = frozenset(StudentCourse.objects.filter(student=student).values_list('course_id', flat=True))
+        cache.set(key, course_ids, settings.CATALOG_CACHE_TIMEOUT)
+    return course_ids
+
+
+def forget_enrolled_course_ids(student_id):
+    cache.delete(f'catalog:enrolled:{student_id}')
@@ -0,0 +1,172 @@
+"""
+Streaming exports of payments, enrollments, video progress and ratings as
+CSV or NDJSON, optionally gzipped. Rows come from values_list().iterator()
+and leave as chunks of about EXPORT_CHUNK_BYTES, so memory stays flat
+whatever the number of rows. Used by the export_data view and command.
+"""
+import csv
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Payment, Rating, StudentCourse, VideoProgress
+
+# Per dataset: the model, the timestamp the date range applies to, the
+# course lookup for the course filter, and the columns as header: lookup.
+EXPORTS = {
+    'payments': {
+        'model': Payment,
+        'date': 'created_at',
+        'course': 'course_id',
+        'columns': {
+            'id': 'id', 'created_at': 'created_at', 'updated_at': 'updated_at', 'status': 'payment_status',
+            'amount': 'amount', 'course_id': 'course_id', 'course': 'course__title', 'student_id': 'student_id',
+            'student': 'student__username', 'email': 'student__email', 'session_id': 'stripe_session_id',
+            'payment_intent_id': 'stripe_payment_intent_id',
+        },
+    },
+    'enrollments': {
+        'model': StudentCourse,
+        'date': 'enrolled_at',
+        'course': 'course_id',
+        'columns': {
+            'id': 'id', 'enrolled_at': 'enrolled_at', 'course_id': 'course_id', 'course': 'course__title',
+            'student_id': 'student_id', 'student': 'student__username', 'completed': 'completed',
+            'completed_videos': 'completed_videos', 'total_videos': 'total_videos',
+            'progress_percentage': 'progress_percentage',
+        },
+    },
+    'progress': {
+        'model': VideoProgress,
+        'date': 'last_watched',
+        'course': 'video__course_id',
+        'columns': {
+            'id': 'id', 'last_watched': 'last_watched', 'course_id': 'video__course_id', 'video_id': 'video_id',
+            'student_id': 'student_id', 'student': 'student__username', 'completed': 'completed',
+            'watched_time': 'watched_time',
+        },
+    },
+    'ratings': {
+        'model': Rating,
+        'date': 'created_at',
+        # Trainer ratings belong to no course and drop out of a course filter.
+        'course': 'video__course_id',
+        'columns': {
+            'id': 'id', 'created_at': 'created_at', 'course_id': 'video__course_id', 'video_id': 'video_id',
+            'trainer_id': 'trainer_id', 'student_id': 'student_id', 'student': 'student__username',
+            'rating': 'rating', 'comment': 'comment',
+        },
+    },
+}
+# A CSV cell starting with one of these is a formula to a spreadsheet.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def export_rows(name, date_from=None, date_to=None, course_id=None):
+    """
+    The header and an iterator over the rows of dataset ``name``, in id
+    order. ``date_to`` is exclusive.
+    """
+    export = EXPORTS[name]
+    rows = export['model'].objects.order_by('id')
+    if date_from:
+        rows = rows.filter(**{f'{export["date"]}__gte': date_from})
+    if date_to:
+        rows = rows.filter(**{f'{export["date"]}__lt': date_to})
+    if course_id:
+        rows = rows.filter(**{export['course']: course_id})
+    header = list(export['columns'])
+    return header, rows.values_list(*export['columns'].values()).iterator(chunk_size=settings.EXPORT_QUERY_CHUNK_SIZE)
+
+
+class _Lines:
+    # csv.writer wants a file; this one just keeps what was written.
+    def __init__(self):
+        self.parts = []
+
+    def write(self, line):
+        self.parts.append(line)
+
+
+def _buffered(lines):
+    size = 0
+    parts = []
+    for line in lines:
+        parts.append(line)
+        size += len(line)
+        if size >= settings.EXPORT_CHUNK_BYTES:
+            yield ''.join(parts).encode()
+            size = 0
+            parts = []
+    if parts:
+        yield ''.join(parts).encode()
+
+
+def _csv_cell(value):
+    # Names, emails, titles and comments are user input; quoted, they open
+    # as text in a spreadsheet instead of running.
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv_lines(header, rows):
+    buffer = _Lines()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow([_csv_cell(value) for value in row])
+        yield from buffer.parts
+        buffer.parts.clear()
+    yield from buffer.parts
+
+
+def _ndjson_lines(header, rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(dict(zip(header, row))) + '\n'
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_chunks(name, fmt, gzip=False, **filters):
+    """
+    Bytes of dataset ``name`` in ``fmt`` ('csv' or 'ndjson'), produced as
+    they are read.
+    """
+    header, rows = export_rows(name, **filters)
+    lines = _csv_lines(header, rows) if fmt == 'csv' else _ndjson_lines(header, rows)
+    chunks = _buffered(lines)
+    return _gzipped(chunks) if gzip else chunks
+
+
+async def aiter_chunks(chunks):
+    """
+    ``chunks`` as an async iterator for an ASGI response. Every step runs on
+    the request's one sync thread, which owns the database cursor.
+    """
+    step = sync_to_async(next)
+    done = object()
+    while True:
+        chunk = await step(chunks, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
+def export_filename(name, fmt, gzip=False):
+    return f'{name}.{fmt}.gz' if gzip else f'{name}.{fmt}'
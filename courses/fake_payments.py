@@ -0,0 +1,96 @@
+"""
+A stand-in for Stripe Checkout, selected with PAYMENT_PROVIDER = 'fake'.
+Sessions open a local checkout page instead of stripe.com, and paying there
+sends the same signed webhook events Stripe would, so the whole flow runs
+in tests and load tests without network access.
+"""
+import json
+import logging
+import secrets
+import threading
+import time
+import urllib.request
+from urllib.parse import urlencode
+
+import stripe
+from django.conf import settings
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+
+def create_checkout_session(course, student, success_url, cancel_url):
+    session_id = f'cs_fake_{secrets.token_hex(12)}'
+    query = urlencode({'success_url': success_url, 'cancel_url': cancel_url})
+    return {'id': session_id, 'url': f"{reverse('fake_checkout', args=[session_id])}?{query}"}
+
+
+def checkout_event(payment, event_type='checkout.session.completed', paid=True):
+    """
+    A Stripe-shaped event for the payment's checkout session.
+    """
+    return {
+        'id': f'evt_fake_{secrets.token_hex(12)}',
+        'object': 'event',
+        'type': event_type,
+        'created': int(time.time()),
+        'data': {'object': {
+            'id': payment.stripe_session_id,
+            'object': 'checkout.session',
+            'mode': 'payment',
+            'status': 'expired' if event_type == 'checkout.session.expired' else 'complete',
+            'payment_status': 'paid' if paid else 'unpaid',
+            'payment_intent': f'pi_fake_{payment.stripe_session_id[8:]}' if paid else None,
+            'amount_total': int(payment.amount * 100),
+            'currency': 'usd',
+            'metadata': {'course_id': str(payment.course_id), 'student_id': str(payment.student_id)},
+        }},
+    }
+
+
+def sign(payload):
+    """
+    The Stripe-Signature header for a webhook body, timestamped now.
+    """
+    from .payments import webhook_secret
+    return stripe.WebhookSignature.generate_signature_header(payload, webhook_secret())
+
+
+def signed_payload(event):
+    payload = json.dumps(event)
+    return payload, sign(payload)
+
+
+def deliver(event, url):
+    payload, signature = signed_payload(event)
+    request = urllib.request.Request(url, data=payload.encode(), method='POST', headers={
+        'Content-Type': 'application/json',
+        'Stripe-Signature': signature,
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except OSError as e:
+        logger.warning('Fake webhook %s to %s failed: %s', event['type'], url, e)
+        return None
+
+
+def send(event, url):
+    """
+    Post the event to the webhook from a background thread after
+    FAKE_PAYMENT_WEBHOOK_DELAY seconds, the way Stripe's webhook races the
+    customer's redirect. With the delay set to None the signed event goes
+    through the webhook handling in-process instead, which is what the test
+    client and the benchmarks need as no server is listening.
+    """
+    delay = settings.FAKE_PAYMENT_WEBHOOK_DELAY
+    if delay is None:
+        from .payments import handle_event, verify_webhook
+        return handle_event(verify_webhook(*signed_payload(event)))
+
+    def run():
+        time.sleep(delay)
+        deliver(event, url)
+
+    threading.Thread(target=run, daemon=True).start()
+    return None
@@ -0,0 +1,310 @@
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+import requests
+import stripe
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Seconds left before the current call's deadline, which caps the connect
+# and read timeouts of its next attempt.
+_time_left = contextvars.ContextVar('gateway_time_left', default=None)
+
+
+class PaymentGatewayError(Exception):
+    pass
+
+
+class GatewayUnavailable(PaymentGatewayError):
+    """
+    The provider could not be reached in time, or the circuit is open and
+    no request was made.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failed requests and rejects
+    everything for ``reset_timeout`` seconds, then lets a single trial request
+    through: its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning('Payment provider circuit opened after %d failures', self.failures)
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+    def release_trial(self):
+        """
+        Free the trial slot of a request that ended without an outcome
+        (cancelled, or an error that says nothing about the provider), so
+        the next request can make the trial.
+        """
+        with self._lock:
+            self.trial_running = False
+
+
+def _retryable(error):
+    return isinstance(error, stripe.APIConnectionError) or error.http_status in RETRYABLE_STATUSES
+
+
+class DeadlineRequestsClient(stripe.RequestsClient):
+    """RequestsClient whose timeouts shrink to the time the call has left."""
+
+    @property
+    def _timeout(self):
+        connect, read = self._timeouts
+        left = _time_left.get()
+        return (connect, read) if left is None else (min(connect, left), min(read, left))
+
+    @_timeout.setter
+    def _timeout(self, value):
+        self._timeouts = value
+
+
+class DeadlineHTTPXClient(stripe.HTTPXClient):
+    """HTTPXClient whose timeouts shrink to the time the call has left."""
+
+    @property
+    def _timeout(self):
+        connect, read = self._timeouts
+        left = _time_left.get()
+        if left is not None:
+            connect, read = min(connect, left), min(read, left)
+        return httpx.Timeout(read, connect=connect)
+
+    @_timeout.setter
+    def _timeout(self, value):
+        self._timeouts = value
+
+
+class PaymentGateway:
+    """
+    The one place that talks to the payment provider's API. Requests share
+    a pooled HTTP session and have connect/read timeouts. Transient failures
+    are retried with full-jitter backoff under one idempotency key, within
+    an overall deadline. A circuit breaker fails fast while the provider is
+    down so a brown-out cannot tie up every worker. The ``a``-prefixed
+    methods are for async views and use httpx when it is installed, with a
+    client per call: an httpx pool belongs to the event loop it was opened
+    on, and a WSGI server runs each async view on a loop of its own.
+    """
+
+    def __init__(self, api_key, api_base=None, connect_timeout=3, read_timeout=5, retries=2, backoff=0.25,
+                 max_backoff=2, deadline=8, pool_size=10, failure_threshold=5, reset_timeout=30):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        self.api_key = api_key
+        self.base_addresses = {'api': api_base} if api_base else None
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.client = stripe.StripeClient(
+            api_key,
+            base_addresses=self.base_addresses,
+            http_client=DeadlineRequestsClient(timeout=(connect_timeout, read_timeout), session=session),
+            # Retries are ours, so they respect the deadline and the breaker.
+            max_network_retries=0,
+        )
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    def _admit(self, operation, started, attempt):
+        """Seconds the next attempt may take, or raise when it can't be made."""
+        time_left = self.deadline - (time.monotonic() - started)
+        if time_left <= 0:
+            registry.record_provider_call(operation, 0, 'error')
+            logger.warning('Payment provider %s ran out of time after %d attempts', operation, attempt)
+            raise GatewayUnavailable(f'No response within {self.deadline}s')
+        if not self.breaker.allow():
+            registry.record_provider_call(operation, 0, 'rejected')
+            raise GatewayUnavailable('Payment provider circuit is open')
+        return time_left
+
+    def _succeeded(self, operation, elapsed):
+        self.breaker.record_success()
+        registry.record_provider_call(operation, elapsed, 'ok')
+
+    def _failed(self, operation, error, attempt, started, elapsed):
+        """
+        Record a failed attempt and return the delay before the next one, or
+        raise when the error is not worth retrying or time is up.
+        """
+        if not _retryable(error):
+            # The provider answered; the request itself was bad.
+            self.breaker.record_success()
+            registry.record_provider_call(operation, elapsed, 'error')
+            raise PaymentGatewayError(error.user_message or str(error)) from error
+
+        self.breaker.record_failure()
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        out_of_time = time.monotonic() - started + delay >= self.deadline
+        if attempt >= self.retries or out_of_time:
+            registry.record_provider_call(operation, elapsed, 'error')
+            logger.warning('Payment provider %s failed after %d attempts: %s', operation, attempt + 1, error)
+            raise GatewayUnavailable(str(error)) from error
+        registry.record_provider_call(operation, elapsed, 'retry')
+        return delay
+
+    def call(self, operation, method, params):
+        options = {'idempotency_key': str(uuid.uuid4())}
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            token = _time_left.set(self._admit(operation, started, attempt))
+            attempt_started = time.monotonic()
+            try:
+                result = method(params, options)
+            except stripe.StripeError as e:
+                delay = self._failed(operation, e, attempt, started, time.monotonic() - attempt_started)
+            except BaseException:
+                # No outcome to record; a half-open circuit must not wait on it.
+                self.breaker.release_trial()
+                raise
+            else:
+                self._succeeded(operation, time.monotonic() - attempt_started)
+                return result
+            finally:
+                _time_left.reset(token)
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, operation, method, params):
+        """
+        call() for the provider SDK's ``*_async`` methods: waiting on the
+        provider and backing off leave the event loop free.
+        """
+        options = {'idempotency_key': str(uuid.uuid4())}
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            token = _time_left.set(self._admit(operation, started, attempt))
+            attempt_started = time.monotonic()
+            try:
+                result = await method(params, options)
+            except stripe.StripeError as e:
+                delay = self._failed(operation, e, attempt, started, time.monotonic() - attempt_started)
+            except BaseException:
+                # No outcome to record; a half-open circuit must not wait on it.
+                self.breaker.release_trial()
+                raise
+            else:
+                self._succeeded(operation, time.monotonic() - attempt_started)
+                return result
+            finally:
+                _time_left.reset(token)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @asynccontextmanager
+    async def _async_client(self):
+        http_client = DeadlineHTTPXClient(timeout=(self.connect_timeout, self.read_timeout))
+        try:
+            yield stripe.StripeClient(
+                self.api_key, base_addresses=self.base_addresses, http_client=http_client, max_network_retries=0,
+            )
+        finally:
+            await http_client.close_async()
+
+    def create_checkout_session(self, params):
+        return self.call('checkout.sessions.create', self.client.v1.checkout.sessions.create, params)
+
+    async def acreate_checkout_session(self, params):
+        if httpx is None:
+            # No async HTTP client installed: the blocking call gets a thread.
+            return await sync_to_async(self.create_checkout_session, thread_sensitive=False)(params)
+        async with self._async_client() as client:
+            return await self.acall('checkout.sessions.create', client.v1.checkout.sessions.create_async, params)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """
+    The process-wide gateway, so the connection pool and the breaker's
+    state are shared by every request a worker handles.
+    """
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = PaymentGateway(
+                settings.STRIPE_SECRET_KEY,
+                api_base=settings.PAYMENT_GATEWAY_API_BASE,
+                connect_timeout=settings.PAYMENT_GATEWAY_CONNECT_TIMEOUT,
+                read_timeout=settings.PAYMENT_GATEWAY_READ_TIMEOUT,
+                retries=settings.PAYMENT_GATEWAY_RETRIES,
+                deadline=settings.PAYMENT_GATEWAY_DEADLINE,
+                pool_size=settings.PAYMENT_GATEWAY_POOL_SIZE,
+                failure_threshold=settings.PAYMENT_GATEWAY_FAILURE_THRESHOLD,
+                reset_timeout=settings.PAYMENT_GATEWAY_RESET_TIMEOUT,
+            )
+        return _gateway
+
+
+@receiver(setting_changed)
+def reset_gateway(setting, **kwargs):
+    global _gateway
+    if setting == 'STRIPE_SECRET_KEY' or setting.startswith('PAYMENT_GATEWAY_'):
+        _gateway = None
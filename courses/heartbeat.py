@@ -0,0 +1,121 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import VideoProgress
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressBuffer:
+    """
+    Per-process buffer of player positions keyed by (student, video). Repeated
+    heartbeats for the same pair overwrite each other in memory, keeping the
+    latest position (a rewind included) and the furthest one, and the buffer
+    is written out with one bulk_update per batch every ``flush_interval``
+    seconds, so database writes scale with active viewers per interval rather
+    than with heartbeats.
+    """
+
+    def __init__(self, flush_interval, batch_size=500, autostart=True):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.autostart = autostart
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def add(self, student_id, video_id, position):
+        key = (student_id, video_id)
+        with self._lock:
+            _, furthest = self._pending.get(key, (None, position))
+            self._pending[key] = (position, max(furthest, position))
+        if self.autostart and self._thread is None:
+            self._start()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='progress-flush', daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing buffered video progress failed')
+            finally:
+                connection.close()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        with self._flush_lock:
+            try:
+                self._write(pending)
+            except Exception:
+                # Put the positions back so the next flush retries them; a
+                # heartbeat that came in meanwhile is the latest position.
+                with self._lock:
+                    for key, (position, furthest) in pending.items():
+                        if key in self._pending:
+                            position, newer_furthest = self._pending[key]
+                            furthest = max(furthest, newer_furthest)
+                        self._pending[key] = (position, furthest)
+                raise
+        return len(pending)
+
+    def _write(self, pending):
+        now = timezone.now()
+        keys = list(pending)
+        for i in range(0, len(keys), self.batch_size):
+            batch = {key: pending[key] for key in keys[i:i + self.batch_size]}
+            student_ids = {student_id for student_id, _ in batch}
+            video_ids = {video_id for _, video_id in batch}
+
+            with transaction.atomic():
+                existing = {
+                    (progress.student_id, progress.video_id): progress
+                    for progress in VideoProgress.objects.filter(
+                        student_id__in=student_ids, video_id__in=video_ids
+                    ).only('id', 'student_id', 'video_id', 'watched_time', 'last_position')
+                }
+
+                changed = []
+                for key, (position, furthest) in batch.items():
+                    progress = existing.get(key)
+                    if progress is not None:
+                        progress.last_position = position
+                        progress.watched_time = max(progress.watched_time, furthest)
+                        changed.append(progress)
+                # Every row gets the same timestamp, so it goes in a plain UPDATE
+                # and only the per-row positions need bulk_update's CASE.
+                VideoProgress.objects.bulk_update(changed, ['watched_time', 'last_position'])
+                VideoProgress.objects.filter(pk__in=[progress.pk for progress in changed]).update(last_watched=now)
+
+                VideoProgress.objects.bulk_create(
+                    [VideoProgress(student_id=student_id, video_id=video_id, last_position=position,
+                                   watched_time=furthest)
+                     for (student_id, video_id), (position, furthest) in batch.items()
+                     if (student_id, video_id) not in existing],
+                    ignore_conflicts=True,
+                )
+
+
+progress_buffer = ProgressBuffer(settings.PROGRESS_FLUSH_INTERVAL)
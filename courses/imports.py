@@ -0,0 +1,213 @@
+"""
+Bulk import of students and their enrollments, for onboarding a partner
+institution. Records are validated one at a time, passwords are hashed in
+a process pool while the previous batch is written, and each batch goes in
+with bulk_create inside its own transaction.
+"""
+import csv
+import json
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .catalog import forget_enrolled_course_ids
+from .models import Course, StudentCourse
+from .progress import refresh_progress
+
+PROFILE_FIELDS = ('username', 'email', 'first_name', 'last_name', 'phone')
+COURSE_SEPARATOR_RE = re.compile(r'[\s;,]+')
+
+
+def read_csv(f):
+    """
+    (number, record) for each data row; ``courses`` lists course ids
+    separated by semicolons or spaces.
+    """
+    for number, record in enumerate(csv.DictReader(f), 1):
+        yield number, {key.strip().lower(): value for key, value in record.items() if key}
+
+
+def read_ndjson(f):
+    """
+    (number, record) for each line holding a JSON object; ``courses`` may be
+    a list of ids. Blank lines are numbered but skipped.
+    """
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            record = ValidationError(f'Invalid JSON: {e}')
+        if not isinstance(record, (dict, ValidationError)):
+            record = ValidationError('Expected a JSON object')
+        yield number, record
+
+
+def _course_ids(value):
+    if isinstance(value, list):
+        return value
+    return [part for part in COURSE_SEPARATOR_RE.split(str(value or '')) if part]
+
+
+class StudentImport:
+    """
+    Runs one import. ``errors`` collects (record number, message) pairs
+    and the counters say what was written.
+    """
+
+    def __init__(self, batch_size=500, processes=None):
+        self.batch_size = batch_size
+        self.processes = processes or multiprocessing.cpu_count()
+        self.course_ids = set(Course.objects.values_list('id', flat=True))
+        self.seen = set()
+        self.errors = []
+        self.users_created = 0
+        self.users_existing = 0
+        self.enrollments_created = 0
+
+    def clean(self, record):
+        """
+        The user's fields, a stored password hash or a password to hash (or
+        neither, for an unusable password) and the course ids, or
+        ValidationError listing everything wrong with the record.
+        """
+        if isinstance(record, ValidationError):
+            raise record
+        CustomUser = get_user_model()
+        errors = []
+        fields = {}
+        for name in PROFILE_FIELDS:
+            value = str(record.get(name) or '').strip()
+            if name in ('username', 'email') and not value:
+                errors.append(f'{name}: This field is required.')
+                continue
+            try:
+                fields[name] = CustomUser._meta.get_field(name).clean(value, None)
+            except ValidationError as e:
+                errors.extend(f'{name}: {message}' for message in e.messages)
+        username = fields.get('username')
+        if username in self.seen:
+            errors.append(f'username: {username} appears earlier in the file.')
+
+        password = str(record.get('password') or '')
+        password_hash = str(record.get('password_hash') or '').strip()
+        if password_hash:
+            try:
+                identify_hasher(password_hash)
+            except ValueError:
+                errors.append('password_hash: Not a hash this site can check.')
+        elif password and not errors:
+            try:
+                validate_password(password, CustomUser(**fields))
+            except ValidationError as e:
+                errors.extend(f'password: {message}' for message in e.messages)
+
+        course_ids = []
+        for course_id in _course_ids(record.get('courses')):
+            try:
+                course_id = int(course_id)
+            except (TypeError, ValueError):
+                course_id = None
+            if course_id not in self.course_ids:
+                errors.append(f'courses: No course with id {course_id!r}.')
+            else:
+                course_ids.append(course_id)
+
+        if errors:
+            raise ValidationError(errors)
+        self.seen.add(username)
+        return fields, password_hash, '' if password_hash else password, course_ids
+
+    def batches(self, records):
+        batch = []
+        for number, record in records:
+            try:
+                batch.append((number, *self.clean(record)))
+            except ValidationError as e:
+                self.errors.append((number, '; '.join(e.messages)))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def run(self, records, on_batch=None):
+        """
+        Import ``records`` of (number, record). ``on_batch`` is called with
+        the number of the last record of each batch once it is committed.
+        """
+        if self.processes > 1:
+            pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('fork'))
+        else:
+            pool = None
+        try:
+            previous = None
+            for batch in self.batches(records):
+                # Hash this batch in the pool while the previous one is written.
+                current = (batch, self.hash(pool, batch))
+                if previous:
+                    self.write(*previous, on_batch)
+                previous = current
+            if previous:
+                self.write(*previous, on_batch)
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+
+    def hash(self, pool, batch):
+        # PBKDF2 is what takes the time; stored hashes are kept as they are.
+        passwords = [password for _, _, _, password, _ in batch if password]
+        if pool and passwords:
+            return pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (self.processes * 4)))
+        return map(make_password, passwords)
+
+    def write(self, batch, hashed, on_batch):
+        CustomUser = get_user_model()
+        hashed = iter(hashed)
+        passwords = [
+            password_hash or (next(hashed) if password else make_password(None))
+            for _, _, password_hash, password, _ in batch
+        ]
+        usernames = [fields['username'] for _, fields, _, _, _ in batch]
+        with transaction.atomic():
+            existing = dict(CustomUser.objects.filter(username__in=usernames).values_list('username', 'user_type'))
+            CustomUser.objects.bulk_create(
+                (CustomUser(**fields, password=password, user_type='student')
+                 for (_, fields, _, _, _), password in zip(batch, passwords) if fields['username'] not in existing),
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
+            ids = dict(CustomUser.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+            enrollments = set()
+            for number, fields, _, _, course_ids in batch:
+                username = fields['username']
+                if existing.get(username, 'student') != 'student':
+                    self.errors.append((number, f'username: {username} belongs to a {existing[username]}.'))
+                    continue
+                enrollments.update((ids[username], course_id) for course_id in course_ids)
+            student_ids = {student_id for student_id, _ in enrollments}
+            enrollments -= set(StudentCourse.objects.filter(student_id__in=student_ids)
+                               .values_list('student_id', 'course_id'))
+            StudentCourse.objects.bulk_create(
+                (StudentCourse(student_id=student_id, course_id=course_id) for student_id, course_id in enrollments),
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
+            # bulk_create skips the signals that fill in progress and clear
+            # the enrolled-course cache.
+            refresh_progress(StudentCourse.objects.filter(student_id__in=student_ids))
+            transaction.on_commit(lambda: [forget_enrolled_course_ids(student_id) for student_id in student_ids])
+
+        self.users_created += len(usernames) - len(existing)
+        self.users_existing += sum(user_type == 'student' for user_type in existing.values())
+        self.enrollments_created += len(enrollments)
+        if on_batch:
+            on_batch(batch[-1][0])
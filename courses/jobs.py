@@ -0,0 +1,192 @@
+"""
+A job queue kept in the database, so slow work can leave the request
+without a separate broker. Decorate a module-level function with ``@task``
+and call ``.enqueue(...)`` on it; `manage.py run_jobs` workers claim and run
+the jobs. The job row is written in the caller's transaction, so a job is
+only ever seen by workers if the request that queued it committed. A job
+whose worker dies runs again, so tasks should be safe to repeat.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+class Task:
+    def __init__(self, func, queue, priority, max_attempts, timeout):
+        self.func = func
+        self.name = f'{func.__module__}.{func.__qualname__}'
+        self.queue = queue
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, run_at=None, delay=0, priority=None, queue=None, **kwargs):
+        """
+        Queue a call with JSON-serialisable arguments. When JOBS_IMMEDIATE
+        covers the queue, the call runs in-process once the current
+        transaction commits instead.
+        """
+        queue = queue or self.queue
+        if runs_immediately(queue):
+            transaction.on_commit(lambda: self.func(*args, **kwargs))
+            return None
+        return Job.objects.create(
+            name=self.name,
+            args=list(args),
+            kwargs=kwargs,
+            queue=queue,
+            priority=self.priority if priority is None else priority,
+            run_at=run_at or timezone.now() + timedelta(seconds=delay),
+            max_attempts=self.max_attempts,
+            timeout=self.timeout,
+        )
+
+
+def runs_immediately(queue):
+    """JOBS_IMMEDIATE is True for every queue, or the names of some."""
+    immediate = settings.JOBS_IMMEDIATE
+    return immediate is True or queue in (immediate or ())
+
+
+def task(func=None, *, queue='default', priority=0, max_attempts=3, timeout=300):
+    """
+    Make a function queueable: ``@task`` or ``@task(queue='video', timeout=3600)``.
+    ``timeout`` is the visibility timeout: a job held longer than that, for
+    instance by a worker that died, is handed to another worker.
+    """
+    def decorate(func):
+        return Task(func, queue, priority, max_attempts, timeout)
+    return decorate(func) if func is not None else decorate
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def _claimable(queues, now):
+    # Queued jobs that are due, and running jobs whose worker has gone quiet
+    # past the visibility timeout.
+    due = Q(status='queued', run_at__lte=now) | Q(status='running', locked_until__lt=now)
+    jobs = Job.objects.filter(due, attempts__lt=F('max_attempts'))
+    if queues:
+        jobs = jobs.filter(queue__in=queues)
+    return jobs.order_by('-priority', 'run_at', 'id')
+
+
+def claim(queues, worker, now=None):
+    """
+    Take the next due job for ``worker``, or return None.
+
+    Databases with SELECT ... FOR UPDATE SKIP LOCKED let concurrent workers
+    pass over each other's rows. Elsewhere (SQLite) the candidate is taken
+    with a conditional UPDATE that only one worker can win; losers try the
+    next candidate.
+    """
+    now = now or timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = _claimable(queues, now).select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            return _take([(job.pk, job.status, job.attempts, job.timeout)], worker, now)
+    candidates = _claimable(queues, now).values_list('pk', 'status', 'attempts', 'timeout')[:10]
+    return _take(list(candidates), worker, now)
+
+
+def _take(candidates, worker, now):
+    for pk, status, attempts, timeout in candidates:
+        taken = Job.objects.filter(pk=pk, status=status, attempts=attempts).update(
+            status='running',
+            attempts=attempts + 1,
+            locked_by=worker,
+            locked_until=now + timedelta(seconds=timeout),
+        )
+        if taken:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def retry_delay(attempts):
+    """
+    Seconds before retry number ``attempts``: exponential with full jitter.
+    """
+    return random.uniform(0, settings.JOBS_RETRY_BACKOFF * 2 ** (attempts - 1))
+
+
+def run(job, worker):
+    """
+    Run a claimed job. Success deletes it; an exception puts it back in the
+    queue after a backoff, or marks it failed once its attempts are used up.
+    Updates only apply while ``worker`` still holds the job.
+    """
+    held = Job.objects.filter(pk=job.pk, locked_by=worker, status='running')
+    try:
+        task = import_string(job.name)
+        task.func(*job.args, **job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Job %s (%s) failed on attempt %d of %d', job.pk, job.name, job.attempts, job.max_attempts)
+        if job.attempts >= job.max_attempts:
+            held.update(status='failed', last_error=error, locked_by='', locked_until=None)
+        else:
+            held.update(
+                status='queued', last_error=error, locked_by='', locked_until=None,
+                run_at=timezone.now() + timedelta(seconds=retry_delay(job.attempts)),
+            )
+        return False
+    held.delete()
+    return True
+
+
+def fail_abandoned(now=None):
+    """
+    Mark failed the running jobs that outlived their visibility timeout with
+    no attempts left; claim() no longer considers them.
+    """
+    now = now or timezone.now()
+    return Job.objects.filter(status='running', locked_until__lt=now, attempts__gte=F('max_attempts')).update(
+        status='failed', last_error='Timed out: the worker did not finish the job in time.',
+        locked_by='', locked_until=None,
+    )
+
+
+def work(queues, stop, poll_interval=1, burst=False):
+    """
+    Claim and run jobs from ``queues`` (every queue if empty) until
+    ``stop`` (a threading or multiprocessing Event) is set, or with
+    ``burst`` until none are due. Returns the jobs run.
+    """
+    worker = worker_id()
+    processed = 0
+    try:
+        while not stop.is_set():
+            job = claim(queues, worker)
+            if job is None:
+                fail_abandoned()
+                if burst:
+                    break
+                stop.wait(poll_interval)
+                continue
+            run(job, worker)
+            processed += 1
+            close_old_connections()
+    finally:
+        connection.close()
+    return processed
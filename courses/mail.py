@@ -0,0 +1,48 @@
+"""
+An email backend that queues messages as background jobs, so a request
+that sends mail (a password reset, say) does not wait on the mail server.
+Workers deliver through JOBS_EMAIL_BACKEND.
+"""
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+
+from .jobs import task
+
+
+def _serialize(message):
+    return {
+        'subject': message.subject,
+        'body': message.body,
+        'from_email': message.from_email,
+        'to': message.to,
+        'cc': message.cc,
+        'bcc': message.bcc,
+        'reply_to': message.reply_to,
+        'headers': message.extra_headers,
+        'alternatives': [list(alternative) for alternative in getattr(message, 'alternatives', [])],
+        'content_subtype': message.content_subtype,
+    }
+
+
+@task(queue='mail', max_attempts=5, timeout=60)
+def deliver(messages):
+    emails = []
+    for data in messages:
+        content_subtype = data.pop('content_subtype')
+        email = EmailMultiAlternatives(**{**data, 'alternatives': [tuple(alt) for alt in data['alternatives']]})
+        email.content_subtype = content_subtype
+        emails.append(email)
+    get_connection(settings.JOBS_EMAIL_BACKEND, fail_silently=False).send_messages(emails)
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        # Attachments are not JSON; those messages are sent straight away.
+        queued = [message for message in email_messages if not message.attachments]
+        direct = [message for message in email_messages if message.attachments]
+        if queued:
+            deliver.enqueue([_serialize(message) for message in queued])
+        if direct:
+            get_connection(settings.JOBS_EMAIL_BACKEND, fail_silently=self.fail_silently).send_messages(direct)
+        return len(email_messages)
@@ -0,0 +1,64 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from courses.analytics import course_progress_report, student_progress_report
+from courses.models import Course
+from courses.synthetic import generate_dataset
+
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the progress analytics report against a throwaway test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--enrollments', type=int, nargs='+', default=[10000, 100000])
+        parser.add_argument('--courses', type=int, default=100)
+        parser.add_argument('--videos-per-course', type=int, default=10)
+        parser.add_argument('--enrollments-per-student', type=int, default=4)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        for enrollments in options['enrollments']:
+            # A fresh database per size: cascading deletes through the
+            # payment and rating signals would take longer than the run.
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                self.populate(enrollments, options)
+                self.run(enrollments, options['repeat'])
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def populate(self, enrollments, options):
+        per_student = options['enrollments_per_student']
+        generate_dataset(
+            students=max(1, enrollments // per_student),
+            trainers=1,
+            courses=options['courses'],
+            videos_per_course=options['videos_per_course'],
+            enrollments_per_student=per_student,
+            rating_chance=0,
+            prefix='bench',
+            seed=options['seed'],
+        )
+
+    def run(self, enrollments, repeat):
+        CustomUser = get_user_model()
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                student_progress_report(CustomUser.objects.filter(user_type='student'))
+                course_progress_report(Course.objects.select_related('category', 'trainer'))
+                timings.append(time.perf_counter() - start)
+
+        self.stdout.write(
+            f'{enrollments} enrollments: {len(queries)} queries, '
+            f'median {statistics.median(timings) * 1000:.1f} ms, '
+            f'max {max(timings) * 1000:.1f} ms over {repeat} runs'
+        )
@@ -0,0 +1,88 @@
+import itertools
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from courses.models import Video
+from courses.search import search_backend
+from courses.synthetic import generate_dataset
+
+from .benchmark_views import percentile
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'to', 'vi', 'da', 're', 'po', 'an', 'el', 'is', 'or', 'un']
+
+
+def vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    # Sorted first so the shuffle, and so the word ranks, follow the seed.
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+class Command(BaseCommand):
+    help = ('Time search and autocomplete queries against a throwaway database of synthetic lectures whose '
+            'words follow a Zipf distribution, from very common to rare.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lectures', type=int, default=100000)
+        parser.add_argument('--videos-per-course', type=int, default=50)
+        parser.add_argument('--vocabulary', type=int, default=20000)
+        parser.add_argument('--queries', type=int, default=300)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            words = self.populate(options)
+            self.run(words, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def populate(self, options):
+        rng = random.Random(options['seed'])
+        generate_dataset(students=1, trainers=20, courses=max(1, options['lectures'] // options['videos_per_course']),
+                         videos_per_course=options['videos_per_course'], enrollments_per_student=0,
+                         rating_chance=0, payment_days=0, prefix='searchbench', seed=options['seed'])
+        words = vocabulary(options['vocabulary'], rng)
+        cumulative = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+
+        def text(count):
+            return ' '.join(rng.choices(words, cum_weights=cumulative, k=count))
+
+        start = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f'UPDATE {Video._meta.db_table} SET title = %s, description = %s WHERE id = %s',
+                [(text(rng.randint(3, 7)).capitalize(), text(rng.randint(20, 60)), pk)
+                 for pk in Video.objects.values_list('id', flat=True)],
+            )
+        search_backend().rebuild()
+        self.stdout.write(f'Indexed {Video.objects.count()} lectures in {time.perf_counter() - start:.1f} s')
+        return words
+
+    def run(self, words, options):
+        rng = random.Random(options['seed'])
+        backend = search_backend()
+        # Common, middling and rare words, one and two at a time.
+        bands = {'common': words[:20], 'middling': words[200:2000], 'rare': words[-5000:]}
+        cases = {}
+        for band, pool in bands.items():
+            cases[f'search 1 {band}'] = lambda pool=pool: backend.search(rng.choice(pool), 30)
+            cases[f'search 2 {band}'] = lambda pool=pool: backend.search(
+                f'{rng.choice(words[:200])} {rng.choice(pool)}', 30)
+            cases[f'suggest {band}'] = lambda pool=pool: backend.suggest(rng.choice(pool)[:rng.randint(2, 8)], 8)
+
+        for name, query in cases.items():
+            timings = []
+            for _ in range(options['queries']):
+                start = time.perf_counter()
+                query()
+                timings.append(time.perf_counter() - start)
+            self.stdout.write(f'{name:<20} p50 {percentile(timings, 50) * 1000:6.2f} ms  '
+                              f'p95 {percentile(timings, 95) * 1000:6.2f} ms  '
+                              f'max {max(timings) * 1000:6.2f} ms')
@@ -0,0 +1,258 @@
+import http.client
+import importlib.util
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from courses.models import Course, Payment, StudentCourse, Video, VideoProgress
+from courses.payment_stub import StubProviderServer
+from courses.synthetic import generate_dataset
+
+from .benchmark_views import percentile
+
+PREFIX = 'serverbench'
+SERVERS = {
+    # (module, command line after `python -m <module>`)
+    'uvicorn': ('uvicorn', lambda port, options: [
+        'new_elearning.asgi:application', '--host', '127.0.0.1', '--port', str(port),
+        '--workers', str(options['workers']), '--no-access-log', '--log-level', 'warning',
+    ]),
+    'gunicorn': ('gunicorn', lambda port, options: [
+        'new_elearning.wsgi:application', '--bind', f'127.0.0.1:{port}', '--workers', str(options['workers']),
+        '--worker-class', 'gthread', '--threads', str(options['threads']), '--log-level', 'warning',
+    ]),
+}
+SETTINGS_MODULE = '''from new_elearning.settings import *
+
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1']
+DATABASES['default']['NAME'] = {database!r}
+REPLICA_DATABASE = None
+SQLITE_PRAGMAS.update({{'journal_mode': 'wal', 'synchronous': 'normal'}})
+MEDIA_ROOT = {media_root!r}
+HLS_AUTO_PACKAGE = False
+JOBS_IMMEDIATE = False
+PAYMENT_PROVIDER = 'stripe'
+PAYMENT_GATEWAY_API_BASE = {api_base!r}
+'''
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = ('Compare concurrent-connection throughput of the async endpoints under uvicorn (ASGI) and '
+            'gunicorn (WSGI, gthread workers). Both serve the same throwaway database, and checkouts go to '
+            'a local payment provider stub with added latency. Results are written as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', default='uvicorn,gunicorn')
+        parser.add_argument('--connections', type=int, default=50, help='Concurrent keep-alive connections.')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per endpoint and server.')
+        parser.add_argument('--workers', type=int, default=1, help='Server processes.')
+        parser.add_argument('--threads', type=int, default=8, help='Threads per gunicorn worker.')
+        parser.add_argument('--provider-latency', type=float, default=0.2,
+                            help='Seconds the payment provider stub takes to answer.')
+        parser.add_argument('--video-bytes', type=int, default=4 * 1024 * 1024)
+        parser.add_argument('--only', help='Only benchmark endpoints whose name contains this text.')
+        parser.add_argument('--output', default='server-benchmark.json')
+
+    def handle(self, *args, **options):
+        servers = [name.strip() for name in options['servers'].split(',') if name.strip()]
+        for name in servers:
+            if name not in SERVERS:
+                raise CommandError(f'Unknown server {name!r}; choose from {", ".join(SERVERS)}')
+            if importlib.util.find_spec(SERVERS[name][0]) is None:
+                raise CommandError(f'{name} is not installed.')
+
+        work_dir = tempfile.mkdtemp(prefix='server-benchmark-')
+        media_root = os.path.join(work_dir, 'media')
+        database = os.path.join(work_dir, 'db.sqlite3')
+        stub = StubProviderServer(latency=options['provider_latency']).start()
+        # A file database, so the server processes can open it too.
+        connection.settings_dict['TEST']['NAME'] = database
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        results = {}
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                endpoints = self.prepare(media_root, options['video_bytes'])
+            # Release the file before the servers start writing to it.
+            connection.close()
+            with open(os.path.join(work_dir, 'server_benchmark_settings.py'), 'w') as f:
+                f.write(SETTINGS_MODULE.format(database=database, media_root=media_root, api_base=stub.url))
+
+            for name in servers:
+                results[name] = {}
+                with self.server(name, work_dir, options) as port:
+                    for endpoint, request in endpoints.items():
+                        if options['only'] and options['only'] not in endpoint:
+                            continue
+                        result = self.load(port, request, options['connections'], options['duration'])
+                        results[name][endpoint] = result
+                        self.report(name, endpoint, result)
+        finally:
+            stub.shutdown()
+            stub.server_close()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        with open(options['output'], 'w') as f:
+            json.dump({
+                'created_at': timezone.now().isoformat(),
+                'options': {key: options[key] for key in (
+                    'connections', 'duration', 'workers', 'threads', 'provider_latency', 'video_bytes',
+                )},
+                'servers': results,
+            }, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Wrote results to {options["output"]}'))
+
+    def prepare(self, media_root, video_bytes):
+        generate_dataset(students=200, trainers=5, courses=20, videos_per_course=5, enrollments_per_student=3,
+                         prefix=PREFIX, seed=0)
+        os.makedirs(os.path.join(media_root, 'videos'))
+        with open(os.path.join(media_root, 'videos', f'{PREFIX}.mp4'), 'wb') as f:
+            f.write(os.urandom(video_bytes))
+
+        enrollment = (StudentCourse.objects.annotate(videos=Count('course__videos')).filter(videos__gt=0)
+                      .select_related('student').order_by('id').first())
+        student = enrollment.student
+        video = Video.objects.filter(course_id=enrollment.course_id).order_by('order').first()
+        Video.objects.filter(pk=video.pk).update(video_file=f'videos/{PREFIX}.mp4')
+        paid_course = (Course.objects.exclude(studentcourse__student=student).filter(price__gt=0)
+                       .order_by('id').first())
+        pending = Payment.objects.create(student=student, course=paid_course, amount=paid_course.price,
+                                         stripe_session_id=f'cs_{PREFIX}_pending')
+        # Opening the page creates this row; the timed runs only read it.
+        VideoProgress.objects.get_or_create(student=student, video=video)
+        client = Client()
+        client.force_login(student)
+
+        cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        return {
+            'watch_video': {'path': f'/courses/video/{video.id}/', 'status': 200, 'cookie': cookie},
+            'stream_video': {
+                'path': f'/courses/video/{video.id}/stream/', 'status': 206, 'cookie': cookie,
+                'headers': {'Range': 'bytes=0-1048575'},
+            },
+            'payment_success': {
+                'path': f'/courses/payment/success/?session_id={pending.stripe_session_id}', 'status': 200,
+                'cookie': cookie,
+            },
+            # Each request opens a checkout session with the provider stub.
+            'initiate_payment': {'path': f'/courses/payment/{paid_course.id}/', 'status': 302, 'cookie': cookie},
+        }
+
+    @contextmanager
+    def server(self, name, work_dir, options):
+        """
+        Run ``name`` against the benchmark settings; yields its port once it
+        accepts connections.
+        """
+        module, arguments = SERVERS[name]
+        port = free_port()
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='server_benchmark_settings',
+                   PYTHONPATH=os.pathsep.join([work_dir, str(settings.BASE_DIR)]))
+        log_path = os.path.join(work_dir, f'{name}.log')
+        with open(log_path, 'w') as log:
+            process = subprocess.Popen([sys.executable, '-m', module, *arguments(port, options)],
+                                       cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                    break
+                except OSError:
+                    if process.poll() is not None or time.monotonic() > deadline:
+                        with open(log_path) as log:
+                            raise CommandError(f'{name} did not start:\n{log.read()[-2000:]}')
+                    time.sleep(0.1)
+            yield port
+        finally:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def load(self, port, request, connections, duration):
+        """
+        Keep ``connections`` keep-alive connections busy for ``duration``
+        seconds, after a one-second warm-up. Each connection sends its next
+        request as soon as the previous response has been read.
+        """
+        headers = {'Cookie': request['cookie'], **request.get('headers', {})}
+        lock = threading.Lock()
+        timings = []
+        errors = []
+        start_at = time.monotonic() + 1
+        stop_at = start_at + duration
+
+        def client():
+            conn = None
+            while time.monotonic() < stop_at:
+                if conn is None:
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                started = time.monotonic()
+                try:
+                    conn.request('GET', request['path'], headers=headers)
+                    response = conn.getresponse()
+                    response.read()
+                    ok = response.status == request['status']
+                    if response.will_close:
+                        conn.close()
+                        conn = None
+                except (OSError, http.client.HTTPException) as e:
+                    ok = False
+                    conn.close()
+                    conn = None
+                    response = e
+                elapsed = time.monotonic() - started
+                if started < start_at:
+                    continue
+                with lock:
+                    if ok:
+                        timings.append(elapsed)
+                    else:
+                        errors.append(getattr(response, 'status', type(response).__name__))
+            if conn is not None:
+                conn.close()
+
+        threads = [threading.Thread(target=client) for _ in range(connections)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return {
+            'requests': len(timings),
+            'errors': len(errors),
+            'error_samples': sorted({str(error) for error in errors})[:5],
+            'requests_per_second': round(len(timings) / duration, 1),
+            'p50_ms': round(percentile(timings, 50) * 1000, 2) if timings else None,
+            'p95_ms': round(percentile(timings, 95) * 1000, 2) if timings else None,
+            'p99_ms': round(percentile(timings, 99) * 1000, 2) if timings else None,
+        }
+
+    def report(self, server, endpoint, result):
+        latency = (f'p50 {result["p50_ms"]:>8.2f} ms  p95 {result["p95_ms"]:>8.2f} ms'
+                   if result['requests'] else 'no successful requests')
+        errors = f'  {result["errors"]} errors {result["error_samples"]}' if result['errors'] else ''
+        self.stdout.write(f'{server:<9} {endpoint:<18} {result["requests_per_second"]:>8.1f} req/s  {latency}{errors}')
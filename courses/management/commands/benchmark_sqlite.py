@@ -0,0 +1,175 @@
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from itertools import product
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection
+from django.test.utils import override_settings
+
+from courses.heartbeat import ProgressBuffer
+from courses.models import Course, StudentCourse, Video, VideoProgress
+from courses.synthetic import generate_dataset
+
+# The PRAGMAs and database settings each profile runs with: SQLite's and
+# Django's defaults (rollback journal, deferred transactions, a connection
+# per request) and the ones in settings, with WAL whether or not SQLITE_WAL
+# is set.
+PROFILES = {
+    'default': lambda: ({}, {'OPTIONS': {}, 'CONN_MAX_AGE': 0}),
+    'tuned': lambda: ({'journal_mode': 'wal', 'synchronous': 'normal', **settings.SQLITE_PRAGMAS}, {
+        key: settings.DATABASES['default'][key] for key in ('OPTIONS', 'CONN_MAX_AGE')
+    }),
+}
+# Relative frequency of each kind of request a worker thread makes.
+OPERATIONS = {'read': 60, 'heartbeat': 15, 'complete': 15, 'enroll': 10}
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class Command(BaseCommand):
+    help = ('Compare SQLite profiles under concurrent writes: threads make a mix of dashboard reads, progress '
+            'heartbeat flushes, video completions and enrollments against a throwaway file database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default='default,tuned')
+        parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16])
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per profile and thread count.')
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--courses', type=int, default=20)
+        parser.add_argument('--videos-per-course', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        profiles = [name.strip() for name in options['profiles'].split(',') if name.strip()]
+        for name in profiles:
+            if name not in PROFILES:
+                raise CommandError(f'Unknown profile {name!r}; choose from {", ".join(PROFILES)}')
+
+        self.stdout.write(f'{"profile":8} {"threads":>7} {"req/s":>8} {"errors":>7}  '
+                          f'{"read p50/p99 ms":>16}  {"write p50/p99 ms":>17}')
+        for name in profiles:
+            pragmas, database = PROFILES[name]()
+            # A fresh file per profile: WAL mode is stored in the database.
+            work_dir = tempfile.mkdtemp(prefix='sqlite-benchmark-')
+            connection.settings_dict['TEST']['NAME'] = os.path.join(work_dir, 'db.sqlite3')
+            # Worker threads' connections share this dict.
+            saved = {key: connection.settings_dict[key] for key in database}
+            connection.settings_dict.update(database)
+            try:
+                with override_settings(SQLITE_PRAGMAS=pragmas):
+                    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                    try:
+                        self.populate(options)
+                        for threads in options['threads']:
+                            self.report(name, threads, self.run(threads, options['duration'], options['seed']))
+                    finally:
+                        connection.creation.destroy_test_db(old_name, verbosity=0)
+            finally:
+                connection.settings_dict.update(saved)
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    def populate(self, options):
+        generate_dataset(
+            students=options['students'], trainers=5, courses=options['courses'],
+            videos_per_course=options['videos_per_course'], enrollments_per_student=2, rating_chance=0,
+            prefix='sqlite-bench', seed=options['seed'],
+        )
+        videos = {}
+        for video_id, course_id in Video.objects.values_list('id', 'course_id'):
+            videos.setdefault(course_id, []).append(video_id)
+        enrolled = set(StudentCourse.objects.values_list('student_id', 'course_id'))
+        self.watching = [(student_id, video_id) for student_id, course_id in enrolled
+                         for video_id in videos.get(course_id, [])]
+        student_ids = sorted({student_id for student_id, _ in enrolled})
+        course_ids = list(Course.objects.values_list('id', flat=True))
+        # Enrollments are taken in turn, so every one is new.
+        self.unenrolled = (pair for pair in product(student_ids, course_ids) if pair not in enrolled)
+        self.unenrolled_lock = threading.Lock()
+        # Let the worker threads open the file themselves.
+        connection.close()
+
+    def run(self, threads, duration, seed):
+        timings = {'read': [], 'write': []}
+        errors = []
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+        start = threading.Barrier(threads)
+
+        def work(number):
+            rng = random.Random(seed * 1000 + number)
+            buffer = ProgressBuffer(0, autostart=False)
+            names = list(OPERATIONS)
+            weights = list(OPERATIONS.values())
+            local = {'read': [], 'write': []}
+            failed = []
+            start.wait()
+            try:
+                while time.perf_counter() < deadline:
+                    operation = rng.choices(names, weights)[0]
+                    began = time.perf_counter()
+                    # What Django does on request_started and request_finished.
+                    close_old_connections()
+                    try:
+                        self.request(operation, rng, buffer)
+                    except OperationalError as e:
+                        failed.append(str(e))
+                    else:
+                        local['read' if operation == 'read' else 'write'].append(time.perf_counter() - began)
+                    finally:
+                        close_old_connections()
+            finally:
+                connection.close()
+                with lock:
+                    for key, values in local.items():
+                        timings[key].extend(values)
+                    errors.extend(failed)
+
+        workers = [threading.Thread(target=work, args=(number,)) for number in range(threads)]
+        began = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - began
+        return {'timings': timings, 'errors': errors, 'elapsed': elapsed}
+
+    def request(self, operation, rng, buffer):
+        if operation == 'read':
+            student_id, _ = rng.choice(self.watching)
+            list(StudentCourse.objects.filter(student_id=student_id).select_related('course__category'))
+            list(VideoProgress.objects.filter(student_id=student_id).values_list('video_id', 'completed'))
+        elif operation == 'heartbeat':
+            # One process's flush of the positions its viewers reported.
+            for student_id, video_id in rng.sample(self.watching, 20):
+                buffer.add(student_id, video_id, rng.randrange(1, 3600))
+            buffer.flush()
+        elif operation == 'complete':
+            student_id, video_id = rng.choice(self.watching)
+            VideoProgress.objects.update_or_create(
+                student_id=student_id, video_id=video_id, defaults={'completed': True})
+        else:
+            with self.unenrolled_lock:
+                pair = next(self.unenrolled, None)
+            if pair:
+                StudentCourse.objects.create(student_id=pair[0], course_id=pair[1])
+
+    def report(self, name, threads, result):
+        timings = result['timings']
+        requests = len(timings['read']) + len(timings['write'])
+        self.stdout.write(
+            f'{name:8} {threads:7} {requests / result["elapsed"]:8.1f} {len(result["errors"]):7}  '
+            f'{percentile(timings["read"], 50) * 1000:7.1f}/{percentile(timings["read"], 99) * 1000:<8.1f}  '
+            f'{percentile(timings["write"], 50) * 1000:8.1f}/{percentile(timings["write"], 99) * 1000:<8.1f}'
+        )
+        for message in sorted(set(result['errors'])):
+            self.stdout.write(f'    {result["errors"].count(message)} x {message}')
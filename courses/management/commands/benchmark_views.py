@@ -0,0 +1,375 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, URLResolver
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from courses import fake_payments
+from courses.heartbeat import progress_buffer
+from courses.models import Course, Payment, StudentCourse, Video
+from courses.synthetic import generate_dataset
+from courses.transcoding import MASTER_PLAYLIST, hls_media_dir
+from courses.uploads import start_upload
+from users.geo import load_geo
+from users.models import State
+
+PREFIX = 'bench'
+CONVERTER_RE = re.compile(r'<(?:\w+:)?(\w+)>')
+
+
+def url_patterns():
+    """
+    (key, route, name) for every view routed by new_elearning/urls.py,
+    following the users/ and courses/ includes but not the admin site.
+    """
+    from new_elearning import urls
+
+    def walk(patterns, module, prefix):
+        for pattern in patterns:
+            route = prefix + str(pattern.pattern)
+            if isinstance(pattern, URLResolver):
+                if not route.startswith('admin/'):
+                    yield from walk(pattern.url_patterns, pattern.urlconf_module.__name__.split('.')[0], route)
+            elif isinstance(pattern, URLPattern) and pattern.name:
+                # Unnamed patterns are the DEBUG static/media file helpers.
+                yield f'{module}:{pattern.name}', route, pattern.name
+
+    return list(walk(urls.urlpatterns, 'site', ''))
+
+
+def percentile(values, percent):
+    # Nearest-rank, so the result is always one of the measured values.
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Generate a synthetic dataset in a throwaway test database and benchmark every view through the '
+            'test client, recording query counts, p50/p95 latency and peak memory. Results are written as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--trainers', type=int, default=20)
+        parser.add_argument('--courses', type=int, default=100)
+        parser.add_argument('--videos-per-course', type=int, default=12)
+        parser.add_argument('--enrollments-per-student', type=int, default=4)
+        parser.add_argument('--repeat', type=int, default=20, help='Timed requests per view.')
+        parser.add_argument('--video-bytes', type=int, default=4 * 1024 * 1024)
+        parser.add_argument('--only', help='Only benchmark views whose key contains this text.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='view-benchmark.json')
+        parser.add_argument('--compare', help='A previous JSON result to print differences against.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        media_root = tempfile.mkdtemp(prefix='view-benchmark-')
+        # DEBUG off, as in production: no query logging outside the counted
+        # request, and error responses are recorded instead of logged.
+        setup_test_environment(debug=False)
+        request_logger = logging.getLogger('django.request')
+        request_logger_level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(MEDIA_ROOT=media_root, HLS_AUTO_PACKAGE=False, PAYMENT_PROVIDER='fake',
+                                   FAKE_PAYMENT_WEBHOOK_DELAY=None, REPLICA_DATABASE=None,
+                                   METRICS_TOKEN='benchmark', JOBS_IMMEDIATE=False):
+                cache.clear()
+                dataset = generate_dataset(
+                    students=options['students'],
+                    trainers=options['trainers'],
+                    courses=options['courses'],
+                    videos_per_course=options['videos_per_course'],
+                    enrollments_per_student=options['enrollments_per_student'],
+                    prefix=PREFIX,
+                    seed=options['seed'],
+                )
+                fixtures = self.prepare(media_root, options['video_bytes'])
+                cases = self.cases(fixtures)
+
+                patterns = url_patterns()
+                missing = [key for key, _, _ in patterns if key not in cases]
+                if missing:
+                    raise CommandError(f'No benchmark case for: {", ".join(missing)}')
+
+                results = {}
+                for key, route, _ in patterns:
+                    if options['only'] and options['only'] not in key:
+                        continue
+                    results[key] = self.measure(route, cases[key], fixtures, options['repeat'])
+                    self.report(key, results[key], (baseline or {}).get('views', {}).get(key))
+        finally:
+            progress_buffer.flush()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            request_logger.setLevel(request_logger_level)
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        with open(options['output'], 'w') as f:
+            json.dump({
+                'created_at': timezone.now().isoformat(),
+                'commit': self.commit(),
+                'repeat': options['repeat'],
+                'dataset': dataset,
+                'views': results,
+            }, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} results to {options["output"]}'))
+
+    def prepare(self, media_root, video_bytes):
+        CustomUser = get_user_model()
+        os.makedirs(os.path.join(media_root, 'videos'))
+        with open(os.path.join(media_root, 'videos', f'{PREFIX}.mp4'), 'wb') as f:
+            f.write(os.urandom(video_bytes))
+
+        # The busiest trainer, and a student enrolled in one of their courses
+        # that has videos, stand in for typical heavy users.
+        trainer = (CustomUser.objects.filter(user_type='trainer').annotate(courses=Count('course'))
+                   .order_by('-courses', 'id').first())
+        enrollment = (StudentCourse.objects.filter(course__trainer=trainer, course__videos__isnull=False)
+                      .select_related('student', 'course').order_by('id').first())
+        video = Video.objects.filter(course=enrollment.course).order_by('order').first()
+        other_course = Course.objects.exclude(studentcourse__student=enrollment.student).order_by('id').first()
+        paid_course = (Course.objects.exclude(studentcourse__student=enrollment.student)
+                       .filter(price__gt=0).order_by('id').first())
+
+        hls_dir = os.path.join(media_root, hls_media_dir(video))
+        os.makedirs(hls_dir)
+        with open(os.path.join(hls_dir, MASTER_PLAYLIST), 'w') as f:
+            f.write('#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-STREAM-INF:BANDWIDTH=896000,NAME="360p"\n360p.m3u8\n')
+        Video.objects.filter(pk=video.pk).update(hls_status='ready')
+
+        # A checkout still waiting for its webhook, and a confirmed one whose
+        # event is replayed against the webhook.
+        pending_payment = Payment.objects.create(
+            student=enrollment.student, course=paid_course, amount=paid_course.price,
+            stripe_session_id=f'cs_fake_{PREFIX}_pending',
+        )
+        completed_payment = Payment.objects.create(
+            student=enrollment.student, course=enrollment.course, amount=enrollment.course.price,
+            stripe_session_id=f'cs_fake_{PREFIX}_completed', payment_status='completed',
+        )
+
+        # A one-chunk upload whose chunk is re-sent on every request, and
+        # one with nothing received, which cannot be finished.
+        chunk = os.urandom(min(video_bytes, settings.VIDEO_UPLOAD_CHUNK_SIZE))
+        upload = start_upload(enrollment.course, trainer, 'bench.mp4', len(chunk))
+        empty_upload = start_upload(enrollment.course, trainer, 'bench.mp4', len(chunk))
+
+        load_geo([('Benchland', f'Bench state {i}', f'Bench district {i}-{j}') for i in range(30) for j in range(40)])
+        state = State.objects.filter(country__name='Benchland').order_by('id').first()
+
+        return {
+            'upload': upload,
+            'empty_upload': empty_upload,
+            'chunk': chunk,
+            'student': enrollment.student,
+            'trainer': trainer,
+            'manager': CustomUser.objects.get(username=f'{PREFIX}-manager'),
+            'course': enrollment.course,
+            'other_course': other_course,
+            'video': video,
+            'paid_course': paid_course,
+            'pending_payment': pending_payment,
+            'completed_payment': completed_payment,
+            'state': state,
+        }
+
+    def cases(self, fixtures):
+        """
+        How to request each view: the user to log in as, the method, the URL
+        arguments and any request data or headers.
+        """
+        student, trainer, course, video = fixtures['student'], fixtures['trainer'], fixtures['course'], fixtures['video']
+        uid = urlsafe_base64_encode(force_bytes(student.pk))
+        pending_session = fixtures['pending_payment'].stripe_session_id
+        webhook_payload = json.dumps(fake_payments.checkout_event(fixtures['completed_payment']))
+        return {
+            'site:home': {},
+            'site:about': {},
+            'site:contact': {},
+            'site:dashboard': {'user': 'manager'},
+            'site:trainer_dashboard': {'user': 'trainer'},
+            'site:manager_dashboard': {'user': 'manager'},
+            'site:metrics': {'headers': lambda: {'HTTP_AUTHORIZATION': f'Bearer {settings.METRICS_TOKEN}'}},
+            'site:profile': {'user': 'student'},
+            'site:update_profile': {'user': 'student'},
+            'site:login': {},
+            'site:logout': {'user': 'student', 'method': 'post'},
+            'site:password_reset': {},
+            'site:password_reset_done': {},
+            'site:password_reset_confirm': {
+                'kwargs': {'uidb64': uid, 'token': default_token_generator.make_token(student)},
+            },
+            'site:password_reset_complete': {},
+            'users:register': {},
+            'users:profile': {'user': 'student'},
+            'users:update_profile': {'user': 'student'},
+            'users:get_states': {'query': {'country_id': fixtures['state'].country_id}},
+            'users:get_districts': {'query': {'state_id': fixtures['state'].id}},
+            'courses:course_list': {'user': 'student'},
+            'courses:search_suggest': {'user': 'student', 'query': {'q': course.title[:4]}},
+            'courses:course_detail': {'user': 'student', 'kwargs': {'course_id': course.id}},
+            # Already enrolled: the local redirect path.
+            'courses:enroll_course': {'user': 'student', 'kwargs': {'course_id': course.id}},
+            'courses:watch_video': {'user': 'student', 'kwargs': {'video_id': video.id}},
+            'courses:stream_video': {
+                'user': 'student', 'kwargs': {'video_id': video.id}, 'headers': {'HTTP_RANGE': 'bytes=0-1048575'},
+            },
+            'courses:hls_file': {'user': 'student', 'kwargs': {'video_id': video.id, 'name': MASTER_PLAYLIST}},
+            'courses:rate_video': {
+                'user': 'student', 'method': 'post', 'kwargs': {'video_id': video.id},
+                'data': {'rating': 4, 'comment': 'Benchmark'},
+            },
+            'courses:progress_heartbeat': {
+                'user': 'student', 'method': 'post', 'content_type': 'application/json',
+                'data': json.dumps({'updates': [{'video': video.id, 'position': 30}]}),
+            },
+            'courses:rate_trainer': {
+                'user': 'student', 'method': 'post', 'kwargs': {'trainer_id': trainer.id},
+                'data': {'rating': 5, 'comment': 'Benchmark'},
+            },
+            'courses:trainer_details': {'user': 'student', 'kwargs': {'trainer_id': trainer.id}},
+            'courses:trainer_dashboard': {'user': 'trainer'},
+            'courses:course_students': {'user': 'trainer', 'kwargs': {'course_id': course.id}},
+            'courses:add_video': {'user': 'trainer', 'kwargs': {'course_id': course.id}},
+            'courses:start_video_upload': {
+                'user': 'trainer', 'method': 'post', 'kwargs': {'course_id': course.id},
+                'content_type': 'application/json', 'data': json.dumps({'filename': 'bench.mp4', 'size': 1024}),
+            },
+            'courses:video_upload': {
+                'user': 'trainer', 'method': 'put', 'kwargs': {'upload_id': fixtures['upload'].id},
+                'content_type': 'application/octet-stream', 'data': fixtures['chunk'],
+                'headers': {
+                    'HTTP_CONTENT_RANGE': f'bytes 0-{len(fixtures["chunk"]) - 1}/{len(fixtures["chunk"])}',
+                    'HTTP_X_CHUNK_SHA256': hashlib.sha256(fixtures['chunk']).hexdigest(),
+                },
+            },
+            # Rejected for missing chunks: finishing for real works only once.
+            'courses:complete_video_upload': {
+                'user': 'trainer', 'method': 'post', 'kwargs': {'upload_id': fixtures['empty_upload'].id},
+                'content_type': 'application/json', 'data': json.dumps({'title': 'Bench', 'duration': 1}),
+            },
+            'courses:manage_payments': {'user': 'manager'},
+            'courses:export_data': {'user': 'manager', 'kwargs': {'name': 'payments'}, 'query': {'format': 'csv'}},
+            'courses:manage_courses': {'user': 'manager'},
+            'courses:manage_trainers': {'user': 'manager'},
+            'courses:assign_trainer': {'user': 'manager', 'kwargs': {'course_id': fixtures['other_course'].id}},
+            'courses:student_feedbacks': {'user': 'manager'},
+            'courses:analyze_progress': {'user': 'manager'},
+            # Checkout against the fake provider, which opens a new pending
+            # payment per request.
+            'courses:initiate_payment': {'user': 'student', 'kwargs': {'course_id': fixtures['paid_course'].id}},
+            'courses:payment_success': {'user': 'student', 'query': {'session_id': pending_session}},
+            'courses:payment_cancel': {'user': 'student', 'query': {'course_id': course.id}},
+            # A replayed event for a confirmed payment, signed per request so
+            # the timestamp stays inside the tolerance.
+            'courses:payment_webhook': {
+                'method': 'post', 'content_type': 'application/json', 'data': webhook_payload,
+                'headers': lambda: {'HTTP_STRIPE_SIGNATURE': fake_payments.sign(webhook_payload)},
+            },
+            'courses:fake_checkout': {'user': 'student', 'kwargs': {'session_id': pending_session}},
+        }
+
+    def request(self, client, path, case):
+        method = case.get('method', 'get')
+        headers = case.get('headers', {})
+        if callable(headers):
+            headers = headers()
+        if method == 'get':
+            response = client.get(path, case.get('query'), **headers)
+        elif 'content_type' in case:
+            response = getattr(client, method)(path, case['data'], content_type=case['content_type'], **headers)
+        else:
+            response = client.post(path, case.get('data'), **headers)
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        return response, size
+
+    def measure(self, route, case, fixtures, repeat):
+        path = '/' + CONVERTER_RE.sub(lambda match: str(case.get('kwargs', {})[match.group(1)]), route)
+        client = Client(raise_request_exception=False)
+        user = fixtures.get(case.get('user'))
+
+        def login():
+            if user is not None:
+                client.force_login(user)
+
+        # The first request warms caches; queries are counted on the second.
+        login()
+        self.request(client, path, case)
+        login()
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            response, size = self.request(client, path, case)
+        # Read now; later requests clear the connection's query log.
+        query_count = len(queries)
+
+        timings = []
+        for _ in range(repeat):
+            login()
+            start = time.perf_counter()
+            self.request(client, path, case)
+            timings.append(time.perf_counter() - start)
+
+        login()
+        tracemalloc.start()
+        try:
+            self.request(client, path, case)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'path': path,
+            'method': case.get('method', 'get').upper(),
+            'user': case.get('user', 'anonymous'),
+            'status': response.status_code,
+            'queries': query_count,
+            'response_bytes': size,
+            'p50_ms': round(percentile(timings, 50) * 1000, 2),
+            'p95_ms': round(percentile(timings, 95) * 1000, 2),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def report(self, key, result, previous):
+        line = (f'{key:<36} {result["status"]:>3}  {result["queries"]:>4} queries  '
+                f'p50 {result["p50_ms"]:>8.2f} ms  p95 {result["p95_ms"]:>8.2f} ms  '
+                f'peak {result["peak_memory_kb"]:>9.1f} KiB')
+        if previous:
+            line += (f'  | queries {result["queries"] - previous["queries"]:+d}, '
+                     f'p50 {result["p50_ms"] - previous["p50_ms"]:+.2f} ms')
+        self.stdout.write(line)
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,50 @@
+import sys
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from courses.exports import EXPORTS, FORMATS, export_chunks
+
+
+class Command(BaseCommand):
+    help = ('Stream payments, enrollments, video progress or ratings as CSV or NDJSON to a file or standard '
+            'output, in constant memory.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=EXPORTS)
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--output', default='-', help='File to write; - (the default) for standard output.')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--date-from', help='First day to include, YYYY-MM-DD.')
+        parser.add_argument('--date-to', help='Last day to include, YYYY-MM-DD.')
+        parser.add_argument('--course', type=int)
+
+    def handle(self, *args, **options):
+        filters = {'course_id': options['course']}
+        # Whole days in the current time zone; the end is exclusive.
+        for option, days in (('date_from', 0), ('date_to', 1)):
+            if options[option]:
+                try:
+                    day = parse_date(options[option])
+                except ValueError:
+                    day = None
+                if day is None:
+                    raise CommandError(f'--{option.replace("_", "-")} must be a date, YYYY-MM-DD.')
+                filters[option] = timezone.make_aware(datetime.combine(day + timedelta(days=days), datetime.min.time()))
+
+        start = time.perf_counter()
+        written = 0
+        out = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in export_chunks(options['dataset'], options['format'], gzip=options['gzip'], **filters):
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        if options['output'] != '-':
+            self.stdout.write(self.style.SUCCESS(
+                f'Wrote {written} bytes to {options["output"]} in {time.perf_counter() - start:.1f}s.'))
@@ -0,0 +1,49 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.synthetic import generate_dataset
+
+
+class Command(BaseCommand):
+    help = ('Bulk-generate a synthetic dataset of students, trainers, courses, videos, enrollments, '
+            'progress, ratings and payments in the configured database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1000)
+        parser.add_argument('--trainers', type=int, default=20)
+        parser.add_argument('--courses', type=int, default=50)
+        parser.add_argument('--videos-per-course', type=int, default=10)
+        parser.add_argument('--enrollments-per-student', type=int, default=3)
+        parser.add_argument('--rating-chance', type=float, default=0.3,
+                            help='Chance that a watched video is rated.')
+        parser.add_argument('--payment-days', type=int, default=365,
+                            help='Spread payment dates over this many past days.')
+        parser.add_argument('--prefix', default='synthetic', help='Prefix for generated usernames and titles.')
+        parser.add_argument('--password', help='Password for every generated user; unusable if omitted.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if get_user_model().objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f'Users prefixed "{prefix}-" already exist; pick another --prefix.')
+
+        start = time.perf_counter()
+        counts = generate_dataset(
+            students=options['students'],
+            trainers=options['trainers'],
+            courses=options['courses'],
+            videos_per_course=options['videos_per_course'],
+            enrollments_per_student=options['enrollments_per_student'],
+            rating_chance=options['rating_chance'],
+            payment_days=options['payment_days'],
+            prefix=prefix,
+            password=options['password'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+        )
+        for model, count in counts.items():
+            self.stdout.write(f'  {model:<12} {count}')
+        self.stdout.write(self.style.SUCCESS(f'Generated dataset in {time.perf_counter() - start:.1f}s.'))
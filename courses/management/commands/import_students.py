@@ -0,0 +1,94 @@
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.imports import StudentImport, read_csv, read_ndjson
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+
+class Command(BaseCommand):
+    help = ('Create students and enroll them from a CSV or NDJSON file with username, email and optional '
+            'password (or password_hash), first_name, last_name, phone and courses (course ids) fields. '
+            'Students without a password get an unusable one and can set theirs through password reset. '
+            'Progress is checkpointed after every batch, so an interrupted import resumes where it stopped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file, or - for standard input.')
+        parser.add_argument('--format', choices=READERS, help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--processes', type=int, help='Password hashing processes; defaults to one per CPU.')
+        parser.add_argument('--checkpoint', help='Defaults to <path>.checkpoint.')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start over.')
+        parser.add_argument('--errors', help='Also write every rejected record to this CSV file.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson'
+                                    if path.endswith(('.ndjson', '.jsonl')) else None)
+        if fmt is None:
+            raise CommandError('Cannot tell the format from the file name; pass --format.')
+        checkpoint = options['checkpoint'] or (None if path == '-' else f'{path}.checkpoint')
+        done = 0
+        if checkpoint and os.path.exists(checkpoint) and not options['restart']:
+            with open(checkpoint) as f:
+                done = json.load(f)['record']
+            self.stdout.write(f'Resuming after record {done}.')
+
+        f = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+        error_file = open(options['errors'], 'a' if done else 'w', newline='') if options['errors'] else None
+        self.error_file = error_file
+        self.error_writer = csv.writer(error_file) if error_file else None
+        if self.error_writer and not done:
+            self.error_writer.writerow(['record', 'error'])
+        self.reported_up_to = done
+        start = time.perf_counter()
+        importer = StudentImport(batch_size=options['batch_size'], processes=options['processes'])
+        try:
+            records = itertools.dropwhile(lambda item: item[0] <= done, READERS[fmt](f))
+            importer.run(records, on_batch=lambda number: self.batch_done(checkpoint, number, importer, start))
+            self.report_errors(importer, float('inf'))
+        finally:
+            if f is not sys.stdin:
+                f.close()
+            if error_file:
+                error_file.close()
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{importer.users_created} students created, {importer.users_existing} already existed, '
+            f'{importer.enrollments_created} enrollments created, {len(importer.errors)} records rejected '
+            f'in {time.perf_counter() - start:.1f}s.'
+        ))
+
+    def batch_done(self, checkpoint, number, importer, start):
+        # Errors first: once the checkpoint moves past a record it is never
+        # looked at again.
+        self.report_errors(importer, number)
+        if checkpoint:
+            # Written aside and renamed, so a crash never leaves half a file.
+            with open(f'{checkpoint}.tmp', 'w') as f:
+                json.dump({'record': number}, f)
+            os.replace(f'{checkpoint}.tmp', checkpoint)
+        self.stdout.write(f'  record {number}: {importer.users_created} students created, '
+                          f'{time.perf_counter() - start:.0f}s')
+
+    def report_errors(self, importer, up_to):
+        """
+        Report the rejected records after the last ones reported, up to and
+        including record ``up_to``.
+        """
+        errors = sorted(error for error in importer.errors if self.reported_up_to < error[0] <= up_to)
+        for number, message in errors:
+            self.stderr.write(f'Record {number}: {message}')
+            if self.error_writer:
+                self.error_writer.writerow([number, message])
+        if self.error_file:
+            self.error_file.flush()
+        self.reported_up_to = up_to
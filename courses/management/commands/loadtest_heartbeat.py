@@ -0,0 +1,93 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from courses.heartbeat import ProgressBuffer
+from courses.models import Course, CourseCategory, StudentCourse, Video, VideoProgress
+
+
+class Command(BaseCommand):
+    help = ('Simulate concurrent viewers sending progress heartbeats and compare the database '
+            'writes of the coalescing buffer with one write per heartbeat.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--viewers', type=int, default=20000)
+        parser.add_argument('--duration', type=int, default=60, help='Simulated seconds.')
+        parser.add_argument('--heartbeat-interval', type=int, default=15)
+        parser.add_argument('--flush-interval', type=int, default=10)
+        parser.add_argument('--videos', type=int, default=50)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            viewers = self.populate(options['viewers'], options['videos'])
+            self.run(viewers, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def populate(self, viewer_count, video_count):
+        CustomUser = get_user_model()
+        trainer = CustomUser.objects.create(username='load-trainer', user_type='trainer')
+        course = Course.objects.create(
+            title='Load test', description='', category=CourseCategory.objects.create(name='Load test'),
+            trainer=trainer, price=0, duration=1,
+        )
+        Video.objects.bulk_create(
+            Video(course=course, title=f'Video {i}', video_file='videos/load.mp4', duration=60, order=i)
+            for i in range(video_count)
+        )
+        videos = list(Video.objects.values_list('id', flat=True))
+
+        CustomUser.objects.bulk_create(
+            (CustomUser(username=f'load-student-{i}', password='!', user_type='student') for i in range(viewer_count)),
+            batch_size=5000,
+        )
+        students = list(CustomUser.objects.filter(user_type='student').values_list('id', flat=True))
+        StudentCourse.objects.bulk_create(
+            (StudentCourse(student_id=student_id, course=course) for student_id in students), batch_size=5000
+        )
+
+        # watch_video creates the progress row when the page is opened.
+        viewers = [(student_id, random.choice(videos)) for student_id in students]
+        VideoProgress.objects.bulk_create(
+            (VideoProgress(student_id=student_id, video_id=video_id) for student_id, video_id in viewers),
+            batch_size=5000,
+        )
+        return viewers
+
+    def run(self, viewers, options):
+        duration = options['duration']
+        heartbeat_interval = options['heartbeat_interval']
+        flush_interval = options['flush_interval']
+        buffer = ProgressBuffer(flush_interval, autostart=False)
+        offsets = [random.randrange(heartbeat_interval) for _ in viewers]
+
+        heartbeats = 0
+        flush_times = []
+        with CaptureQueriesContext(connection) as queries:
+            for second in range(1, duration + 1):
+                for (student_id, video_id), offset in zip(viewers, offsets):
+                    if (second + offset) % heartbeat_interval == 0:
+                        buffer.add(student_id, video_id, second)
+                        heartbeats += 1
+                if second % flush_interval == 0 or second == duration:
+                    start = time.perf_counter()
+                    buffer.flush()
+                    flush_times.append(time.perf_counter() - start)
+
+        statements = [query['sql'].lstrip().split(' ', 1)[0].upper() for query in queries]
+        writes = sum(1 for statement in statements if statement in ('UPDATE', 'INSERT'))
+        reads = sum(1 for statement in statements if statement == 'SELECT')
+
+        self.stdout.write(f'{len(viewers)} viewers, {duration}s simulated, '
+                          f'heartbeat every {heartbeat_interval}s, flush every {flush_interval}s')
+        self.stdout.write(f'  heartbeats received:        {heartbeats} ({heartbeats / duration:.0f}/s)')
+        self.stdout.write(f'  write statements per-beat:  {heartbeats} ({heartbeats / duration:.0f}/s)')
+        self.stdout.write(f'  write statements coalesced: {writes} ({writes / duration:.1f}/s), {reads} selects')
+        self.stdout.write(f'  write amplification cut:    {heartbeats / max(writes, 1):.0f}x')
+        self.stdout.write(f'  flush latency:              max {max(flush_times) * 1000:.0f} ms, '
+                          f'mean {sum(flush_times) / len(flush_times) * 1000:.0f} ms')
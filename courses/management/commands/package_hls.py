@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import Video
+from courses.transcoding import package_hls
+
+
+class Command(BaseCommand):
+    help = 'Package uploaded videos into HLS renditions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('video_ids', nargs='*', type=int,
+                            help='Videos to (re)package. Defaults to every pending or failed video.')
+
+    def handle(self, *args, **options):
+        if options['video_ids']:
+            videos = Video.objects.filter(id__in=options['video_ids'])
+        else:
+            videos = Video.objects.filter(hls_status__in=['none', 'pending', 'failed']).exclude(video_file='')
+
+        for video in videos:
+            if package_hls(video):
+                self.stdout.write(self.style.SUCCESS(f'Packaged video {video.id}'))
+            else:
+                video.refresh_from_db()
+                self.stdout.write(self.style.ERROR(f'Video {video.id} failed: {video.hls_error}'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import Video
+from courses.probing import probe_video
+
+
+class Command(BaseCommand):
+    help = 'Read duration, resolution, bitrate and codecs from the files of existing videos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Also re-probe videos that already have media info.')
+
+    def handle(self, *args, **options):
+        videos = Video.objects.exclude(video_file='')
+        if not options['all']:
+            videos = videos.filter(duration_seconds__isnull=True)
+
+        probed = failed = 0
+        for video in videos.iterator():
+            try:
+                ok = probe_video(video)
+            except FileNotFoundError:
+                ok = False
+            if ok:
+                probed += 1
+            else:
+                failed += 1
+                self.stderr.write(f'Could not probe video {video.pk}: {video.video_file.name}')
+        self.stdout.write(self.style.SUCCESS(f'Probed {probed} videos, {failed} not recognised.'))
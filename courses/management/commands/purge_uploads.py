@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from courses.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete resumable video uploads with no chunk for VIDEO_UPLOAD_EXPIRY seconds, and their partial files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, help='Seconds; defaults to VIDEO_UPLOAD_EXPIRY.')
+
+    def handle(self, *args, **options):
+        count = purge_stale_uploads(options['max_age'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {count} unfinished uploads.'))
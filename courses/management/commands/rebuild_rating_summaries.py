@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from courses.ratings import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute the rating summaries from the Rating table.'
+
+    def handle(self, *args, **options):
+        count = rebuild_summaries()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} rating summaries.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from courses.revenue import rebuild_revenue
+
+
+class Command(BaseCommand):
+    help = 'Backfill or repair the daily revenue rollups from the Payment table.'
+
+    def handle(self, *args, **options):
+        count = rebuild_revenue()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} daily revenue rows.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from courses.search import search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the course and lecture search index from the database.'
+
+    def handle(self, *args, **options):
+        search_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS('Rebuilt the search index.'))
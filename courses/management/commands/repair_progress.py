@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import StudentCourse
+from courses.progress import refresh_progress
+
+
+class Command(BaseCommand):
+    help = 'Recount the denormalized progress counters on StudentCourse.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses',
+                            help='Only repair enrollments of this course id (repeatable).')
+
+    def handle(self, *args, **options):
+        enrollments = StudentCourse.objects.all()
+        if options['courses']:
+            enrollments = enrollments.filter(course_id__in=options['courses'])
+
+        refresh_progress(enrollments)
+        self.stdout.write(self.style.SUCCESS(f'Repaired progress for {enrollments.count()} enrollments.'))
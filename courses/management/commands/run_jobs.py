@@ -0,0 +1,72 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from courses.jobs import work
+
+
+def _work_threads(queues, stop, threads, poll_interval, burst):
+    workers = [
+        threading.Thread(target=work, args=(queues, stop, poll_interval, burst), name=f'jobs-{i}')
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def _work_process(queues, stop, threads, poll_interval, burst):
+    # Ctrl-C reaches every process in the group; let the parent decide.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _work_threads(queues, stop, threads, poll_interval, burst)
+
+
+class Command(BaseCommand):
+    help = ('Run queued background jobs (see courses/jobs.py) until interrupted. Mail goes on the "mail" '
+            'queue and HLS packaging on "video"; by default every queue is worked.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='append', dest='queues',
+                            help='Queue to take jobs from; repeat for several. Defaults to every queue.')
+        parser.add_argument('--threads', type=int, default=1, help='Worker threads per process.')
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--poll-interval', type=float, default=1, help='Seconds to wait when no job is due.')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due.')
+
+    def handle(self, *args, **options):
+        queues = options['queues']
+        worker_args = (options['threads'], options['poll_interval'], options['burst'])
+        self.stdout.write(f"Running jobs from {', '.join(queues) if queues else 'every queue'} with "
+                          f"{options['processes']} process(es) of {options['threads']} thread(s)")
+
+        if options['processes'] == 1:
+            stop = threading.Event()
+            signal.signal(signal.SIGTERM, lambda *_: stop.set())
+            try:
+                _work_threads(queues, stop, *worker_args)
+            except KeyboardInterrupt:
+                stop.set()
+            return
+
+        # Forked children must not share the parent's database connections.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        processes = [
+            context.Process(target=_work_process, args=(queues, stop, *worker_args), name=f'jobs-process-{i}')
+            for i in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for process in processes:
+                process.join()
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from courses.payment_stub import StubProviderServer
+
+
+class Command(BaseCommand):
+    help = ('Serve a local stand-in for the payment provider API with optional latency and failures. '
+            'Set PAYMENT_GATEWAY_API_BASE to the printed URL.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=12111)
+        parser.add_argument('--latency', type=float, default=0, help='Seconds added to every response.')
+        parser.add_argument('--failure-rate', type=float, default=0, help='Fraction of requests that fail.')
+        parser.add_argument('--failure-status', type=int, default=500)
+
+    def handle(self, *args, **options):
+        server = StubProviderServer(
+            options['host'], options['port'], latency=options['latency'], failure_rate=options['failure_rate'],
+            failure_status=options['failure_status'], verbose=options['verbosity'] > 1,
+        )
+        self.stdout.write(f'Payment provider stub listening on {server.url}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+
+from courses.replicas import beat, snapshot_replica
+
+
+class Command(BaseCommand):
+    help = ('Copy the primary SQLite database into the replica that reporting views read from (see '
+            'courses/replicas.py). For a replica that is not a SQLite file, only stamp the heartbeat that '
+            'replication carries over.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', help='Replica alias; defaults to REPLICA_DATABASE.')
+        parser.add_argument('--interval', type=float,
+                            help='Repeat every this many seconds until interrupted, rather than once.')
+
+    def handle(self, *args, **options):
+        alias = options['database'] or settings.REPLICA_DATABASE
+        if not alias or alias not in connections or alias == DEFAULT_DB_ALIAS:
+            raise CommandError('No replica configured; set REPLICA_DATABASE or pass --database.')
+        copy = connections[DEFAULT_DB_ALIAS].vendor == 'sqlite' and connections[alias].vendor == 'sqlite'
+
+        while True:
+            start = time.perf_counter()
+            try:
+                beat_at = snapshot_replica(alias) if copy else beat()
+            except ValueError as e:
+                raise CommandError(e)
+            action = f'Copied the database to {alias}' if copy else 'Stamped the replica heartbeat'
+            self.stdout.write(self.style.SUCCESS(
+                f'{action} at {beat_at:%Y-%m-%d %H:%M:%S} in {time.perf_counter() - start:.2f}s.'))
+            if not options['interval']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,276 @@
+import bisect
+import contextvars
+import re
+import threading
+import time
+from collections import Counter
+
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BYTES_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+
+HISTOGRAMS = {
+    'request_seconds': SECONDS_BUCKETS,
+    'sql_queries': QUERY_BUCKETS,
+    'sql_seconds': SECONDS_BUCKETS,
+    'template_seconds': SECONDS_BUCKETS,
+    'response_bytes': BYTES_BUCKETS,
+}
+PROMETHEUS_NAMES = {
+    'request_seconds': ('http_request_duration_seconds', 'Time to produce the response.'),
+    'sql_queries': ('db_queries_per_request', 'SQL queries executed per request.'),
+    'sql_seconds': ('db_query_duration_seconds', 'Total SQL time per request.'),
+    'template_seconds': ('template_render_seconds', 'Total top-level template render time per request.'),
+    'response_bytes': ('http_response_size_bytes', 'Response body size.'),
+}
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class Histogram:
+    """
+    Cumulative bucket counts in the Prometheus style, so observing a value
+    costs one bisect and memory stays constant however many requests come in.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        Estimate a quantile by linear interpolation inside its bucket.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i else 0
+                if i == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    def __init__(self, max_signatures=20):
+        self.max_signatures = max_signatures
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.duplicate_requests = Counter()
+            self.budget_exceeded = Counter()
+            self.duplicate_signatures = {}
+            self.provider_histograms = {}
+            self.provider_calls = Counter()
+            self.fragment_lookups = Counter()
+
+    def record(self, view, sample, duplicates, over_budget):
+        with self._lock:
+            for name, value in sample.items():
+                key = (name, view)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(HISTOGRAMS[name])
+                self.histograms[key].observe(value)
+            if duplicates:
+                self.duplicate_requests[view] += 1
+                signatures = self.duplicate_signatures.setdefault(view, Counter())
+                for sql, repeats in duplicates.items():
+                    if sql in signatures or len(signatures) < self.max_signatures:
+                        signatures[sql] = max(signatures[sql], repeats)
+            if over_budget:
+                self.budget_exceeded[view] += 1
+
+    def record_provider_call(self, operation, seconds, outcome):
+        """
+        One attempt at a payment provider API call. The outcome is 'ok',
+        'retry', 'error' or 'rejected' (circuit open, nothing sent).
+        """
+        with self._lock:
+            if outcome != 'rejected':
+                if operation not in self.provider_histograms:
+                    self.provider_histograms[operation] = Histogram(SECONDS_BUCKETS)
+                self.provider_histograms[operation].observe(seconds)
+            self.provider_calls[(operation, outcome)] += 1
+
+    def record_fragment(self, name, hit):
+        with self._lock:
+            self.fragment_lookups[(name, 'hit' if hit else 'miss')] += 1
+
+    def fragment_snapshot(self):
+        """Hits, misses and hit ratio of each cached template fragment."""
+        with self._lock:
+            fragments = {}
+            for (name, outcome), value in self.fragment_lookups.items():
+                fragments.setdefault(name, {'hit': 0, 'miss': 0})[outcome] = value
+            return {
+                name: {'hits': counts['hit'], 'misses': counts['miss'],
+                       'hit_ratio': counts['hit'] / (counts['hit'] + counts['miss'])}
+                for name, counts in fragments.items()
+            }
+
+    def provider_snapshot(self):
+        with self._lock:
+            operations = {}
+            for (operation, outcome), value in self.provider_calls.items():
+                operations.setdefault(operation, {'calls': {}})['calls'][outcome] = value
+            for operation, histogram in self.provider_histograms.items():
+                operations.setdefault(operation, {'calls': {}})['seconds'] = {
+                    'mean': histogram.sum / histogram.count,
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95),
+                }
+            return operations
+
+    def snapshot(self):
+        with self._lock:
+            views = {}
+            for (name, view), histogram in self.histograms.items():
+                stats = views.setdefault(view, {'requests': 0})
+                if name == 'request_seconds':
+                    stats['requests'] = histogram.count
+                if not histogram.count:
+                    continue
+                stats[name] = {
+                    'mean': histogram.sum / histogram.count,
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95),
+                }
+            for view, stats in views.items():
+                stats['duplicate_query_requests'] = self.duplicate_requests[view]
+                stats['budget_exceeded'] = self.budget_exceeded[view]
+                stats['duplicate_queries'] = dict(self.duplicate_signatures.get(view, {}))
+            return views
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            for name, (metric, help_text) in PROMETHEUS_NAMES.items():
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+                for (histogram_name, view), histogram in sorted(self.histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += bucket_count
+                        lines.append(f'{metric}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_sum{{view="{view}"}} {histogram.sum}')
+                    lines.append(f'{metric}_count{{view="{view}"}} {histogram.count}')
+            for metric, help_text, counter in [
+                ('db_duplicate_query_requests_total', 'Requests that repeated one SQL statement.',
+                 self.duplicate_requests),
+                ('db_query_budget_exceeded_total', 'Requests over their view\'s query budget.',
+                 self.budget_exceeded),
+            ]:
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+                lines += [f'{metric}{{view="{view}"}} {value}' for view, value in sorted(counter.items())]
+
+            metric = 'payment_provider_request_seconds'
+            lines += [f'# HELP {metric} Time per payment provider API attempt.', f'# TYPE {metric} histogram']
+            for operation, histogram in sorted(self.provider_histograms.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{metric}_bucket{{operation="{operation}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{operation="{operation}"}} {histogram.sum}')
+                lines.append(f'{metric}_count{{operation="{operation}"}} {histogram.count}')
+            metric = 'payment_provider_calls_total'
+            lines += [f'# HELP {metric} Payment provider API attempts by outcome.', f'# TYPE {metric} counter']
+            lines += [f'{metric}{{operation="{operation}",outcome="{outcome}"}} {value}'
+                      for (operation, outcome), value in sorted(self.provider_calls.items())]
+            metric = 'template_fragment_cache_lookups_total'
+            lines += [f'# HELP {metric} Cached template fragment lookups by outcome.', f'# TYPE {metric} counter']
+            lines += [f'{metric}{{fragment="{name}",outcome="{outcome}"}} {value}'
+                      for (name, outcome), value in sorted(self.fragment_lookups.items())]
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0
+        self.template_seconds = 0
+        self.signatures = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - start
+            self.queries += 1
+            self.signatures[IN_LIST_RE.sub('IN (...)', sql)] += 1
+
+    def duplicates(self, threshold):
+        return {sql: repeats for sql, repeats in self.signatures.items() if repeats >= threshold}
+
+
+current_request = contextvars.ContextVar('request_metrics', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    """
+    A connection execute wrapper that adds each query to the current
+    request's metrics. It follows the request through a context variable,
+    so queries an async view runs on another thread are counted too.
+    """
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_query_counter():
+    # Connections are per thread; each one gets the wrapper once.
+    for connection in connections.all():
+        if count_queries not in connection.execute_wrappers:
+            connection.execute_wrappers.append(count_queries)
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = current_request.get()
+        if metrics is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_seconds += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend with render time added to the current
+    request's metrics. Only templates loaded through the backend are timed,
+    so {% extends %} and {% include %} are not counted twice.
+    """
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name).template, self)
@@ -0,0 +1,80 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from .metrics import QueryBudgetExceeded, RequestMetrics, current_request, install_query_counter, registry
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """
+    Record per-view latency, SQL query count and time, repeated statements,
+    template render time and response size into the in-process registry,
+    and enforce QUERY_BUDGETS. Should be first in MIDDLEWARE so the session
+    and authentication queries are counted too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        start = time.perf_counter()
+        try:
+            install_query_counter()
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.record(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        start = time.perf_counter()
+        try:
+            # The ORM runs on the request's sync thread, not the event loop's.
+            await sync_to_async(install_query_counter)()
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.record(request, response, metrics, time.perf_counter() - start)
+
+    def record(self, request, response, metrics, elapsed):
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        sample = {
+            'request_seconds': elapsed,
+            'sql_queries': metrics.queries,
+            'sql_seconds': metrics.sql_seconds,
+            'template_seconds': metrics.template_seconds,
+        }
+        if not response.streaming:
+            sample['response_bytes'] = len(response.content)
+        elif response.has_header('Content-Length'):
+            sample['response_bytes'] = int(response['Content-Length'])
+
+        duplicates = metrics.duplicates(settings.QUERY_DUPLICATE_THRESHOLD)
+        if duplicates:
+            sql, repeats = max(duplicates.items(), key=lambda item: item[1])
+            logger.warning('%s repeated a query %d times (likely N+1): %s', view, repeats, sql[:300])
+
+        budget = settings.QUERY_BUDGETS.get(view)
+        over_budget = budget is not None and metrics.queries > budget
+        registry.record(view, sample, duplicates, over_budget)
+
+        if over_budget:
+            message = f'{view} ran {metrics.queries} queries; its budget is {budget}'
+            if settings.QUERY_BUDGET_ACTION == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
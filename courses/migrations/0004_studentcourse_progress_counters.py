@@ -0,0 +1,58 @@
+# Generated by Django 4.2.24 on 2026-10-18 12:00
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+
+def backfill_progress(apps, schema_editor):
+    StudentCourse = apps.get_model('courses', 'StudentCourse')
+    Video = apps.get_model('courses', 'Video')
+    VideoProgress = apps.get_model('courses', 'VideoProgress')
+
+    total_videos = Video.objects.filter(
+        course=OuterRef('course')
+    ).order_by().values('course').annotate(n=Count('id')).values('n')
+    completed_videos = VideoProgress.objects.filter(
+        student=OuterRef('student'),
+        video__course=OuterRef('course'),
+        completed=True,
+    ).order_by().values('student').annotate(n=Count('id')).values('n')
+
+    StudentCourse.objects.update(
+        total_videos=Coalesce(Subquery(total_videos), 0),
+        completed_videos=Coalesce(Subquery(completed_videos), 0),
+    )
+    StudentCourse.objects.update(
+        progress_percentage=Case(
+            When(total_videos__gt=0, then=Cast('completed_videos', FloatField()) / F('total_videos') * 100),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0003_remove_payment_payment_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentcourse',
+            name='completed_videos',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='studentcourse',
+            name='total_videos',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='studentcourse',
+            name='progress_percentage',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(backfill_progress, migrations.RunPython.noop),
+    ]
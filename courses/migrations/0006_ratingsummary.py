@@ -0,0 +1,67 @@
+# Generated by Django 4.2.24 on 2026-10-18 13:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+import django.db.models.deletion
+
+
+def backfill_summaries(apps, schema_editor):
+    Rating = apps.get_model('courses', 'Rating')
+    RatingSummary = apps.get_model('courses', 'RatingSummary')
+
+    totals = {
+        'rating_count': Count('id'),
+        'rating_sum': Sum('rating'),
+        **{f'stars_{stars}': Count('id', filter=Q(rating=stars)) for stars in range(1, 6)},
+    }
+    video_ratings = Rating.objects.filter(video__isnull=False).order_by()
+    trainer_ratings = Rating.objects.filter(trainer__isnull=False).order_by()
+
+    summaries = []
+    for ratings, field, key, target in [
+        (video_ratings, 'video', 'video:{}', 'video_id'),
+        (video_ratings, 'video__course', 'course:{}', 'course_id'),
+        (trainer_ratings, 'trainer', 'trainer:{}', 'trainer_id'),
+    ]:
+        for row in ratings.values(field).annotate(**totals):
+            group_id = row.pop(field)
+            summaries.append(RatingSummary(key=key.format(group_id), **{target: group_id}, **row))
+    for ratings, key in [(video_ratings, 'video:*'), (trainer_ratings, 'trainer:*')]:
+        row = ratings.aggregate(**totals)
+        row['rating_sum'] = row['rating_sum'] or 0
+        summaries.append(RatingSummary(key=key, **row))
+
+    RatingSummary.objects.bulk_create(summaries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('courses', '0005_video_hls'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50, unique=True)),
+                ('rating_count', models.IntegerField(default=0)),
+                ('rating_sum', models.IntegerField(default=0)),
+                ('stars_1', models.IntegerField(default=0)),
+                ('stars_2', models.IntegerField(default=0)),
+                ('stars_3', models.IntegerField(default=0)),
+                ('stars_4', models.IntegerField(default=0)),
+                ('stars_5', models.IntegerField(default=0)),
+                ('course', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rating_summary', to='courses.course')),
+                ('trainer', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rating_summary', to=settings.AUTH_USER_MODEL)),
+                ('video', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rating_summary', to='courses.video')),
+            ],
+            options={
+                'verbose_name_plural': 'rating summaries',
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.24 on 2026-10-18 14:30
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def backfill_revenue(apps, schema_editor):
+    Payment = apps.get_model('courses', 'Payment')
+    DailyRevenue = apps.get_model('courses', 'DailyRevenue')
+
+    DailyRevenue.objects.bulk_create(
+        [
+            DailyRevenue(**row)
+            for row in Payment.objects.order_by()
+            .annotate(day=TruncDate('created_at'))
+            .values('day', 'course_id', status=F('payment_status'))
+            .annotate(payment_count=Count('id'), amount=Sum('amount'))
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_payment_console_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed'), ('refunded', 'Refunded')], max_length=20)),
+                ('payment_count', models.IntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_revenue', to='courses.course')),
+            ],
+            options={
+                'verbose_name_plural': 'daily revenue',
+                'unique_together': {('day', 'course', 'status')},
+                'indexes': [models.Index(fields=['status', 'day'], name='dailyrevenue_status_day_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_revenue, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.24 on 2026-10-18 19:05
+
+from django.db import migrations
+
+TRAINER = "trim(u.first_name || ' ' || u.last_name || ' ' || u.username)"
+JOINS = ('JOIN courses_coursecategory cat ON cat.id = c.category_id '
+         'JOIN users_customuser u ON u.id = c.trainer_id')
+
+
+def create_search_index(apps, schema_editor):
+    # Other databases use courses.search.DatabaseSearch, which needs no table.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE courses_search USING fts5('
+        'title, body, course, category, trainer, course_id UNINDEXED, '
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    insert = 'INSERT INTO courses_search (rowid, title, body, course, category, trainer, course_id) '
+    schema_editor.execute(
+        insert + f"SELECT c.id * 2, c.title, c.description, '', cat.name, {TRAINER}, c.id "
+        f'FROM courses_course c {JOINS} WHERE c.is_active'
+    )
+    schema_editor.execute(
+        insert + f'SELECT v.id * 2 + 1, v.title, v.description, c.title, cat.name, {TRAINER}, c.id '
+        f'FROM courses_video v JOIN courses_course c ON c.id = v.course_id {JOINS} WHERE c.is_active'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS courses_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_job'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
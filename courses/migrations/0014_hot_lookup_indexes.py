@@ -0,0 +1,25 @@
+# Generated by Django 4.2.24 on 2026-10-18 21:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0013_replicaheartbeat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='videoprogress',
+            index=models.Index(condition=models.Q(('completed', True)), fields=['student', 'video'], name='progress_completed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='videoprogress',
+            index=models.Index(fields=['student', 'last_watched', 'completed'], name='progress_student_watched_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['student', 'course', 'payment_status', 'created_at', 'id'], name='payment_student_course_idx'),
+        ),
+    ]
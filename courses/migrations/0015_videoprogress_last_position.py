@@ -0,0 +1,23 @@
+# Generated by Django 4.2.24 on 2026-10-18 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0014_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videoprogress',
+            name='last_position',
+            field=models.IntegerField(default=0, help_text='Position of the latest heartbeat, to resume from'),
+        ),
+        migrations.AlterField(
+            model_name='videoprogress',
+            name='watched_time',
+            field=models.IntegerField(default=0, help_text='Furthest position reached, in seconds'),
+        ),
+    ]
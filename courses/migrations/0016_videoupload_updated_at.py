@@ -0,0 +1,18 @@
+# Generated by Django 4.2.24 on 2026-10-18 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0015_videoprogress_last_position'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videoupload',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, help_text='When the last chunk arrived'),
+        ),
+    ]
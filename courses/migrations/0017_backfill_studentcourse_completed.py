@@ -0,0 +1,21 @@
+# Generated by Django 4.2.24 on 2026-10-18 23:58
+
+from django.db import migrations
+from django.db.models import F
+
+
+def backfill_completed(apps, schema_editor):
+    StudentCourse = apps.get_model('courses', 'StudentCourse')
+    StudentCourse.objects.update(completed=False)
+    StudentCourse.objects.filter(total_videos__gt=0, completed_videos__gte=F('total_videos')).update(completed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0016_videoupload_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_completed, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,9 @@
+import mimetypes
+import os
+import uuid
+
 from django.db import models
+from django.db.models import Q
 from django.conf import settings
 
 
@@ -29,6 +34,14 @@ class Course(models.Model):
 
 
 class Video(models.Model):
+    HLS_STATUS_CHOICES = (
+        ('none', 'Not packaged'),
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    )
+
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='videos')
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
@@ -36,6 +49,17 @@ class Video(models.Model):
     duration = models.IntegerField(help_text="Duration in minutes")
     order = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    hls_status = models.CharField(max_length=20, choices=HLS_STATUS_CHOICES, default='none')
+    hls_playlist = models.CharField(max_length=255, blank=True, help_text="Master playlist, relative to MEDIA_ROOT")
+    hls_renditions = models.JSONField(default=list, blank=True)
+    hls_error = models.TextField(blank=True)
+    # Read from the uploaded file by courses.probing.
+    duration_seconds = models.FloatField(null=True, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    bitrate = models.PositiveIntegerField(null=True, blank=True, help_text="Bits per second")
+    video_codec = models.CharField(max_length=20, blank=True)
+    audio_codec = models.CharField(max_length=20, blank=True)
 
     class Meta:
         ordering = ['order']
@@ -43,12 +67,19 @@ class Video(models.Model):
     def __str__(self):
         return f"{self.course.title} - {self.title}"
 
+    @property
+    def mime_type(self):
+        return mimetypes.guess_type(self.video_file.name)[0] or 'video/mp4'
+
 
 class StudentCourse(models.Model):
     student = models.ForeignKey(CustomUser, on_delete=models.CASCADE, limit_choices_to={'user_type': 'student'})
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     enrolled_at = models.DateTimeField(auto_now_add=True)
     completed = models.BooleanField(default=False)
+    completed_videos = models.IntegerField(default=0)
+    total_videos = models.IntegerField(default=0)
+    progress_percentage = models.FloatField(default=0)
 
     class Meta:
         unique_together = ('student', 'course')
@@ -61,11 +92,19 @@ class VideoProgress(models.Model):
     student = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     video = models.ForeignKey(Video, on_delete=models.CASCADE)
     completed = models.BooleanField(default=False)
-    watched_time = models.IntegerField(default=0)
+    watched_time = models.IntegerField(default=0, help_text="Furthest position reached, in seconds")
+    last_position = models.IntegerField(default=0, help_text="Position of the latest heartbeat, to resume from")
     last_watched = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('student', 'video')
+        indexes = [
+            # Completed videos of a student, counted per course by
+            # refresh_progress without reading the unfinished rows.
+            models.Index(fields=['student', 'video'], condition=Q(completed=True), name='progress_completed_idx'),
+            # Covers the per-student activity of the progress report.
+            models.Index(fields=['student', 'last_watched', 'completed'], name='progress_student_watched_idx'),
+        ]
 
     def __str__(self):
         status = "Completed" if self.completed else "In Progress"
@@ -102,6 +141,42 @@ class Rating(models.Model):
             return f"{self.student.username} - {self.trainer.username} - {self.rating} stars"
 
 
+class RatingSummary(models.Model):
+    """
+    Running totals of ratings for one video, course or trainer, or for all
+    video ("video:*") or trainer ("trainer:*") ratings. Kept up to date by
+    courses.ratings as ratings are written.
+    """
+    key = models.CharField(max_length=50, unique=True)
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name='rating_summary')
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, null=True, blank=True,
+                                  related_name='rating_summary')
+    trainer = models.OneToOneField(CustomUser, on_delete=models.CASCADE, null=True, blank=True,
+                                   related_name='rating_summary')
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    stars_1 = models.IntegerField(default=0)
+    stars_2 = models.IntegerField(default=0)
+    stars_3 = models.IntegerField(default=0)
+    stars_4 = models.IntegerField(default=0)
+    stars_5 = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'rating summaries'
+
+    def __str__(self):
+        return f"{self.key} - {self.rating_count} ratings"
+
+    @property
+    def average(self):
+        return self.rating_sum / self.rating_count if self.rating_count else 0
+
+    @property
+    def histogram(self):
+        return {stars: getattr(self, f'stars_{stars}') for stars in range(1, 6)}
+
+
 class Payment(models.Model):
     PAYMENT_STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -119,7 +194,123 @@ class Payment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='payment_created_idx'),
+            models.Index(fields=['payment_status', 'created_at', 'id'], name='payment_status_created_idx'),
+            models.Index(fields=['course', 'created_at', 'id'], name='payment_course_created_idx'),
+            models.Index(fields=['student', 'created_at', 'id'], name='payment_student_created_idx'),
+            models.Index(fields=['student', 'course', 'payment_status', 'created_at', 'id'],
+                         name='payment_student_course_idx'),
+        ]
+
     def __str__(self):
         return f"{self.student.username} - {self.course.title} - ${self.amount}"
 
 
+class DailyRevenue(models.Model):
+    """
+    Number and sum of payments per creation day, course and status. Kept up to
+    date by courses.revenue as payments are created, change status or are
+    deleted, so dashboards never aggregate the Payment table itself.
+    """
+    day = models.DateField()
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='daily_revenue')
+    status = models.CharField(max_length=20, choices=Payment.PAYMENT_STATUS_CHOICES)
+    payment_count = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('day', 'course', 'status')
+        indexes = [
+            models.Index(fields=['status', 'day'], name='dailyrevenue_status_day_idx'),
+        ]
+        verbose_name_plural = 'daily revenue'
+
+    def __str__(self):
+        return f"{self.day} - {self.course.title} - {self.status}: ${self.amount}"
+
+
+class VideoUpload(models.Model):
+    """
+    A resumable upload in progress. Chunks of ``chunk_size`` bytes are
+    written at their offsets into a file under MEDIA_ROOT/uploads, and the
+    Video is only created once every chunk has arrived.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='uploads')
+    trainer = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, help_text="When the last chunk arrived")
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    @property
+    def path(self):
+        return os.path.join(settings.MEDIA_ROOT, 'uploads', f'{self.id}.part')
+
+    def __str__(self):
+        return f"{self.filename} ({self.size} bytes) for {self.course.title}"
+
+
+class UploadChunk(models.Model):
+    upload = models.ForeignKey(VideoUpload, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = ('upload', 'index')
+
+
+class Job(models.Model):
+    """
+    A call to a function decorated with courses.jobs.task, waiting for or
+    taken by a `manage.py run_jobs` worker. Finished jobs are deleted;
+    failed ones are kept for inspection.
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    )
+
+    name = models.CharField(max_length=200, help_text="Dotted path of the task")
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    queue = models.CharField(max_length=50, default='default')
+    priority = models.IntegerField(default=0, help_text="Higher runs first")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    run_at = models.DateTimeField()
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    timeout = models.PositiveIntegerField(help_text="Seconds a worker may hold the job before it is retried")
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'queue', '-priority', 'run_at'], name='job_claim_idx'),
+            models.Index(fields=['status', 'locked_until'], name='job_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class ReplicaHeartbeat(models.Model):
+    """
+    One row, stamped on the primary by `manage.py snapshot_replica`. Read
+    back from the replica, its age is how far behind the replica is
+    (courses/replicas.py).
+    """
+    beat_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Heartbeat at {self.beat_at}"
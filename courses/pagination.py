@@ -0,0 +1,82 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    raw = f'{created_at.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(cursor)
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor, previous_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_paginate(queryset, page_size, after=None, before=None):
+    """
+    Page through ``queryset`` newest first on (created_at, id). ``after`` and
+    ``before`` are cursors from a previous page; each page is a single range
+    read on a (..., created_at, id) index however deep into the results it is,
+    unlike OFFSET which has to walk every row it skips.
+    """
+    if before:
+        created_at, pk = decode_cursor(before)
+        # The created_at__gte bound is what lets the index seek; the OR only
+        # breaks ties among rows sharing the cursor's timestamp.
+        rows = list(
+            queryset.filter(created_at__gte=created_at)
+            .filter(Q(created_at__gt=created_at) | Q(id__gt=pk))
+            .order_by('created_at', 'id')[:page_size + 1]
+        )
+        has_more = len(rows) > page_size
+        items = rows[:page_size][::-1]
+        has_newer, has_older = has_more, True
+    else:
+        rows = queryset.order_by('-created_at', '-id')
+        if after:
+            created_at, pk = decode_cursor(after)
+            rows = rows.filter(created_at__lte=created_at).filter(Q(created_at__lt=created_at) | Q(id__lt=pk))
+        rows = list(rows[:page_size + 1])
+        has_more = len(rows) > page_size
+        items = rows[:page_size]
+        has_newer, has_older = bool(after), has_more
+
+    if not items:
+        return KeysetPage(items, None, None)
+    return KeysetPage(
+        items,
+        encode_cursor(items[-1].created_at, items[-1].pk) if has_older else None,
+        encode_cursor(items[0].created_at, items[0].pk) if has_newer else None,
+    )
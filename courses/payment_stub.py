@@ -0,0 +1,104 @@
+"""
+A local HTTP server that answers the payment provider API calls the
+gateway makes, with configurable latency and failures, for exercising
+timeouts, retries and the circuit breaker. Run it with
+``manage.py run_payment_stub`` and set PAYMENT_GATEWAY_API_BASE to its URL.
+"""
+import json
+import random
+import secrets
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_POST(self):
+        server = self.server
+        params = dict(parse_qsl(self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()))
+        key = self.headers.get('Idempotency-Key')
+        with server.lock:
+            server.requests += 1
+            if key:
+                server.idempotency_keys[key] += 1
+
+        if server.latency:
+            time.sleep(server.latency)
+        if random.random() < server.failure_rate:
+            return self.send_json(server.failure_status, {'error': {
+                'type': 'api_error', 'message': 'Stub provider failure.',
+            }})
+
+        if self.path.rstrip('/') != '/v1/checkout/sessions':
+            return self.send_json(404, {'error': {'type': 'invalid_request_error', 'message': 'Unknown path.'}})
+
+        with server.lock:
+            # Like the real API, a retried idempotency key gets the first
+            # response back.
+            if key in server.responses:
+                return self.send_json(200, server.responses[key])
+            session_id = f'cs_stub_{secrets.token_hex(12)}'
+            session = {
+                'id': session_id,
+                'object': 'checkout.session',
+                'mode': params.get('mode'),
+                'status': 'open',
+                'payment_status': 'unpaid',
+                'amount_total': int(params.get('line_items[0][price_data][unit_amount]', 0)),
+                'customer_email': params.get('customer_email'),
+                'metadata': {name[9:-1]: value for name, value in params.items() if name.startswith('metadata[')},
+                # There is no hosted page: checkout "completes" straight away.
+                'url': params.get('success_url', '').replace('{CHECKOUT_SESSION_ID}', session_id),
+            }
+            if key:
+                server.responses[key] = session
+        self.send_json(200, session)
+
+
+class StubProviderServer(ThreadingHTTPServer):
+    """
+    Behaviour can be changed while it runs: ``latency`` seconds are added to
+    every response and ``failure_rate`` of requests get ``failure_status``.
+    """
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, failure_rate=0, failure_status=500, verbose=False):
+        super().__init__((host, port), StubHandler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.idempotency_keys = Counter()
+        self.responses = {}
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up mid-response; that is the point.
+        pass
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
@@ -0,0 +1,171 @@
+import json
+import logging
+
+import stripe
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils.crypto import salted_hmac
+
+from .gateway import get_gateway
+from .models import Payment, StudentCourse
+
+logger = logging.getLogger(__name__)
+
+CONFIRMING_EVENTS = {'checkout.session.completed', 'checkout.session.async_payment_succeeded'}
+FAILING_EVENTS = {'checkout.session.async_payment_failed', 'checkout.session.expired'}
+
+
+class InvalidWebhook(Exception):
+    pass
+
+
+class UnknownCheckout(Exception):
+    """A webhook for a checkout session no payment was recorded for."""
+
+
+class WebhookNotConfigured(ImproperlyConfigured):
+    """No webhook secret is set, so no event can be trusted."""
+
+
+async def _stripe_checkout(course, student, success_url, cancel_url):
+    session = await get_gateway().acreate_checkout_session({
+        'payment_method_types': ['card'],
+        'line_items': [{
+            'price_data': {
+                'currency': 'usd',
+                'product_data': {
+                    'name': course.title,
+                    'description': course.description,
+                },
+                'unit_amount': int(course.price * 100),  # Convert to cents
+            },
+            'quantity': 1,
+        }],
+        'mode': 'payment',
+        'success_url': success_url,
+        'cancel_url': cancel_url,
+        'customer_email': student.email,
+        'metadata': {
+            'course_id': course.id,
+            'student_id': student.id
+        }
+    })
+    return {'id': session.id, 'url': session.url}
+
+
+async def astart_checkout(request, course, student):
+    """
+    Open a checkout session with the configured provider, record the pending
+    payment against the session id and return the URL to send the student
+    to. Enrollment happens when the provider's webhook confirms the session.
+    """
+    success_url = (request.build_absolute_uri(reverse('payment_success'))
+                   + f'?course_id={course.id}&session_id={{CHECKOUT_SESSION_ID}}')
+    cancel_url = request.build_absolute_uri(reverse('payment_cancel')) + f'?course_id={course.id}'
+    if settings.PAYMENT_PROVIDER == 'fake':
+        # Makes no network calls.
+        from .fake_payments import create_checkout_session
+        session = create_checkout_session(course, student, success_url, cancel_url)
+    else:
+        session = await _stripe_checkout(course, student, success_url, cancel_url)
+
+    await Payment.objects.acreate(
+        stripe_session_id=session['id'], student=student, course=course, amount=course.price,
+        payment_status='pending',
+    )
+    return session['url']
+
+
+def webhook_secret():
+    """
+    STRIPE_WEBHOOK_SECRET, or for the fake provider when it is unset, one
+    derived from SECRET_KEY so local checkouts work without configuration.
+    """
+    if settings.STRIPE_WEBHOOK_SECRET or settings.PAYMENT_PROVIDER != 'fake':
+        return settings.STRIPE_WEBHOOK_SECRET
+    return 'whsec_' + salted_hmac('courses.fake_payments', 'webhook').hexdigest()
+
+
+def verify_webhook(payload, signature):
+    secret = webhook_secret()
+    if not secret:
+        # Without a secret anyone could sign events.
+        raise WebhookNotConfigured('STRIPE_WEBHOOK_SECRET is not set; refusing payment webhooks.')
+    try:
+        stripe.WebhookSignature.verify_header(payload, signature, secret, settings.STRIPE_WEBHOOK_TOLERANCE)
+        return json.loads(payload)
+    except (stripe.SignatureVerificationError, ValueError) as e:
+        raise InvalidWebhook(str(e))
+
+
+def _locked_payment(session):
+    """
+    The payment recorded for a checkout session, locked for update. Rows
+    written before sessions were stored by their own id kept the session id
+    in stripe_payment_intent_id. The event's metadata is never used to make
+    one: who pays for what is only what astart_checkout recorded.
+    """
+    session_id = session['id']
+    lookup = Q(stripe_session_id=session_id) | Q(stripe_payment_intent_id=session_id)
+    payment = Payment.objects.select_for_update().filter(lookup).first()
+    if payment is None:
+        raise UnknownCheckout(session_id)
+    return payment
+
+
+def confirm_checkout(session):
+    """
+    Mark the session's payment completed and enroll the student, in one
+    transaction. Replayed or duplicate events find the payment already
+    completed and change nothing.
+    """
+    with transaction.atomic():
+        payment = _locked_payment(session)
+        if payment.payment_status == 'completed':
+            return payment
+
+        payment.stripe_session_id = session['id']
+        payment.stripe_payment_intent_id = session.get('payment_intent') or None
+        payment.payment_status = 'completed'
+        payment.save()
+        StudentCourse.objects.get_or_create(student_id=payment.student_id, course_id=payment.course_id)
+    return payment
+
+
+def fail_checkout(session):
+    with transaction.atomic():
+        payment = _locked_payment(session)
+        if payment.payment_status == 'pending':
+            payment.payment_status = 'failed'
+            payment.save()
+    return payment
+
+
+def _event_session(event):
+    try:
+        session = event['data']['object']
+        valid = isinstance(event['type'], str) and isinstance(session['id'], str)
+    except (KeyError, TypeError):
+        valid = False
+    if not valid:
+        raise InvalidWebhook('Expected an event with a type and a data.object with an id.')
+    return session
+
+
+def handle_event(event):
+    """
+    Apply a verified checkout event. Raises InvalidWebhook for a malformed
+    event and UnknownCheckout for a session with no recorded payment.
+    """
+    session = _event_session(event)
+    if event['type'] in CONFIRMING_EVENTS:
+        # Delayed payment methods complete the session before the money
+        # arrives; async_payment_succeeded follows once it has.
+        if session.get('payment_status') == 'paid':
+            return confirm_checkout(session)
+    elif event['type'] in FAILING_EVENTS:
+        return fail_checkout(session)
+    return None
@@ -0,0 +1,209 @@
+"""
+Read duration, resolution, bitrate and codecs from uploaded media files.
+
+MP4/MOV files are parsed in pure Python: the top-level boxes are walked by
+their headers alone, so only the ``moov`` box is ever read, wherever it sits
+in the file. Other containers go to the next prober in MEDIA_PROBERS.
+"""
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import subprocess
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Top-level boxes an MP4/MOV file can start with.
+MP4_LEADING_BOXES = {b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot'}
+CODEC_NAMES = {
+    'avc1': 'h264', 'avc3': 'h264', 'hvc1': 'hevc', 'hev1': 'hevc', 'av01': 'av1', 'vp09': 'vp9',
+    'mp4v': 'mpeg4', 'mp4a': 'aac', 'Opus': 'opus', 'ac-3': 'ac3', 'ec-3': 'eac3', 'fLaC': 'flac',
+}
+
+
+class ProbeError(Exception):
+    pass
+
+
+def _boxes(data, start, end):
+    """
+    Yield (type, payload start, box end) for the boxes between two offsets.
+    """
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                raise ProbeError('Truncated box header.')
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise ProbeError(f'Box {box_type!r} runs past its parent.')
+        yield box_type, offset + header, offset + size
+        offset += size
+
+
+def _find(data, start, end, box_type):
+    for child_type, child_start, child_end in _boxes(data, start, end):
+        if child_type == box_type:
+            return child_start, child_end
+    return None
+
+
+def _movie_header(data, start):
+    # FullBox: version, then 32- or 64-bit creation/modification times.
+    if data[start] == 1:
+        timescale, duration = struct.unpack_from('>IQ', data, start + 20)
+    else:
+        timescale, duration = struct.unpack_from('>II', data, start + 12)
+    return timescale, duration
+
+
+def _track(data, start, end):
+    mdia = _find(data, start, end, b'mdia')
+    if mdia is None:
+        return None
+    hdlr = _find(data, *mdia, b'hdlr')
+    handler = bytes(data[hdlr[0] + 8:hdlr[0] + 12]) if hdlr else b''
+
+    track = {'handler': handler, 'codec': None, 'width': None, 'height': None}
+    tkhd = _find(data, start, end, b'tkhd')
+    if tkhd is not None:
+        # Display size as 16.16 fixed point, the last eight bytes of tkhd.
+        width, height = struct.unpack_from('>II', data, tkhd[1] - 8)
+        track['width'], track['height'] = width >> 16, height >> 16
+
+    minf = _find(data, *mdia, b'minf')
+    stbl = minf and _find(data, *minf, b'stbl')
+    stsd = stbl and _find(data, *stbl, b'stsd')
+    if stsd and stsd[0] + 16 <= stsd[1]:
+        # FullBox header and entry count, then the first sample entry.
+        codec = bytes(data[stsd[0] + 12:stsd[0] + 16]).decode('latin-1')
+        track['codec'] = CODEC_NAMES.get(codec, codec.strip())
+    return track
+
+
+def probe_mp4(path):
+    """
+    Parse an MP4/MOV file's ``moov`` box. Returns None for other formats.
+    """
+    size = os.path.getsize(path)
+    if size < 8:
+        return None
+    with open(path, 'rb') as f:
+        # The mapping is only paged in where it is read: a handful of box
+        # headers and the moov box.
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[4:8] not in MP4_LEADING_BOXES:
+                return None
+            try:
+                moov = _find(data, 0, size, b'moov')
+                if moov is None:
+                    raise ProbeError('No moov box; the file may be incomplete.')
+                mvhd = _find(data, *moov, b'mvhd')
+                if mvhd is None:
+                    raise ProbeError('No mvhd box.')
+                timescale, duration = _movie_header(data, mvhd[0])
+                tracks = [
+                    _track(data, start, end)
+                    for box_type, start, end in _boxes(data, *moov) if box_type == b'trak'
+                ]
+            except struct.error:
+                raise ProbeError('Truncated box.')
+
+    if not timescale:
+        raise ProbeError('mvhd has no timescale.')
+    seconds = duration / timescale
+    video = next((track for track in tracks if track and track['handler'] == b'vide'), None)
+    audio = next((track for track in tracks if track and track['handler'] == b'soun'), None)
+    return {
+        'duration': seconds,
+        'width': video and video['width'],
+        'height': video and video['height'],
+        'bitrate': int(size * 8 / seconds) if seconds else None,
+        'video_codec': video and video['codec'],
+        'audio_codec': audio and audio['codec'],
+    }
+
+
+def probe_ffprobe(path):
+    """
+    Ask ffprobe about any container it understands, if it is installed.
+    """
+    ffprobe = shutil.which(settings.HLS_FFPROBE_BINARY)
+    if not ffprobe:
+        return None
+    result = subprocess.run(
+        [ffprobe, '-v', 'error', '-show_entries', 'format=duration,bit_rate:stream=codec_type,codec_name,width,height',
+         '-of', 'json', path],
+        capture_output=True, text=True, timeout=60,
+    )
+    try:
+        output = json.loads(result.stdout)
+        seconds = float(output['format']['duration'])
+    except (ValueError, KeyError, TypeError):
+        return None
+    streams = output.get('streams', [])
+    video = next((stream for stream in streams if stream.get('codec_type') == 'video'), {})
+    audio = next((stream for stream in streams if stream.get('codec_type') == 'audio'), {})
+    bitrate = output['format'].get('bit_rate')
+    return {
+        'duration': seconds,
+        'width': video.get('width'),
+        'height': video.get('height'),
+        'bitrate': int(bitrate) if bitrate else None,
+        'video_codec': video.get('codec_name'),
+        'audio_codec': audio.get('codec_name'),
+    }
+
+
+def probe(path):
+    """
+    The first answer from the probers in MEDIA_PROBERS, or None.
+    """
+    for prober_path in settings.MEDIA_PROBERS:
+        try:
+            info = import_string(prober_path)(path)
+        except (ProbeError, OSError, ValueError, subprocess.SubprocessError) as e:
+            logger.warning('%s could not probe %s: %s', prober_path, path, e)
+            continue
+        if info is not None:
+            return info
+    return None
+
+
+def probe_video(video):
+    """
+    Fill in the media fields of ``video`` from its file, replacing the typed
+    duration (whole minutes, at least one) with the real one. Returns False
+    when no prober recognised the file.
+    """
+    if not video.video_file:
+        return False
+    info = probe(video.video_file.path)
+    if info is None:
+        return False
+
+    fields = {
+        'duration_seconds': info['duration'],
+        'width': info['width'],
+        'height': info['height'],
+        'bitrate': info['bitrate'],
+        'video_codec': info['video_codec'] or '',
+        'audio_codec': info['audio_codec'] or '',
+    }
+    if info['duration']:
+        fields['duration'] = max(1, round(info['duration'] / 60))
+    for name, value in fields.items():
+        setattr(video, name, value)
+    # A save rather than an update, so the catalog's minute totals refresh.
+    video.save(update_fields=list(fields))
+    return True
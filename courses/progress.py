@@ -0,0 +1,38 @@
+from django.db.models import BooleanField, Case, Count, F, FloatField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+from .models import Video, VideoProgress
+
+
+def refresh_progress(enrollments):
+    """
+    Recount the denormalized progress columns for a StudentCourse queryset,
+    and mark as completed the enrollments with every video of the course
+    completed. Runs as two UPDATE statements whatever the size of the
+    queryset.
+    """
+    total_videos = Video.objects.filter(
+        course=OuterRef('course')
+    ).order_by().values('course').annotate(n=Count('id')).values('n')
+    completed_videos = VideoProgress.objects.filter(
+        student=OuterRef('student'),
+        video__course=OuterRef('course'),
+        completed=True,
+    ).order_by().values('student').annotate(n=Count('id')).values('n')
+
+    enrollments.update(
+        total_videos=Coalesce(Subquery(total_videos), 0),
+        completed_videos=Coalesce(Subquery(completed_videos), 0),
+    )
+    enrollments.update(
+        progress_percentage=Case(
+            When(total_videos__gt=0, then=Cast('completed_videos', FloatField()) / F('total_videos') * 100),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+        completed=Case(
+            When(total_videos__gt=0, completed_videos__gte=F('total_videos'), then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        ),
+    )
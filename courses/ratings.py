@@ -0,0 +1,158 @@
+import contextvars
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import Rating, RatingSummary, Video
+
+VIDEO_TOTALS = 'video:*'
+TRAINER_TOTALS = 'trainer:*'
+RATING_VALUES = {value for value, _ in Rating.RATING_CHOICES}
+# {video id: course id} of the videos being deleted, whose ratings are
+# deleted along with them.
+_deleted_video_courses = contextvars.ContextVar('deleted_video_courses', default=None)
+
+
+def video_deleting(video):
+    courses = _deleted_video_courses.get()
+    if courses is None:
+        courses = {}
+        _deleted_video_courses.set(courses)
+    courses[video.pk] = video.course_id
+
+
+def video_deleted(video):
+    courses = _deleted_video_courses.get()
+    if courses is not None:
+        courses.pop(video.pk, None)
+
+
+def rating_course_id(rating):
+    """
+    The course of a video rating, read from the loaded video or the video
+    being deleted when there is one, or else looked up once per rating
+    without loading the video.
+    """
+    if Rating.video.is_cached(rating):
+        return rating.video.course_id
+    if not hasattr(rating, '_course_id'):
+        course_id = (_deleted_video_courses.get() or {}).get(rating.video_id)
+        if course_id is None:
+            course_id = Video.objects.filter(pk=rating.video_id).values_list('course_id', flat=True).first()
+        rating._course_id = course_id
+    return rating._course_id
+
+
+def _summary_targets(rating):
+    if rating.video_id:
+        course_id = rating_course_id(rating)
+        return [
+            {'key': f'video:{rating.video_id}', 'video_id': rating.video_id},
+            {'key': f'course:{course_id}', 'course_id': course_id},
+            {'key': VIDEO_TOTALS},
+        ]
+    return [
+        {'key': f'trainer:{rating.trainer_id}', 'trainer_id': rating.trainer_id},
+        {'key': TRAINER_TOTALS},
+    ]
+
+
+def _apply(rating, old_value, new_value):
+    changes = {'rating_sum': F('rating_sum') + (new_value or 0) - (old_value or 0)}
+    if old_value is None:
+        changes['rating_count'] = F('rating_count') + 1
+    else:
+        changes[f'stars_{old_value}'] = F(f'stars_{old_value}') - 1
+    if new_value is None:
+        changes['rating_count'] = F('rating_count') - 1
+    else:
+        changes[f'stars_{new_value}'] = F(f'stars_{new_value}') + 1
+
+    for target in _summary_targets(rating):
+        key = target.pop('key')
+        RatingSummary.objects.get_or_create(key=key, defaults=target)
+        RatingSummary.objects.filter(key=key).update(**changes)
+
+
+def save_rating(student, rating_value, comment, video=None, trainer=None):
+    """
+    Create or change the student's rating of a video or trainer and move the
+    matching summary counters from the old star value to the new one, all in
+    one transaction.
+    """
+    if rating_value not in RATING_VALUES:
+        # The summaries only have a stars_ counter for each valid value.
+        raise ValueError(f'Not a rating: {rating_value!r}')
+    lookup = {'student': student, 'video': video} if video else {'student': student, 'trainer': trainer}
+    with transaction.atomic():
+        # A first rating has no row to lock yet, so two of them would both
+        # count as new; the summary row they both change serializes them.
+        target = _summary_targets(Rating(**lookup))[0]
+        key = target.pop('key')
+        RatingSummary.objects.select_for_update().get_or_create(key=key, defaults=target)
+        previous = Rating.objects.filter(**lookup).values_list('rating', flat=True).first()
+        rating, created = Rating.objects.update_or_create(
+            **lookup,
+            defaults={'rating': rating_value, 'comment': comment}
+        )
+        if previous != rating_value:
+            _apply(rating, previous, rating_value)
+    return rating, created
+
+
+def forget_rating(rating):
+    _apply(rating, rating.rating, None)
+
+
+def rebuild_course_summaries(course_ids):
+    """
+    Recompute the summaries of some courses from the Rating table, such as
+    the two a video moved between.
+    """
+    course_ids = list(course_ids)
+    totals = {
+        row.pop('video__course'): row
+        for row in Rating.objects.filter(video__course__in=course_ids).order_by().values(
+            'video__course').annotate(**_totals())
+    }
+    empty = {name: 0 for name in _totals()}
+    for course_id in course_ids:
+        RatingSummary.objects.update_or_create(
+            key=f'course:{course_id}', defaults={'course_id': course_id, **totals.get(course_id, empty)},
+        )
+
+
+def _totals():
+    return {
+        'rating_count': Count('id'),
+        'rating_sum': Sum('rating'),
+        **{f'stars_{stars}': Count('id', filter=Q(rating=stars)) for stars in range(1, 6)},
+    }
+
+
+def rebuild_summaries():
+    """
+    Recompute every summary from the Rating table with grouped queries.
+    """
+    video_ratings = Rating.objects.filter(video__isnull=False).order_by()
+    trainer_ratings = Rating.objects.filter(trainer__isnull=False).order_by()
+    groups = [
+        (video_ratings, 'video', 'video:{}', 'video_id'),
+        (video_ratings, 'video__course', 'course:{}', 'course_id'),
+        (trainer_ratings, 'trainer', 'trainer:{}', 'trainer_id'),
+    ]
+
+    summaries = []
+    for ratings, field, key, target in groups:
+        for row in ratings.values(field).annotate(**_totals()):
+            group_id = row.pop(field)
+            summaries.append(RatingSummary(key=key.format(group_id), **{target: group_id}, **row))
+    for ratings, key in [(video_ratings, VIDEO_TOTALS), (trainer_ratings, TRAINER_TOTALS)]:
+        row = ratings.aggregate(**_totals())
+        row['rating_sum'] = row['rating_sum'] or 0
+        summaries.append(RatingSummary(key=key, **row))
+
+    with transaction.atomic():
+        RatingSummary.objects.all().delete()
+        RatingSummary.objects.bulk_create(summaries, batch_size=1000)
+    return len(summaries)
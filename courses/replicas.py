@@ -0,0 +1,182 @@
+"""
+Reporting reads from a replica. Views decorated with read_from_replica run
+their queries against REPLICA_DATABASE while it is at most REPLICA_MAX_LAG
+seconds behind, and against the primary otherwise; writes always go to the
+primary. How far behind the replica is comes from ReplicaHeartbeat: the
+row is stamped on the primary and its age is read back from the replica.
+
+For SQLite, snapshot_replica copies the primary into the replica file with
+the backup API (`manage.py snapshot_replica`), so no replication server is
+needed. With a real replica, running the same command just stamps the
+heartbeat and replication carries it over.
+"""
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils import timezone
+
+from .models import ReplicaHeartbeat
+
+# The alias reads of the current request go to, when not the primary.
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+# {alias: (checked at, heartbeat or None)}, so the lag is read from each
+# replica at most once per REPLICA_CHECK_INTERVAL.
+_heartbeats = {}
+_heartbeats_lock = threading.Lock()
+# Session key holding when the session last wrote through a
+# read_from_replica view, as a POSIX timestamp.
+WROTE_AT_SESSION_KEY = '_replica_wrote_at'
+
+
+class ReplicaRouter:
+    """
+    Reads go where read_from_replica pointed them; every write, and any
+    object read from the replica and saved again, goes to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its tables from the primary.
+        return db != settings.REPLICA_DATABASE
+
+
+def _heartbeat(alias):
+    connection = connections[alias]
+    if connection.vendor == 'sqlite' and not connection.is_in_memory_db():
+        # Opening a missing SQLite file would create an empty one.
+        if not os.path.exists(connection.settings_dict['NAME']):
+            return None
+    try:
+        return ReplicaHeartbeat.objects.using(alias).order_by('-beat_at').values_list('beat_at', flat=True).first()
+    except DatabaseError:
+        return None
+
+
+def replica_heartbeat(alias=None):
+    """
+    When the replica's data was last stamped on the primary, or None when
+    it can't tell (no replica configured, no snapshot yet or the replica is
+    down).
+    """
+    alias = alias or settings.REPLICA_DATABASE
+    if not alias or alias not in connections:
+        return None
+    # A test mirror is the primary itself.
+    if connections[alias].settings_dict['NAME'] == connections[DEFAULT_DB_ALIAS].settings_dict['NAME']:
+        return None
+    now = time.monotonic()
+    checked_at, beat_at = _heartbeats.get(alias, (None, None))
+    if checked_at is None or now - checked_at >= settings.REPLICA_CHECK_INTERVAL:
+        beat_at = _heartbeat(alias)
+        with _heartbeats_lock:
+            _heartbeats[alias] = (now, beat_at)
+    return beat_at
+
+
+def replica_lag(alias=None):
+    """Seconds the replica is behind the primary, or None when it can't tell."""
+    beat_at = replica_heartbeat(alias)
+    if beat_at is None:
+        return None
+    return max(0.0, (timezone.now() - beat_at).total_seconds())
+
+
+def _sees_own_writes(request, beat_at):
+    """
+    Whether the replica has caught up with the session's last write made
+    through a read_from_replica view. The pin is dropped once it has.
+    """
+    session = getattr(request, 'session', None)
+    wrote_at = session.get(WROTE_AT_SESSION_KEY) if session is not None else None
+    if wrote_at is None:
+        return True
+    if beat_at.timestamp() <= wrote_at:
+        return False
+    del session[WROTE_AT_SESSION_KEY]
+    return True
+
+
+def read_from_replica(view_func=None, max_lag=None):
+    """
+    Send the reads of GET and HEAD requests to REPLICA_DATABASE when it is
+    no more than ``max_lag`` (default REPLICA_MAX_LAG) seconds behind.
+    Other requests, and every request when the replica is stale or
+    missing, read from the primary. A request that may write (any other
+    method) also pins its session to the primary until the replica has a
+    snapshot taken after it, so the page it redirects to shows the change.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                response = view_func(request, *args, **kwargs)
+                # After the view, so its writes are committed by then.
+                if hasattr(request, 'session'):
+                    request.session[WROTE_AT_SESSION_KEY] = time.time()
+                return response
+            beat_at = replica_heartbeat()
+            if beat_at is None or not _sees_own_writes(request, beat_at):
+                return view_func(request, *args, **kwargs)
+            lag = max(0.0, (timezone.now() - beat_at).total_seconds())
+            limit = settings.REPLICA_MAX_LAG if max_lag is None else max_lag
+            if lag > limit:
+                return view_func(request, *args, **kwargs)
+            token = _read_alias.set(settings.REPLICA_DATABASE)
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+        return wrapper
+    return decorator(view_func) if view_func else decorator
+
+
+def beat():
+    """Stamp the heartbeat on the primary and return its time."""
+    now = timezone.now()
+    ReplicaHeartbeat.objects.update_or_create(pk=1, defaults={'beat_at': now})
+    return now
+
+
+def snapshot_replica(alias=None):
+    """
+    Stamp the heartbeat, then copy the primary SQLite database into the
+    replica's file with the online backup API. The copy reads one
+    consistent snapshot of the primary, which under WAL doesn't hold up its
+    writers, and readers of the replica see the previous snapshot until it
+    is done.
+    """
+    alias = alias or settings.REPLICA_DATABASE
+    primary = connections[DEFAULT_DB_ALIAS]
+    replica = connections[alias]
+    if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+        raise ValueError('Snapshots copy one SQLite file to another; other replicas are kept up by replication.')
+    if replica.settings_dict['NAME'] == primary.settings_dict['NAME']:
+        raise ValueError(f'The {alias} database is the primary itself.')
+    beat_at = beat()
+    primary.ensure_connection()
+    busy_timeout = settings.SQLITE_PRAGMAS.get('busy_timeout', 5000) / 1000
+    target = sqlite3.connect(replica.settings_dict['NAME'], timeout=busy_timeout)
+    try:
+        # In one step: a stepped copy starts over whenever the primary changes.
+        primary.connection.backup(target)
+        # Otherwise the replica's WAL keeps a whole copy of the database.
+        target.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        target.close()
+    with _heartbeats_lock:
+        _heartbeats.pop(alias, None)
+    return beat_at
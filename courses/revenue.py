@@ -0,0 +1,114 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyRevenue, Payment
+
+SERIES_LENGTHS = {'day': 30, 'week': 12, 'month': 12}
+
+
+def revenue_bucket(payment):
+    """
+    The (day, course_id, status, amount) a payment counts towards, or None
+    for a payment that is not saved yet.
+    """
+    if payment is None or payment.created_at is None:
+        return None
+    return timezone.localdate(payment.created_at), payment.course_id, payment.payment_status, payment.amount
+
+
+def apply_revenue_change(old, new):
+    if old == new:
+        return
+    with transaction.atomic():
+        if old is not None:
+            day, course_id, status, amount = old
+            # Only ever decrement existing rows: creating one here could
+            # reference a course that is being deleted in this cascade.
+            DailyRevenue.objects.filter(day=day, course_id=course_id, status=status).update(
+                payment_count=F('payment_count') - 1, amount=F('amount') - amount,
+            )
+        if new is not None:
+            day, course_id, status, amount = new
+            DailyRevenue.objects.get_or_create(day=day, course_id=course_id, status=status)
+            DailyRevenue.objects.filter(day=day, course_id=course_id, status=status).update(
+                payment_count=F('payment_count') + 1, amount=F('amount') + amount,
+            )
+
+
+def rebuild_revenue():
+    """
+    Recompute every rollup row from the Payment table with one grouped query.
+    """
+    rows = [
+        DailyRevenue(**row)
+        for row in Payment.objects.order_by()
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'course_id', status=F('payment_status'))
+        .annotate(payment_count=Count('id'), amount=Sum('amount'))
+    ]
+    with transaction.atomic():
+        DailyRevenue.objects.all().delete()
+        DailyRevenue.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def completed_revenue():
+    return DailyRevenue.objects.filter(status='completed').aggregate(total=Sum('amount'))['total'] or 0
+
+
+def _period_start(day, period):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _previous_start(start, period):
+    if period == 'week':
+        return start - timedelta(weeks=1)
+    if period == 'month':
+        return (start - timedelta(days=1)).replace(day=1)
+    return start - timedelta(days=1)
+
+
+def revenue_series(today=None):
+    """
+    Completed revenue for the last SERIES_LENGTHS days, weeks (from Monday)
+    and months, oldest first and with empty periods included, all read from
+    one grouped query on the rollup table.
+    """
+    today = today or timezone.localdate()
+    starts = {}
+    for period, length in SERIES_LENGTHS.items():
+        start = _period_start(today, period)
+        periods = [start]
+        for _ in range(length - 1):
+            start = _previous_start(start, period)
+            periods.append(start)
+        starts[period] = periods[::-1]
+
+    earliest = min(periods[0] for periods in starts.values())
+    daily = list(
+        DailyRevenue.objects.filter(status='completed', day__gte=earliest, day__lte=today)
+        .values('day').annotate(total=Sum('amount'), payments=Sum('payment_count')).order_by()
+    )
+
+    series = {}
+    for period, periods in starts.items():
+        buckets = {start: {'start': start, 'amount': Decimal('0'), 'payments': 0} for start in periods}
+        for row in daily:
+            bucket = buckets.get(_period_start(row['day'], period))
+            if bucket is not None:
+                bucket['amount'] += row['total']
+                bucket['payments'] += row['payments']
+        peak = max(bucket['amount'] for bucket in buckets.values())
+        for bucket in buckets.values():
+            bucket['percent'] = float(bucket['amount'] / peak * 100) if peak else 0
+        series[period] = list(buckets.values())
+    return series
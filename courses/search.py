@@ -0,0 +1,237 @@
+"""
+Full-text search over active courses and their lectures: titles,
+descriptions, category and trainer names.
+
+SEARCH_BACKEND picks the index. FTS5Search keeps an SQLite FTS5 table
+(created by migration 0012) in step through the signals in
+courses/signals.py, ranks with BM25 and highlights matches. DatabaseSearch
+works on any database with plain ``icontains`` lookups and no ranking.
+"""
+import re
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+from .models import Course, CourseCategory, Video
+
+TOKEN_RE = re.compile(r'\w+')
+MAX_TERMS = 8
+# Mark matches in FTS5 output; swapped for <mark> once the text is escaped.
+MATCH_START, MATCH_END = '\x02', '\x03'
+# SQLite's default limit on bound parameters is 999.
+BATCH_SIZE = 500
+
+
+def _highlighted(text):
+    return mark_safe(escape(text).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>'))
+
+
+def _terms(text):
+    return TOKEN_RE.findall(text.lower())[:MAX_TERMS]
+
+
+def _hit(kind, object_id, course_id, title, snippet):
+    return {'kind': kind, 'id': object_id, 'course_id': course_id, 'title': title, 'snippet': snippet}
+
+
+def _batches(ids):
+    ids = list(ids)
+    for i in range(0, len(ids), BATCH_SIZE):
+        yield ids[i:i + BATCH_SIZE]
+
+
+class FTS5Search:
+    """
+    One row per active course and per lecture of an active course. The
+    rowid encodes the object, ``2 * id`` for a course and ``2 * id + 1`` for
+    a lecture, so a row is replaced without looking it up first.
+    """
+    table = 'courses_search'
+    # BM25 weights of the title, body, course, category and trainer columns.
+    weights = (10.0, 1.0, 3.0, 4.0, 4.0)
+    snippet_tokens = 16
+    # BM25 costs a few microseconds for each matching row.
+    rank_limit = 2000
+
+    def _select(self, kind):
+        trainer = "trim(u.first_name || ' ' || u.last_name || ' ' || u.username)"
+        joins = (f'JOIN {CourseCategory._meta.db_table} cat ON cat.id = c.category_id '
+                 f'JOIN {get_user_model()._meta.db_table} u ON u.id = c.trainer_id')
+        if kind == 'course':
+            return (f"SELECT c.id * 2, c.title, c.description, '', cat.name, {trainer}, c.id "
+                    f'FROM {Course._meta.db_table} c {joins} WHERE c.is_active')
+        return (f'SELECT v.id * 2 + 1, v.title, v.description, c.title, cat.name, {trainer}, c.id '
+                f'FROM {Video._meta.db_table} v JOIN {Course._meta.db_table} c ON c.id = v.course_id {joins} '
+                f'WHERE c.is_active')
+
+    def _insert(self, cursor, kind, ids=None):
+        insert = f'INSERT INTO {self.table} (rowid, title, body, course, category, trainer, course_id) '
+        if ids is None:
+            cursor.execute(insert + self._select(kind))
+            return
+        alias = 'c' if kind == 'course' else 'v'
+        for batch in _batches(ids):
+            cursor.execute(f'{insert}{self._select(kind)} AND {alias}.id IN ({", ".join(["%s"] * len(batch))})',
+                           batch)
+
+    def _delete(self, cursor, rowids):
+        for batch in _batches(rowids):
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({", ".join(["%s"] * len(batch))})', batch)
+
+    def index(self, course_ids=(), video_ids=()):
+        """
+        Bring the rows of these courses (with all their lectures) and these
+        lectures up to date, dropping any that are gone or inactive.
+        """
+        course_ids = set(course_ids)
+        video_ids = set(video_ids)
+        if course_ids:
+            video_ids.update(Video.objects.filter(course_id__in=course_ids).values_list('id', flat=True))
+        with connection.cursor() as cursor:
+            self._delete(cursor, [2 * pk for pk in course_ids] + [2 * pk + 1 for pk in video_ids])
+            self._insert(cursor, 'course', course_ids)
+            self._insert(cursor, 'video', video_ids)
+
+    def remove(self, course_ids=(), video_ids=()):
+        with connection.cursor() as cursor:
+            self._delete(cursor, [2 * pk for pk in course_ids] + [2 * pk + 1 for pk in video_ids])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            self._insert(cursor, 'course')
+            self._insert(cursor, 'video')
+            # Merge the index into as few b-trees as possible for reads.
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+
+    def _expression(self, phrases, column):
+        expression = ' '.join(phrases)
+        return f'{column} : ({expression})' if column else expression
+
+    def _common(self, phrase, column):
+        # Stops counting at the limit, so even a word in every row is cheap.
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM (SELECT 1 FROM {self.table} WHERE {self.table} MATCH %s LIMIT %s)',
+                           [self._expression([phrase], column), self.rank_limit + 1])
+            return cursor.fetchone()[0] > self.rank_limit
+
+    def _match(self, phrases, limit, column=None, snippet_column=1, ranked=True):
+        """
+        Rank by BM25 on the phrases matching at most ``rank_limit`` rows.
+        Commoner words add next to nothing to a BM25 score, yet every row
+        they match would have to be scored; they only narrow the results
+        when no rarer word was given, and then the newest rows come first.
+        """
+        selective = [phrase for phrase in phrases if ranked and not self._common(phrase, column)]
+        if selective:
+            order = f'bm25({self.table}, {", ".join(str(weight) for weight in self.weights)})'
+        else:
+            order = 'rowid DESC'
+        sql = (f"SELECT rowid, course_id, highlight({self.table}, 0, %s, %s), "
+               f"snippet({self.table}, {snippet_column}, %s, %s, '…', {self.snippet_tokens}) "
+               f'FROM {self.table} WHERE {self.table} MATCH %s ORDER BY {order} LIMIT %s')
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [MATCH_START, MATCH_END, MATCH_START, MATCH_END,
+                                 self._expression(selective or phrases, column), limit])
+            rows = cursor.fetchall()
+        return [
+            _hit('video' if rowid % 2 else 'course', rowid // 2, course_id, _highlighted(title),
+                 _highlighted(snippet))
+            for rowid, course_id, title, snippet in rows
+        ]
+
+    def search(self, query, limit):
+        terms = _terms(query)
+        if not terms:
+            return []
+        return self._match([f'"{term}"' for term in terms], limit)
+
+    def suggest(self, prefix, limit):
+        # The last word may still be being typed. Expanding a long prefix
+        # means merging the lists of every word it starts, too slow to do
+        # once more for ranking, so suggestions are simply the newest titles.
+        terms = _terms(prefix)
+        if not terms or len(terms[-1]) < 2:
+            return []
+        phrases = [f'"{term}"' for term in terms]
+        phrases[-1] += '*'
+        return self._match(phrases, limit, column='title', snippet_column=0, ranked=False)
+
+
+class DatabaseSearch:
+    """
+    Substring matching through the ORM, for databases without FTS5. There
+    is nothing to keep in step, and results are unranked.
+    """
+
+    def index(self, course_ids=(), video_ids=()):
+        pass
+
+    def remove(self, course_ids=(), video_ids=()):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def _highlight(self, text, terms):
+        if not terms:
+            return escape(text)
+        pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+        return _highlighted(pattern.sub(lambda match: f'{MATCH_START}{match.group()}{MATCH_END}', text))
+
+    def _find(self, terms, fields, limit):
+        course_q = Q()
+        video_q = Q()
+        for term in terms:
+            course_q &= Q(*[Q(**{f'{field}__icontains': term}) for field in fields['course']], _connector=Q.OR)
+            video_q &= Q(*[Q(**{f'{field}__icontains': term}) for field in fields['video']], _connector=Q.OR)
+        courses = Course.objects.filter(course_q, is_active=True).order_by('id')[:limit]
+        videos = Video.objects.filter(video_q, course__is_active=True).order_by('id')[:limit]
+        hits = [_hit('course', course.id, course.id, course.title, course.description) for course in courses]
+        hits += [_hit('video', video.id, video.course_id, video.title, video.description) for video in videos]
+        return [
+            {**hit, 'title': self._highlight(hit['title'], terms), 'snippet': self._highlight(hit['snippet'][:200], terms)}
+            for hit in hits[:limit]
+        ]
+
+    def search(self, query, limit):
+        terms = _terms(query)
+        if not terms:
+            return []
+        people = ['trainer__first_name', 'trainer__last_name', 'trainer__username']
+        return self._find(terms, {
+            'course': ['title', 'description', 'category__name', *people],
+            'video': ['title', 'description', 'course__title', 'course__category__name',
+                      *[f'course__{field}' for field in people]],
+        }, limit)
+
+    def suggest(self, prefix, limit):
+        terms = _terms(prefix)
+        if not terms or len(terms[-1]) < 2:
+            return []
+        return self._find(terms, {'course': ['title'], 'video': ['title']}, limit)
+
+
+def search_backend():
+    return import_string(settings.SEARCH_BACKEND)()
+
+
+def search(query, limit=20):
+    """
+    Up to ``limit`` courses and lectures matching the words of ``query``,
+    best first, as dicts of kind ('course' or 'video'), id, course_id and
+    HTML-safe title and snippet with the matches in <mark>.
+    """
+    return search_backend().search(query, limit)
+
+
+def suggest(prefix, limit=8):
+    """
+    Titles starting with the words typed so far, for autocomplete.
+    """
+    return search_backend().suggest(prefix, limit)
@@ -0,0 +1,207 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version, bump_course_versions, forget_enrolled_course_ids
+from .models import Course, CourseCategory, Payment, Rating, StudentCourse, Video, VideoProgress
+from .progress import refresh_progress
+from .ratings import forget_rating, rating_course_id, rebuild_course_summaries, video_deleted, video_deleting
+from .revenue import apply_revenue_change, revenue_bucket
+from .search import search_backend
+
+# Saves that touch none of these fields leave the search index as it is.
+COURSE_SEARCH_FIELDS = {'title', 'description', 'category', 'trainer', 'is_active'}
+VIDEO_SEARCH_FIELDS = {'title', 'description', 'course'}
+TRAINER_SEARCH_FIELDS = {'first_name', 'last_name', 'username'}
+# Trainer fields shown on catalog cards, and on course pages.
+TRAINER_CATALOG_FIELDS = {'first_name', 'last_name', 'username'}
+TRAINER_PAGE_FIELDS = TRAINER_CATALOG_FIELDS | {'email', 'phone', 'skype_id'}
+
+
+@receiver(post_save, sender=StudentCourse)
+def enrollment_created(sender, instance, created, **kwargs):
+    if created:
+        refresh_progress(StudentCourse.objects.filter(pk=instance.pk))
+
+
+def _refresh_student_progress(progress):
+    # Joined on the video rather than loading it to learn its course.
+    refresh_progress(StudentCourse.objects.filter(student_id=progress.student_id, course__videos=progress.video_id))
+
+
+@receiver(post_save, sender=VideoProgress)
+def video_progress_saved(sender, instance, created, **kwargs):
+    if created and not instance.completed:
+        return
+    _refresh_student_progress(instance)
+
+
+@receiver(post_delete, sender=VideoProgress)
+def video_progress_removed(sender, instance, **kwargs):
+    if instance.completed:
+        _refresh_student_progress(instance)
+
+
+@receiver(pre_save, sender=Video)
+def video_saving(sender, instance, update_fields=None, **kwargs):
+    instance._previous_course_id = None
+    if instance.pk and _fields_changed(update_fields, {'course', 'course_id'}):
+        instance._previous_course_id = (
+            Video.objects.filter(pk=instance.pk).values_list('course_id', flat=True).first())
+
+
+def _video_course_ids(video):
+    """The video's course, and the one it just moved from, if any."""
+    previous = getattr(video, '_previous_course_id', None)
+    return {video.course_id, previous} - {None}
+
+
+@receiver(post_save, sender=Video)
+def video_saved(sender, instance, created, **kwargs):
+    course_ids = _video_course_ids(instance)
+    # A new video changes its course's totals; a moved one both courses'
+    # totals and completions.
+    if created or len(course_ids) > 1:
+        refresh_progress(StudentCourse.objects.filter(course_id__in=course_ids))
+    if len(course_ids) > 1:
+        # Its ratings count towards the new course now.
+        rebuild_course_summaries(course_ids)
+
+
+@receiver(pre_delete, sender=Video)
+def video_deleting_ratings(sender, instance, **kwargs):
+    # Sent before the pre_delete of the ratings that go with the video.
+    video_deleting(instance)
+
+
+@receiver(post_delete, sender=Video)
+def video_removed(sender, instance, **kwargs):
+    video_deleted(instance)
+    # Runs after the cascade has removed the video's progress rows, so the
+    # recount also drops completions of the deleted video.
+    refresh_progress(StudentCourse.objects.filter(course_id=instance.course_id))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Video)
+@receiver(post_delete, sender=Video)
+@receiver(post_save, sender=CourseCategory)
+@receiver(post_delete, sender=CourseCategory)
+def catalog_changed(sender, **kwargs):
+    # After commit, so no request caches the old rows under the new version.
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def trainer_saved(sender, instance, update_fields=None, **kwargs):
+    # A login only saves last_login.
+    if instance.user_type == 'trainer' and _fields_changed(update_fields, TRAINER_CATALOG_FIELDS):
+        transaction.on_commit(bump_catalog_version)
+
+
+def _bump_course_versions(course_ids):
+    course_ids = list(course_ids)
+    # After commit, so no page caches a fragment before the change is visible.
+    transaction.on_commit(lambda: bump_course_versions(course_ids))
+
+
+@receiver(post_save, sender=Course)
+def course_page_changed(sender, instance, **kwargs):
+    _bump_course_versions([instance.pk])
+
+
+@receiver(post_save, sender=Video)
+@receiver(post_delete, sender=Video)
+def course_video_changed(sender, instance, **kwargs):
+    _bump_course_versions(_video_course_ids(instance))
+
+
+@receiver(post_save, sender=CourseCategory)
+def course_category_changed(sender, instance, **kwargs):
+    _bump_course_versions(Course.objects.filter(category=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def course_trainer_changed(sender, instance, update_fields=None, **kwargs):
+    if instance.user_type == 'trainer' and _fields_changed(update_fields, TRAINER_PAGE_FIELDS):
+        _bump_course_versions(Course.objects.filter(trainer=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Rating)
+@receiver(pre_delete, sender=Rating)
+def course_rating_changed(sender, instance, **kwargs):
+    # Trainer ratings are not part of any cached fragment.
+    if instance.video_id:
+        _bump_course_versions([rating_course_id(instance)])
+
+
+@receiver(post_save, sender=StudentCourse)
+@receiver(post_delete, sender=StudentCourse)
+def enrollment_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: forget_enrolled_course_ids(instance.student_id))
+
+
+@receiver(pre_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    # pre_delete, because on a cascade from Video the video (and its course
+    # id) is already gone by the time post_delete is sent.
+    forget_rating(instance)
+
+
+@receiver(pre_save, sender=Payment)
+def payment_saving(sender, instance, **kwargs):
+    instance._revenue_bucket = None
+    if instance.pk:
+        instance._revenue_bucket = revenue_bucket(Payment.objects.filter(pk=instance.pk).only(
+            'created_at', 'course_id', 'payment_status', 'amount'
+        ).first())
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, **kwargs):
+    apply_revenue_change(getattr(instance, '_revenue_bucket', None), revenue_bucket(instance))
+
+
+@receiver(post_delete, sender=Payment)
+def payment_deleted(sender, instance, **kwargs):
+    apply_revenue_change(revenue_bucket(instance), None)
+
+
+def _fields_changed(update_fields, fields):
+    return update_fields is None or not fields.isdisjoint(update_fields)
+
+
+@receiver(post_save, sender=Course)
+def course_search_changed(sender, instance, update_fields=None, **kwargs):
+    if _fields_changed(update_fields, COURSE_SEARCH_FIELDS):
+        search_backend().index(course_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Video)
+def video_search_changed(sender, instance, update_fields=None, **kwargs):
+    if _fields_changed(update_fields, VIDEO_SEARCH_FIELDS):
+        search_backend().index(video_ids=[instance.pk])
+
+
+@receiver(post_save, sender=CourseCategory)
+def category_search_changed(sender, instance, **kwargs):
+    search_backend().index(course_ids=Course.objects.filter(category=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def trainer_search_changed(sender, instance, update_fields=None, **kwargs):
+    if instance.user_type == 'trainer' and _fields_changed(update_fields, TRAINER_SEARCH_FIELDS):
+        search_backend().index(course_ids=Course.objects.filter(trainer=instance).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Course)
+def course_search_removed(sender, instance, **kwargs):
+    # Its lectures go through video_search_removed as the delete cascades.
+    search_backend().remove(course_ids=[instance.pk])
+
+
+@receiver(post_delete, sender=Video)
+def video_search_removed(sender, instance, **kwargs):
+    search_backend().remove(video_ids=[instance.pk])
@@ -0,0 +1,30 @@
+"""
+Per-connection tuning for SQLite. configure_sqlite is connected to
+connection_created and runs SQLITE_PRAGMAS on every new connection, so
+readers don't block the writer (WAL, when SQLITE_WAL is set), a busy
+database is waited on rather than reported as locked, and hot pages stay
+in memory. Together with
+CONN_MAX_AGE a connection is set up once per thread, not once per request.
+"""
+import re
+
+from django.conf import settings
+
+PRAGMA_NAME_RE = re.compile(r'^[a-z_]+$')
+
+
+def pragma_statements(pragmas):
+    for name, value in pragmas.items():
+        if not PRAGMA_NAME_RE.match(name):
+            raise ValueError(f'Not a PRAGMA name: {name!r}')
+        if isinstance(value, str) and not PRAGMA_NAME_RE.match(value.lower()):
+            raise ValueError(f'Not a PRAGMA value: {value!r}')
+        yield f'PRAGMA {name} = {value}'
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(settings.SQLITE_PRAGMAS):
+            cursor.execute(statement)
@@ -0,0 +1,170 @@
+import mimetypes
+import os
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def file_etag(stat):
+    return f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    Return the (start, end) byte positions of a single-range ``Range`` header,
+    inclusive, or None when the header should be ignored and the whole file
+    served. Multi-range requests are answered with the whole file.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final N bytes.
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable
+    return start, min(end, size - 1)
+
+
+def _if_range_matches(request, etag, mtime):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    modified_since = parse_http_date_safe(if_range)
+    return modified_since is not None and int(mtime) <= modified_since
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return modified_since is not None and int(mtime) <= modified_since
+
+
+def _iter_file(path, start, length, chunk_size):
+    if not length:
+        return
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def _aiter_file(path, start, length, chunk_size):
+    # Reads run on worker threads; the event loop only relays the chunks.
+    if not length:
+        return
+    fd = await sync_to_async(os.open, thread_sensitive=False)(path, os.O_RDONLY)
+    try:
+        pread = sync_to_async(os.pread, thread_sensitive=False)
+        offset, end = start, start + length
+        while offset < end:
+            chunk = await pread(fd, min(chunk_size, end - offset), offset)
+            if not chunk:
+                break
+            offset += len(chunk)
+            yield chunk
+    finally:
+        os.close(fd)
+
+
+def _offload(response, path, media_name):
+    mode = settings.VIDEO_STREAM_OFFLOAD
+    if mode == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.VIDEO_STREAM_ACCEL_PREFIX + media_name
+    elif mode == 'x-sendfile':
+        response['X-Sendfile'] = path
+    else:
+        raise ValueError(f'Unknown VIDEO_STREAM_OFFLOAD mode: {mode}')
+    return response
+
+
+def stream_file(request, path, media_name, content_type=None):
+    """
+    Serve a file under MEDIA_ROOT with byte-range, ETag and Last-Modified
+    support, reading it in fixed-size chunks so memory use does not grow
+    with the file or the requested range. Under ASGI the body is an async
+    iterator, as Django reads a plain one into memory before sending it.
+    ``media_name`` is the path relative to MEDIA_ROOT, used for proxy offload.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = file_etag(stat)
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': 'private, max-age=3600',
+    }
+
+    if _not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    if settings.VIDEO_STREAM_OFFLOAD:
+        # The front proxy applies Range itself once it has the file.
+        response = HttpResponse(content_type=content_type)
+        for header, value in headers.items():
+            response[header] = value
+        return _offload(response, path, media_name)
+
+    byte_range = None
+    if _if_range_matches(request, etag, stat.st_mtime):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            response['Accept-Ranges'] = 'bytes'
+            return response
+
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        (start, end), status = byte_range, 206
+    length = end - start + 1 if size else 0
+
+    iter_file = _aiter_file if isinstance(request, ASGIRequest) else _iter_file
+    body = iter_file(path, start, 0 if request.method == 'HEAD' else length, settings.VIDEO_STREAM_CHUNK_SIZE)
+
+    response = StreamingHttpResponse(body, status=status, content_type=content_type)
+    for header, value in headers.items():
+        response[header] = value
+    response['Content-Length'] = str(length)
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
@@ -0,0 +1,154 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from .catalog import bump_catalog_version
+from .models import Course, CourseCategory, Payment, Rating, StudentCourse, Video, VideoProgress
+from .progress import refresh_progress
+from .ratings import rebuild_summaries
+from .revenue import rebuild_revenue
+from .search import search_backend
+
+CATEGORY_NAMES = [
+    'Programming', 'Data Science', 'Web Development', 'Design', 'Business',
+    'Marketing', 'Languages', 'Photography', 'Music', 'Personal Development',
+]
+PRICES = [Decimal('0'), Decimal('19.99'), Decimal('49.00'), Decimal('99.00'), Decimal('149.50')]
+PAYMENT_STATUSES = (['completed', 'pending', 'failed', 'refunded'], [85, 5, 7, 3])
+STAR_WEIGHTS = ([1, 2, 3, 4, 5], [1, 2, 5, 10, 12])
+
+
+def _ids(queryset, prefix):
+    return list(queryset.filter(username__startswith=prefix).order_by('id').values_list('id', flat=True))
+
+
+def generate_dataset(students=1000, trainers=20, courses=50, videos_per_course=10, enrollments_per_student=3,
+                     rating_chance=0.3, payment_days=365, prefix='synthetic', password=None,
+                     batch_size=5000, seed=None):
+    """
+    Bulk-insert a realistic dataset: one manager plus trainers, courses,
+    videos, students, their enrollments, watch progress, ratings and
+    payments. Signals do not fire for bulk_create, so the progress counters,
+    rating summaries, revenue rollups, search index and catalog version are
+    rebuilt at the end. Returns the number of rows created per model.
+    """
+    rng = random.Random(seed)
+    CustomUser = get_user_model()
+    # Hashing is deliberately slow; every generated user shares one hash.
+    password_hash = make_password(password)
+
+    CustomUser.objects.create(
+        username=f'{prefix}-manager', email=f'{prefix}-manager@example.com',
+        password=password_hash, user_type='manager',
+    )
+    CustomUser.objects.bulk_create(
+        (CustomUser(username=f'{prefix}-trainer-{i}', email=f'{prefix}-trainer-{i}@example.com',
+                    first_name='Trainer', last_name=str(i), password=password_hash, user_type='trainer')
+         for i in range(trainers)),
+        batch_size=batch_size,
+    )
+    trainer_ids = _ids(CustomUser.objects, f'{prefix}-trainer-')
+
+    category_ids = [
+        CourseCategory.objects.get_or_create(name=name)[0].id
+        for name in CATEGORY_NAMES[:max(1, min(courses, len(CATEGORY_NAMES)))]
+    ]
+
+    Course.objects.bulk_create(
+        (Course(title=f'{prefix} course {i}', description=f'Synthetic course {i}.',
+                category_id=rng.choice(category_ids), trainer_id=rng.choice(trainer_ids),
+                price=rng.choice(PRICES), duration=rng.randint(1, 40), is_active=rng.random() > 0.05)
+         for i in range(courses)),
+        batch_size=batch_size,
+    )
+    course_rows = list(
+        Course.objects.filter(title__startswith=f'{prefix} course ')
+        .order_by('id').values_list('id', 'trainer_id', 'price', 'is_active')
+    )
+
+    Video.objects.bulk_create(
+        (Video(course_id=course_id, title=f'Lesson {i + 1}', video_file=f'videos/{prefix}.mp4',
+               duration=rng.randint(3, 45), order=i)
+         for course_id, _, _, _ in course_rows for i in range(videos_per_course)),
+        batch_size=batch_size,
+    )
+    videos_by_course = {}
+    for video_id, course_id in (Video.objects.filter(course__title__startswith=f'{prefix} course ')
+                                .order_by('course_id', 'order').values_list('id', 'course_id')):
+        videos_by_course.setdefault(course_id, []).append(video_id)
+
+    CustomUser.objects.bulk_create(
+        (CustomUser(username=f'{prefix}-student-{i}', email=f'{prefix}-student-{i}@example.com',
+                    first_name='Student', last_name=str(i), password=password_hash, user_type='student')
+         for i in range(students)),
+        batch_size=batch_size,
+    )
+    student_ids = _ids(CustomUser.objects, f'{prefix}-student-')
+
+    active_courses = [row for row in course_rows if row[3]]
+    now = timezone.now()
+    enrollments, progress, ratings, payments = [], [], [], []
+    for student_id in student_ids:
+        rated_trainers = set()
+        for course_id, trainer_id, price, _ in rng.sample(active_courses, min(enrollments_per_student,
+                                                                             len(active_courses))):
+            course_videos = videos_by_course.get(course_id, [])
+            watched = rng.randint(0, len(course_videos))
+            enrollments.append(StudentCourse(
+                student_id=student_id, course_id=course_id,
+                completed=bool(course_videos) and watched == len(course_videos),
+            ))
+            for video_id in course_videos[:watched]:
+                progress.append(VideoProgress(student_id=student_id, video_id=video_id, completed=True,
+                                              watched_time=rng.randint(60, 2700)))
+                if rng.random() < rating_chance:
+                    ratings.append(Rating(student_id=student_id, video_id=video_id,
+                                          rating=rng.choices(*STAR_WEIGHTS)[0]))
+            if watched < len(course_videos):
+                progress.append(VideoProgress(student_id=student_id, video_id=course_videos[watched],
+                                              watched_time=rng.randint(0, 600)))
+            if trainer_id not in rated_trainers and rng.random() < rating_chance / 2:
+                rated_trainers.add(trainer_id)
+                ratings.append(Rating(student_id=student_id, trainer_id=trainer_id,
+                                      rating=rng.choices(*STAR_WEIGHTS)[0]))
+            if price:
+                payments.append(Payment(student_id=student_id, course_id=course_id, amount=price,
+                                        payment_status=rng.choices(*PAYMENT_STATUSES)[0]))
+
+    StudentCourse.objects.bulk_create(enrollments, batch_size=batch_size)
+    VideoProgress.objects.bulk_create(progress, batch_size=batch_size)
+    Rating.objects.bulk_create(ratings, batch_size=batch_size)
+    Payment.objects.bulk_create(payments, batch_size=batch_size)
+
+    generated_students = CustomUser.objects.filter(username__startswith=f'{prefix}-student-')
+    # created_at is auto_now_add, so spread payments over the past
+    # ``payment_days`` with one UPDATE per day afterwards.
+    if payments and payment_days:
+        by_day = {}
+        for payment_id in Payment.objects.filter(student__in=generated_students).values_list('id', flat=True):
+            by_day.setdefault(rng.randrange(payment_days), []).append(payment_id)
+        for days_back, ids in by_day.items():
+            created_at = now - timedelta(days=days_back, seconds=rng.randrange(86400))
+            for i in range(0, len(ids), 900):
+                Payment.objects.filter(pk__in=ids[i:i + 900]).update(created_at=created_at)
+
+    refresh_progress(StudentCourse.objects.filter(student__in=generated_students))
+    rebuild_summaries()
+    rebuild_revenue()
+    search_backend().rebuild()
+    bump_catalog_version()
+
+    return {
+        'users': 1 + len(trainer_ids) + len(student_ids),
+        'categories': len(category_ids),
+        'courses': len(course_rows),
+        'videos': sum(len(videos) for videos in videos_by_course.values()),
+        'enrollments': len(enrollments),
+        'progress': len(progress),
+        'ratings': len(ratings),
+        'payments': len(payments),
+    }
@@ -0,0 +1,55 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from courses.catalog import course_version
+from courses.metrics import registry
+
+register = template.Library()
+
+
+class CourseCacheNode(template.Node):
+    def __init__(self, nodelist, course_id, name, vary_on):
+        self.nodelist = nodelist
+        self.course_id = course_id
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        course_id = self.course_id.resolve(context)
+        name = self.name.resolve(context)
+        # A new version stamp leaves the old fragments to expire unread.
+        key = make_template_fragment_key(
+            f'course:{course_id}:{name}:{course_version(course_id)}',
+            [var.resolve(context) for var in self.vary_on],
+        )
+        value = cache.get(key)
+        registry.record_fragment(name, value is not None)
+        if value is None:
+            value = self.nodelist.render(context)
+            cache.set(key, value, settings.FRAGMENT_CACHE_TIMEOUT)
+        return value
+
+
+@register.tag
+def coursecache(parser, token):
+    """
+    Cache the enclosed part of a course page until the course changes:
+
+        {% coursecache course.id "content" is_enrolled %} ... {% endcoursecache %}
+
+    One copy is kept per combination of the values after the name, so keep
+    those to the few the fragment renders differently for, never the user.
+    """
+    nodelist = parser.parse(('endcoursecache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes a course id, a fragment name and values to vary on.")
+    return CourseCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
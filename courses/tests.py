@@ -1,3 +1,1324 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import pickle
+import re
+import shutil
+import struct
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import stripe
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import Resolver404, resolve, reverse
+from django.utils import timezone
+
+from . import fake_payments, jobs
+from .analytics import course_progress_report, student_progress_report
+from .catalog import active_catalog
+from .gateway import CircuitBreaker, GatewayUnavailable, PaymentGateway, PaymentGatewayError
+from .heartbeat import ProgressBuffer
+from .imports import StudentImport, read_csv, read_ndjson
+from .models import (
+    Course, CourseCategory, DailyRevenue, Job, Payment, Rating, RatingSummary, StudentCourse, Video, VideoProgress, VideoUpload,
+)
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_paginate
+from .payment_stub import StubProviderServer
+from .payments import confirm_checkout
+from .probing import ProbeError, _boxes, probe, probe_mp4
+from .progress import refresh_progress
+from .ratings import rebuild_summaries, save_rating
+from .replicas import WROTE_AT_SESSION_KEY, ReplicaRouter, read_from_replica, replica_heartbeat
+from .revenue import completed_revenue, rebuild_revenue, revenue_series
+from .search import search, suggest
+from .synthetic import generate_dataset
+from .uploads import UploadError, composite_checksum, finish_upload, parse_content_range, purge_stale_uploads
+
+# A table read from end to end: "SCAN t", or "SCAN TABLE t" before SQLite
+# 3.36. "SCAN t USING [COVERING] INDEX i" walks an index in order, which
+# LIMIT or a covering index keeps cheap.
+FULL_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+PLANNED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE')
+
+job_calls = []
+
+
+def stripe_signature(payload, timestamp=None):
+    return stripe.WebhookSignature.generate_signature_header(payload, 'whsec_test', timestamp=timestamp)
+
+
+def create_user(username, user_type='student', **fields):
+    return get_user_model().objects.create_user(username, f'{username}@example.com', 'password',
+                                                user_type=user_type, **fields)
+
+
+def create_course(title='Python Basics', trainer=None, price='49.00', **fields):
+    if trainer is None:
+        trainer = create_user(f'trainer-{Course.objects.count()}', 'trainer')
+    category, _ = CourseCategory.objects.get_or_create(name='Programming')
+    return Course.objects.create(title=title, description=f'About {title}.', category=category, trainer=trainer,
+                                 price=Decimal(price), duration=10, **fields)
+
+
+@jobs.task(queue='test', max_attempts=2, timeout=60)
+def record_call(value, fail=False):
+    job_calls.append(value)
+    if fail:
+        raise ValueError(value)
+
+
+def query_plan(sql):
+    """The detail column of EXPLAIN QUERY PLAN for ``sql``."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+@override_settings(QUERY_BUDGET_ACTION='raise')
+class QueryPlanTests(TestCase):
+    """
+    Runs the hot lookups against a generated dataset and fails when SQLite
+    plans a full table scan for any query they make, or a page goes over its
+    query budget or repeats a query. The plans are those of a database
+    without ANALYZE statistics, as in production.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_dataset(students=200, trainers=5, courses=20, videos_per_course=5, prefix='plan', seed=0)
+        CustomUser = get_user_model()
+        cls.manager = CustomUser.objects.get(username='plan-manager')
+        cls.enrollment = StudentCourse.objects.select_related('student', 'course').order_by('id').first()
+        cls.student = cls.enrollment.student
+        cls.course = cls.enrollment.course
+        cls.trainer = cls.course.trainer
+        cls.video = Video.objects.filter(course=cls.course).order_by('id').first()
+
+    def setUp(self):
+        cache.clear()
+
+    def assertNoFullScans(self, queries, allow=()):
+        """
+        ``allow`` names tables the lookup reads in full on purpose, such as
+        the course list of a report over every course.
+        """
+        scans = []
+        for query in queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith(PLANNED_STATEMENTS):
+                continue
+            for detail in query_plan(sql):
+                match = FULL_SCAN_RE.match(detail)
+                if match and match[1] not in allow:
+                    scans.append(f'{detail}\n    in {sql}')
+        if scans:
+            self.fail('Full table scans:\n' + '\n'.join(scans))
+
+    def get(self, user, name, *args, allow=(), expected=200, **query):
+        self.client.force_login(user)
+        # The middleware logs likely N+1s and raises over budget.
+        with CaptureQueriesContext(connection) as queries, self.assertNoLogs('courses.middleware', 'WARNING'):
+            response = self.client.get(reverse(name, args=args), query)
+        self.assertEqual(response.status_code, expected)
+        self.assertNoFullScans(queries, allow)
+
+    def test_student_pages(self):
+        self.get(self.student, 'dashboard')
+        self.get(self.student, 'course_detail', self.course.id)
+        self.get(self.student, 'watch_video', self.video.id)
+        # A completed payment redirects to the course.
+        self.get(self.student, 'payment_success', course_id=self.course.id, expected=302)
+
+    def test_progress_writes(self):
+        with CaptureQueriesContext(connection) as queries:
+            refresh_progress(StudentCourse.objects.filter(pk=self.enrollment.pk))
+            VideoProgress.objects.update_or_create(student=self.student, video=self.video,
+                                                   defaults={'completed': True})
+            buffer = ProgressBuffer(0, autostart=False)
+            buffer.add(self.student.id, self.video.id, 120)
+            buffer.flush()
+        self.assertNoFullScans(queries)
+
+    def test_trainer_pages(self):
+        self.get(self.trainer, 'dashboard')
+        self.get(self.trainer, 'trainer_dashboard')
+        self.get(self.trainer, 'course_students', self.course.id)
+        # A trainer's courses are picked out of the cached catalog.
+        self.get(self.student, 'trainer_details', self.trainer.id, allow=('courses_course',))
+
+    def test_catalog(self):
+        # Every active course, read once per catalog version.
+        self.get(self.student, 'course_list', allow=('courses_course',))
+
+    def test_manager_pages(self):
+        # trainer_id IS NULL on a NOT NULL column: SQLite reads no rows.
+        self.get(self.manager, 'manager_dashboard', allow=('courses_course',))
+        # The page lists every rating.
+        self.get(self.manager, 'student_feedbacks', allow=('courses_rating',))
+
+    def test_payment_filters(self):
+        filters = {
+            'status': 'completed',
+            'course': self.course.id,
+            'student': self.student.username,
+            'date_from': '2000-01-01',
+            'date_to': '2100-01-01',
+        }
+        # The course filter's drop-down lists every course.
+        allow = ('courses_course',)
+        self.get(self.manager, 'manage_payments', allow=allow)
+        for name, value in filters.items():
+            self.get(self.manager, 'manage_payments', allow=allow, **{name: value})
+        self.get(self.manager, 'manage_payments', allow=allow, **filters)
+        self.get(self.manager, 'manage_payments', allow=allow, status='completed', course=self.course.id,
+                 student=self.student.username)
+
+    def test_progress_reports(self):
+        CustomUser = get_user_model()
+        with CaptureQueriesContext(connection) as queries:
+            student_progress_report(CustomUser.objects.filter(user_type='student'))
+            course_progress_report(Course.objects.select_related('category', 'trainer'))
+        # Both reports cover every course.
+        self.assertNoFullScans(queries, allow=('courses_course',))
+
+
+@override_settings(JOBS_IMMEDIATE=[], JOBS_RETRY_BACKOFF=5)
+class JobTests(TestCase):
+    def setUp(self):
+        job_calls.clear()
+
+    def test_enqueue_runs_immediately_only_for_listed_queues(self):
+        with self.captureOnCommitCallbacks(execute=True), self.settings(JOBS_IMMEDIATE=['mail']):
+            self.assertIsNotNone(record_call.enqueue(1))
+            self.assertIsNone(record_call.enqueue(2, queue='mail'))
+        self.assertEqual(job_calls, [2])
+        self.assertEqual(Job.objects.get().queue, 'test')
+
+    def test_claim_order_and_exclusivity(self):
+        later = record_call.enqueue('later', delay=60)
+        low = record_call.enqueue('low')
+        high = record_call.enqueue('high', priority=5)
+        other = record_call.enqueue('other', queue='other')
+        now = timezone.now()
+
+        first = jobs.claim(['test'], 'w1', now=now)
+        self.assertEqual(first.pk, high.pk)
+        self.assertEqual((first.status, first.attempts, first.locked_by), ('running', 1, 'w1'))
+        self.assertEqual(jobs.claim(['test'], 'w2', now=now).pk, low.pk)
+        # Not due yet, and another queue.
+        self.assertIsNone(jobs.claim(['test'], 'w3', now=now))
+        self.assertEqual(jobs.claim([], 'w3', now=now).pk, other.pk)
+        self.assertEqual(jobs.claim([], 'w3', now=now + timedelta(seconds=60)).pk, later.pk)
+
+    def test_claim_loses_to_a_concurrent_worker(self):
+        job = record_call.enqueue('once')
+        candidate = [(job.pk, job.status, job.attempts, job.timeout)]
+        self.assertIsNotNone(jobs._take(candidate, 'w1', timezone.now()))
+        # The same stale candidate no longer matches the row.
+        self.assertIsNone(jobs._take(candidate, 'w2', timezone.now()))
+
+    def test_success_deletes_the_job(self):
+        record_call.enqueue('ok')
+        job = jobs.claim(['test'], 'w1')
+        self.assertTrue(jobs.run(job, 'w1'))
+        self.assertEqual(job_calls, ['ok'])
+        self.assertFalse(Job.objects.exists())
+
+    def test_failure_backs_off_then_fails(self):
+        record_call.enqueue('bad', fail=True)
+        job = jobs.claim(['test'], 'w1')
+        with mock.patch('courses.jobs.random.uniform', return_value=5.0) as uniform, \
+                self.assertLogs('courses.jobs', 'WARNING'):
+            started = timezone.now()
+            self.assertFalse(jobs.run(job, 'w1'))
+        uniform.assert_called_once_with(0, 5)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), ('queued', ''))
+        self.assertIn('ValueError', job.last_error)
+        self.assertGreaterEqual(job.run_at, started + timedelta(seconds=5))
+
+        job = jobs.claim(['test'], 'w1', now=job.run_at)
+        self.assertEqual(job.attempts, 2)
+        with self.assertLogs('courses.jobs', 'WARNING'):
+            jobs.run(job, 'w1')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNone(jobs.claim(['test'], 'w1', now=timezone.now() + timedelta(days=1)))
+
+    def test_retry_delay_doubles(self):
+        with mock.patch('courses.jobs.random.uniform', side_effect=lambda low, high: high):
+            self.assertEqual([jobs.retry_delay(n) for n in (1, 2, 3)], [5, 10, 20])
+
+    def test_abandoned_job_is_reclaimed_then_failed(self):
+        record_call.enqueue('slow')
+        job = jobs.claim(['test'], 'w1')
+        expired = job.locked_until + timedelta(seconds=1)
+        # The first worker went quiet: another takes the job over.
+        job = jobs.claim(['test'], 'w2', now=expired)
+        self.assertEqual((job.locked_by, job.attempts), ('w2', 2))
+        # The first worker's late result is ignored.
+        self.assertTrue(jobs.run(Job(pk=job.pk, name=job.name, args=job.args, kwargs=job.kwargs), 'w1'))
+        self.assertTrue(Job.objects.filter(pk=job.pk).exists())
+
+        self.assertEqual(jobs.fail_abandoned(now=job.locked_until), 0)
+        self.assertEqual(jobs.fail_abandoned(now=job.locked_until + timedelta(seconds=1)), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), ('failed', ''))
+
+
+@override_settings(PAYMENT_PROVIDER='fake', STRIPE_WEBHOOK_SECRET='whsec_test', STRIPE_WEBHOOK_TOLERANCE=300)
+class PaymentWebhookTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_user('student')
+        cls.course = create_course()
+
+    def setUp(self):
+        self.payment = Payment.objects.create(student=self.student, course=self.course, amount=self.course.price,
+                                              stripe_session_id='cs_fake_0123456789abcdef01234567')
+
+    def post(self, payload, signature=None):
+        headers = {} if signature is None else {'HTTP_STRIPE_SIGNATURE': signature}
+        return self.client.post(reverse('payment_webhook'), payload, content_type='application/json', **headers)
+
+    def deliver(self, event):
+        return self.post(*fake_payments.signed_payload(event))
+
+    def assertPending(self):
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.payment_status, 'pending')
+        self.assertFalse(StudentCourse.objects.exists())
+
+    def test_completed_event_enrolls(self):
+        self.assertEqual(self.deliver(fake_payments.checkout_event(self.payment)).status_code, 200)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.payment_status, 'completed')
+        self.assertTrue(self.payment.stripe_payment_intent_id.startswith('pi_fake_'))
+        self.assertTrue(StudentCourse.objects.filter(student=self.student, course=self.course).exists())
+
+    def test_missing_or_bad_signature(self):
+        payload, signature = fake_payments.signed_payload(fake_payments.checkout_event(self.payment))
+        self.assertEqual(self.post(payload).status_code, 400)
+        self.assertEqual(self.post(payload, 'garbage').status_code, 400)
+        self.assertEqual(self.post(payload.replace('"paid"', '"unpaid"'), signature).status_code, 400)
+        with self.settings(STRIPE_WEBHOOK_SECRET='whsec_other'):
+            self.assertEqual(self.post(payload, signature).status_code, 400)
+        self.assertPending()
+
+    def test_replayed_event_outside_tolerance(self):
+        payload = json.dumps(fake_payments.checkout_event(self.payment))
+        stale = stripe_signature(payload, timestamp=int(time.time()) - 301)
+        self.assertEqual(self.post(payload, stale).status_code, 400)
+        self.assertPending()
+
+    def test_duplicate_events_change_nothing(self):
+        event = fake_payments.checkout_event(self.payment)
+        self.deliver(event)
+        self.payment.refresh_from_db()
+        updated_at = self.payment.updated_at
+        # Redelivered, and a late failure for the same session.
+        self.assertEqual(self.deliver(event).status_code, 200)
+        failed = fake_payments.checkout_event(self.payment, 'checkout.session.async_payment_failed', paid=False)
+        self.assertEqual(self.deliver(failed).status_code, 200)
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.payment_status, self.payment.updated_at), ('completed', updated_at))
+        self.assertEqual(StudentCourse.objects.count(), 1)
+
+    def test_confirm_checkout_is_idempotent(self):
+        session = fake_payments.checkout_event(self.payment)['data']['object']
+        first = confirm_checkout(session)
+        with self.assertNumQueries(3):
+            # The locked lookup only, inside its savepoint.
+            second = confirm_checkout(dict(session, payment_intent='pi_other'))
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(second.stripe_payment_intent_id, first.stripe_payment_intent_id)
+        self.assertEqual(StudentCourse.objects.count(), 1)
+
+    def test_unknown_session_and_malformed_event(self):
+        event = fake_payments.checkout_event(self.payment)
+        event['data']['object']['id'] = 'cs_fake_unknown'
+        self.assertEqual(self.deliver(event).status_code, 404)
+        self.assertEqual(self.deliver({'type': 'checkout.session.completed'}).status_code, 400)
+        self.assertPending()
+
+    def test_unpaid_completion_waits(self):
+        event = fake_payments.checkout_event(self.payment, paid=False)
+        self.assertEqual(self.deliver(event).status_code, 200)
+        self.assertPending()
+
+    def test_no_secret(self):
+        payload, signature = fake_payments.signed_payload(fake_payments.checkout_event(self.payment))
+        with self.settings(STRIPE_WEBHOOK_SECRET='', PAYMENT_PROVIDER='stripe'), \
+                self.assertLogs('courses.views', 'ERROR'):
+            self.assertEqual(self.post(payload, signature).status_code, 503)
+        self.assertPending()
+
+    def test_fake_provider_works_without_a_secret(self):
+        self.client.force_login(self.student)
+        url = reverse('fake_checkout', args=[self.payment.stripe_session_id])
+        with self.settings(STRIPE_WEBHOOK_SECRET='', FAKE_PAYMENT_WEBHOOK_DELAY=None):
+            response = self.client.post(url, {'outcome': 'pay'})
+        self.assertEqual(response.status_code, 302)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.payment_status, 'completed')
+
+
+class MediaAccessTests(TestCase):
+    def test_media_is_not_served_directly(self):
+        for path in ('/media/videos/lecture.mp4', '/media/hls/1/index.m3u8', '/media/uploads/1.part'):
+            with self.assertRaises(Resolver404):
+                resolve(path)
+
+    def test_stream_requires_enrollment(self):
+        course = create_course()
+        video = Video.objects.create(course=course, title='Intro', description='', video_file='videos/intro.mp4',
+                                     duration=60, order=1)
+        self.client.force_login(create_user('outsider'))
+        self.assertEqual(self.client.get(reverse('stream_video', args=[video.id])).status_code, 403)
+
+
+class ProgressBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_user('viewer')
+        course = create_course()
+        cls.videos = [Video.objects.create(course=course, title=f'Part {n}', description='', duration=600, order=n)
+                      for n in (1, 2)]
+
+    def progress(self, video):
+        return VideoProgress.objects.get(student=self.student, video=video)
+
+    def test_coalesces_latest_and_furthest(self):
+        buffer = ProgressBuffer(0, autostart=False)
+        first, second = self.videos
+        for position in (30, 240, 90):
+            buffer.add(self.student.id, first.id, position)
+        buffer.add(self.student.id, second.id, 15)
+        self.assertEqual(len(buffer), 2)
+        with self.assertNumQueries(4):
+            # Read, bulk_create, in a transaction's savepoint pair.
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(len(buffer), 0)
+        progress = self.progress(first)
+        self.assertEqual((progress.last_position, progress.watched_time), (90, 240))
+
+        # A rewind on an existing row moves the resume point only.
+        buffer.add(self.student.id, first.id, 10)
+        buffer.add(self.student.id, second.id, 45)
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.flush(), 0)
+        progress = self.progress(first)
+        self.assertEqual((progress.last_position, progress.watched_time), (10, 240))
+        progress = self.progress(second)
+        self.assertEqual((progress.last_position, progress.watched_time), (45, 45))
+
+    def test_failed_flush_keeps_positions(self):
+        buffer = ProgressBuffer(0, autostart=False)
+        video = self.videos[0]
+        buffer.add(self.student.id, video.id, 300)
+        buffer.add(self.student.id, video.id, 200)
+
+        def fail(pending):
+            # A heartbeat arrives while the write is failing.
+            buffer.add(self.student.id, video.id, 120)
+            raise RuntimeError('database is locked')
+
+        with mock.patch.object(buffer, '_write', side_effect=fail), self.assertRaises(RuntimeError):
+            buffer.flush()
+        self.assertEqual(buffer._pending, {(self.student.id, video.id): (120, 300)})
+        buffer.flush()
+        progress = self.progress(video)
+        self.assertEqual((progress.last_position, progress.watched_time), (120, 300))
+
+    def test_heartbeat_endpoint(self):
+        other = create_course('Other')
+        outside = Video.objects.create(course=other, title='Elsewhere', description='', duration=60, order=1)
+        StudentCourse.objects.create(student=self.student, course=self.videos[0].course)
+        self.client.force_login(self.student)
+        url = reverse('progress_heartbeat')
+        updates = [{'video': self.videos[0].id, 'position': 42}, {'video': outside.id, 'position': 5}]
+        with mock.patch('courses.views.progress_buffer', ProgressBuffer(0, autostart=False)) as buffer:
+            response = self.client.post(url, {'updates': updates}, content_type='application/json')
+            self.assertEqual(response.json(), {'accepted': [self.videos[0].id]})
+            self.assertEqual(buffer._pending, {(self.student.id, self.videos[0].id): (42, 42)})
+        response = self.client.post(url, {'updates': 'nope'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class RatingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_user('rater')
+        cls.course = create_course()
+        cls.trainer = cls.course.trainer
+        cls.video = Video.objects.create(course=cls.course, title='Intro', description='', duration=60, order=1)
+
+    def summary(self, key):
+        summary = RatingSummary.objects.get(key=key)
+        return [summary.rating_count, summary.rating_sum] + [getattr(summary, f'stars_{n}') for n in range(1, 6)]
+
+    def assertMatchesRebuild(self):
+        def counted():
+            summaries = {summary.key: self.summary(summary.key) for summary in RatingSummary.objects.all()}
+            return {key: value for key, value in summaries.items() if value[0]}
+        kept = counted()
+        rebuild_summaries()
+        self.assertEqual(kept, counted())
+
+    def test_rating_again_updates_in_place(self):
+        rating, created = save_rating(self.student, 2, 'meh', video=self.video)
+        self.assertTrue(created)
+        rating, created = save_rating(self.student, 5, 'better now', video=self.video)
+        self.assertFalse(created)
+        self.assertEqual(Rating.objects.get().comment, 'better now')
+        for key in (f'video:{self.video.id}', f'course:{self.course.id}', 'video:*'):
+            self.assertEqual(self.summary(key), [1, 5, 0, 0, 0, 0, 1])
+        save_rating(self.student, 4, '', trainer=self.trainer)
+        save_rating(self.student, 4, 'same stars', trainer=self.trainer)
+        self.assertEqual(self.summary(f'trainer:{self.trainer.id}'), [1, 4, 0, 0, 0, 1, 0])
+        self.assertMatchesRebuild()
+
+    def test_delete_and_invalid_values(self):
+        rating, _ = save_rating(self.student, 3, '', video=self.video)
+        with self.assertRaises(ValueError):
+            save_rating(self.student, 6, '', video=self.video)
+        rating.delete()
+        self.assertEqual(self.summary(f'course:{self.course.id}'), [0, 0, 0, 0, 0, 0, 0])
+
+    def test_video_moved_to_another_course(self):
+        other = create_course('Other', trainer=self.trainer)
+        save_rating(self.student, 4, '', video=self.video)
+        self.video.course = other
+        self.video.save()
+        self.assertEqual(self.summary(f'course:{self.course.id}'), [0, 0, 0, 0, 0, 0, 0])
+        self.assertEqual(self.summary(f'course:{other.id}'), [1, 4, 0, 0, 0, 1, 0])
+        self.assertMatchesRebuild()
+
+    def test_deleting_ratings_reads_no_video_rows(self):
+        students = [self.student, create_user('second'), create_user('third')]
+        for student in students:
+            save_rating(student, 4, '', video=self.video)
+        with CaptureQueriesContext(connection) as queries:
+            Rating.objects.filter(student=students[0]).get().delete()
+        lookups = [query['sql'] for query in queries if 'FROM "courses_video"' in query['sql']]
+        self.assertEqual(len(lookups), 1)
+        self.assertTrue(lookups[0].startswith('SELECT "courses_video"."course_id"'))
+
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            self.video.delete()
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT "courses_video"')])
+        self.assertEqual(self.summary('video:*'), [0, 0, 0, 0, 0, 0, 0])
+        self.assertEqual(self.summary(f'course:{self.course.id}'), [0, 0, 0, 0, 0, 0, 0])
+
+    def test_rate_views_reject_bad_values(self):
+        self.client.force_login(self.student)
+        for value in ('0', '6', '2.5', 'five', ''):
+            response = self.client.post(reverse('rate_video', args=[self.video.id]), {'rating': value})
+            self.assertEqual(response.status_code, 400)
+            response = self.client.post(reverse('rate_trainer', args=[self.trainer.id]), {'rating': value})
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Rating.objects.exists())
+        response = self.client.post(reverse('rate_video', args=[self.video.id]), {'rating': '5'})
+        self.assertRedirects(response, reverse('watch_video', args=[self.video.id]), fetch_redirect_response=False)
+        self.assertEqual(self.summary(f'video:{self.video.id}')[:2], [1, 5])
+
+
+@override_settings(VIDEO_UPLOAD_CHUNK_SIZE=4, HLS_AUTO_PACKAGE=False, MEDIA_PROBERS=[])
+class VideoUploadTests(TestCase):
+    content = b'0123456789'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = create_course()
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = self.settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.client.force_login(self.course.trainer)
+
+    def start(self, size=len(content)):
+        response = self.client.post(reverse('start_video_upload', args=[self.course.id]),
+                                    {'filename': 'lecture one.mp4', 'size': size}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return VideoUpload.objects.get(id=response.json()['id'])
+
+    def put(self, upload, start, end, data=None, checksum=None):
+        data = self.content[start:end + 1] if data is None else data
+        return self.client.put(
+            reverse('video_upload', args=[upload.id]), data, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{upload.size}',
+            HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(data).hexdigest(),
+        )
+
+    def checksum(self, content=content):
+        return composite_checksum(hashlib.sha256(content[i:i + 4]).hexdigest() for i in range(0, len(content), 4))
+
+    def test_content_range(self):
+        upload = VideoUpload(size=10, chunk_size=4)
+        self.assertEqual(parse_content_range('bytes 0-3/10', upload), (0, 0, 4))
+        self.assertEqual(parse_content_range('bytes 8-9/10', upload), (2, 8, 2))
+        for header in (None, 'bytes=0-3', 'bytes 0-3/*', 'bytes 2-5/10', 'bytes 0-3/11', 'bytes 0-2/10',
+                       'bytes 4-9/10', 'bytes 12-15/10'):
+            with self.assertRaises(UploadError, msg=header):
+                parse_content_range(header, upload)
+
+    def test_out_of_order_and_repeated_chunks(self):
+        upload = self.start()
+        for start, end in ((8, 9), (0, 3), (0, 3), (4, 7)):
+            self.assertEqual(self.put(upload, start, end).status_code, 200)
+        state = self.client.get(reverse('video_upload', args=[upload.id])).json()
+        self.assertEqual(state['received'], [0, 1, 2])
+
+        response = self.client.post(reverse('complete_video_upload', args=[upload.id]),
+                                    {'title': 'One', 'order': 1, 'duration': 60, 'sha256': self.checksum()},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        video = Video.objects.get(id=response.json()['video'])
+        self.assertEqual(video.video_file.name, 'videos/lecture_one.mp4')
+        with open(video.video_file.path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertFalse(VideoUpload.objects.exists())
+        self.assertFalse(os.path.exists(upload.path))
+
+    def test_same_filename_twice(self):
+        names = set()
+        for order in (1, 2):
+            upload = self.start()
+            for start in (0, 4, 8):
+                self.put(upload, start, min(start + 3, 9))
+            names.add(finish_upload(upload, self.checksum(), title='One', description='', order=order,
+                                     duration=60).video_file.name)
+        self.assertEqual(len(names), 2)
+
+    def test_checksum_mismatch(self):
+        upload = self.start()
+        response = self.put(upload, 0, 3, checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(upload.chunks.count(), 0)
+        # A chunk that was good, then resent corrupted, is dropped.
+        self.put(upload, 4, 7)
+        self.assertEqual(self.put(upload, 4, 7, data=b'XXXX', checksum='0' * 64).status_code, 400)
+        self.assertEqual(upload.chunks.count(), 0)
+        # Short bodies are refused too.
+        self.assertEqual(self.put(upload, 0, 3, data=b'012').status_code, 400)
+
+    def test_finish_checks_chunks_and_checksum(self):
+        upload = self.start()
+        self.put(upload, 0, 3)
+        self.put(upload, 4, 7)
+        with self.assertRaisesMessage(UploadError, '1 chunks have not been received'):
+            finish_upload(upload, self.checksum(), title='One', description='', order=1)
+        self.put(upload, 8, 9)
+        with self.assertRaisesMessage(UploadError, 'Checksum does not match'):
+            finish_upload(upload, self.checksum(b'0123456789'[::-1]), title='One', description='', order=1)
+        self.assertTrue(os.path.exists(upload.path))
+        self.assertFalse(Video.objects.exists())
+
+    def test_purge_spares_uploads_still_receiving_chunks(self):
+        active, idle = self.start(), self.start()
+        long_ago = timezone.now() - timedelta(days=2)
+        VideoUpload.objects.update(created_at=long_ago, updated_at=long_ago)
+        self.put(active, 0, 3)
+        self.assertEqual(purge_stale_uploads(max_age=60 * 60), 1)
+        self.assertEqual(list(VideoUpload.objects.values_list('id', flat=True)), [active.id])
+        self.assertTrue(os.path.exists(active.path))
+        self.assertFalse(os.path.exists(idle.path))
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = create_user('manager', 'manager')
+        course = create_course('=HYPERLINK("http://evil.example")')
+        for n, name in enumerate(['-2+3', '@SUM(A1)', 'plain', '+1'], start=1):
+            student = create_user(f'student{n}')
+            StudentCourse.objects.create(student=student, course=course)
+            Rating.objects.create(student=student, trainer=course.trainer, rating=n, comment=name)
+
+    def export(self, name, **query):
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse('export_data', args=[name]), query)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, list(response.streaming_content)
+
+    def test_csv_cells_never_start_a_formula(self):
+        response, chunks = self.export('ratings')
+        rows = list(csv.reader(b''.join(chunks).decode().splitlines()))
+        self.assertEqual([row[-1] for row in rows[1:]], ["'-2+3", "'@SUM(A1)", 'plain', "'+1"])
+        _, chunks = self.export('enrollments')
+        rows = list(csv.reader(b''.join(chunks).decode().splitlines()))
+        self.assertEqual({row[3] for row in rows[1:]}, {'\'=HYPERLINK("http://evil.example")'})
+
+    def test_ndjson_keeps_values(self):
+        response, chunks = self.export('ratings', format='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual([row['comment'] for row in rows], ['-2+3', '@SUM(A1)', 'plain', '+1'])
+
+    @override_settings(EXPORT_CHUNK_BYTES=64)
+    def test_streams_gzipped_chunks(self):
+        response, chunks = self.export('enrollments', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="enrollments.csv.gz"')
+        self.assertGreater(len(chunks), 1)
+        rows = list(csv.reader(gzip.decompress(b''.join(chunks)).decode().splitlines()))
+        self.assertEqual(rows[0][:4], ['id', 'enrolled_at', 'course_id', 'course'])
+        self.assertEqual(len(rows), 5)
+
+    def test_managers_only(self):
+        self.client.force_login(create_user('nosy'))
+        self.assertEqual(self.client.get(reverse('export_data', args=['payments'])).status_code, 302)
+
+
+class CatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_snapshot_leaves_out_private_trainer_fields(self):
+        course = create_course()
+        trainer = course.trainer
+        create_course('Second', trainer=trainer)
+        self.assertEqual([course.title for course in active_catalog()], ['Python Basics', 'Second'])
+        cached = pickle.dumps(active_catalog())
+        self.assertNotIn(trainer.password.encode(), cached)
+        self.assertNotIn(trainer.email.encode(), cached)
+
+        self.client.force_login(create_user('browser'))
+        with self.assertNumQueries(3):
+            # Session, user and enrolled ids: the snapshot is cached and
+            # renders without loading deferred fields.
+            response = self.client.get(reverse('course_list'))
+        self.assertContains(response, trainer.username)
+
+
+class PaymentGatewayTests(SimpleTestCase):
+    """Runs the gateway against the local provider stub."""
+    params = {'mode': 'payment', 'success_url': 'http://testserver/done/?session_id={CHECKOUT_SESSION_ID}'}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = StubProviderServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.shutdown()
+        cls.stub.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.stub.latency = 0
+        self.stub.failure_rate = 0
+        self.stub.failure_status = 500
+        self.stub.requests = 0
+        self.stub.idempotency_keys.clear()
+
+    def gateway(self, **options):
+        options = {'retries': 2, 'backoff': 0, 'deadline': 5, 'failure_threshold': 5, 'reset_timeout': 30,
+                   **options}
+        return PaymentGateway('sk_test_stub', api_base=self.stub.url, **options)
+
+    def test_creates_a_session(self):
+        session = self.gateway().create_checkout_session(self.params)
+        self.assertTrue(session.id.startswith('cs_stub_'))
+        self.assertEqual(session.url, f'http://testserver/done/?session_id={session.id}')
+        self.assertEqual(self.stub.requests, 1)
+
+    def test_retries_under_one_idempotency_key(self):
+        self.stub.failure_rate = 1
+        gateway = self.gateway()
+        with self.assertRaises(GatewayUnavailable), self.assertLogs('courses.gateway', 'WARNING'):
+            gateway.create_checkout_session(self.params)
+        self.assertEqual(self.stub.requests, 3)
+        self.assertEqual(list(self.stub.idempotency_keys.values()), [3])
+        self.assertEqual(gateway.breaker.failures, 3)
+
+    def test_client_errors_are_not_retried(self):
+        self.stub.failure_rate = 1
+        self.stub.failure_status = 400
+        gateway = self.gateway()
+        with self.assertRaises(PaymentGatewayError) as raised:
+            gateway.create_checkout_session(self.params)
+        self.assertNotIsInstance(raised.exception, GatewayUnavailable)
+        self.assertEqual(self.stub.requests, 1)
+        # The provider answered, so it is up.
+        self.assertEqual(gateway.breaker.failures, 0)
+
+    def test_deadline_caps_a_slow_provider(self):
+        self.stub.latency = 2
+        gateway = self.gateway(read_timeout=5, deadline=0.5)
+        started = time.monotonic()
+        with self.assertRaises(GatewayUnavailable), self.assertLogs('courses.gateway', 'WARNING'):
+            gateway.create_checkout_session(self.params)
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual(self.stub.requests, 1)
+
+    def test_circuit_opens_then_recovers(self):
+        self.stub.failure_rate = 1
+        gateway = self.gateway(retries=0, failure_threshold=2, reset_timeout=0.2)
+        with self.assertLogs('courses.gateway', 'WARNING'):
+            for _ in range(2):
+                with self.assertRaises(GatewayUnavailable):
+                    gateway.create_checkout_session(self.params)
+        self.assertEqual(gateway.breaker.state, 'open')
+        with self.assertRaisesMessage(GatewayUnavailable, 'circuit is open'):
+            gateway.create_checkout_session(self.params)
+        self.assertEqual(self.stub.requests, 2)
+
+        time.sleep(0.25)
+        self.assertEqual(gateway.breaker.state, 'half-open')
+        # A failed trial opens the circuit again straight away.
+        with self.assertRaises(GatewayUnavailable), self.assertLogs('courses.gateway', 'WARNING'):
+            gateway.create_checkout_session(self.params)
+        self.assertEqual(gateway.breaker.state, 'open')
+
+        time.sleep(0.25)
+        self.stub.failure_rate = 0
+        gateway.create_checkout_session(self.params)
+        self.assertEqual(gateway.breaker.state, 'closed')
+
+    def test_half_open_admits_one_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        with self.assertLogs('courses.gateway', 'WARNING'):
+            breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.release_trial()
+        self.assertTrue(breaker.allow())
+
+    def test_trial_is_released_when_the_call_is_interrupted(self):
+        gateway = self.gateway(failure_threshold=1, reset_timeout=0)
+        with self.assertLogs('courses.gateway', 'WARNING'):
+            gateway.breaker.record_failure()
+
+        def interrupted(params, options):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            gateway.call('test', interrupted, {})
+        self.assertFalse(gateway.breaker.trial_running)
+        gateway.create_checkout_session(self.params)
+        self.assertEqual(gateway.breaker.state, 'closed')
+
+    def test_async_calls(self):
+        self.stub.failure_rate = 1
+        gateway = self.gateway(retries=1)
+        with self.assertRaises(GatewayUnavailable), self.assertLogs('courses.gateway', 'WARNING'):
+            asyncio.run(gateway.acreate_checkout_session(self.params))
+        self.assertEqual(list(self.stub.idempotency_keys.values()), [2])
+        self.stub.failure_rate = 0
+        # A new event loop each time, as a WSGI server runs async views.
+        for _ in range(2):
+            session = asyncio.run(gateway.acreate_checkout_session(self.params))
+            self.assertTrue(session.id.startswith('cs_stub_'))
+
+
+def mp4_box(box_type, *children, large=False):
+    payload = b''.join(children)
+    if large:
+        return struct.pack('>I4sQ', 1, box_type, 16 + len(payload)) + payload
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def mp4_track(handler, codec, width=0, height=0):
+    sample_entry = struct.pack('>I4s', 16, codec) + bytes(8)
+    return mp4_box(
+        b'trak',
+        mp4_box(b'tkhd', bytes(76), struct.pack('>II', width << 16, height << 16)),
+        mp4_box(b'mdia', mp4_box(b'hdlr', bytes(8), handler, bytes(12)), mp4_box(
+            b'minf', mp4_box(b'stbl', mp4_box(b'stsd', bytes(4), struct.pack('>I', 1), sample_entry)),
+        )),
+    )
+
+
+def mp4_movie(timescale=1000, duration=90_000, version=0):
+    if version == 1:
+        times = struct.pack('>QQIQ', 0, 0, timescale, duration)
+    else:
+        times = struct.pack('>IIII', 0, 0, timescale, duration)
+    return mp4_box(
+        b'moov',
+        mp4_box(b'mvhd', bytes([version, 0, 0, 0]), times, bytes(80)),
+        mp4_track(b'vide', b'avc1', 1280, 720),
+        mp4_track(b'soun', b'mp4a'),
+    )
+
+
+class ProbingTests(SimpleTestCase):
+    def write(self, *boxes):
+        fd, path = tempfile.mkstemp(suffix='.mp4')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b''.join(boxes))
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_moov_first(self):
+        path = self.write(mp4_box(b'ftyp', b'isom', bytes(4)), mp4_movie(), mp4_box(b'mdat', bytes(1000)))
+        info = probe_mp4(path)
+        self.assertEqual(info, {
+            'duration': 90.0, 'width': 1280, 'height': 720, 'bitrate': int(os.path.getsize(path) * 8 / 90),
+            'video_codec': 'h264', 'audio_codec': 'aac',
+        })
+
+    def test_moov_after_large_mdat(self):
+        # A 64-bit mdat ahead of the moov box, and a version 1 mvhd.
+        path = self.write(mp4_box(b'ftyp', b'isom', bytes(4)), mp4_box(b'mdat', bytes(4096), large=True),
+                          mp4_movie(timescale=600, duration=600 * 3600, version=1))
+        info = probe_mp4(path)
+        self.assertEqual((info['duration'], info['width'], info['video_codec']), (3600.0, 1280, 'h264'))
+
+    def test_box_sizes(self):
+        data = mp4_box(b'free', bytes(4), large=True) + mp4_box(b'skip', bytes(2))
+        self.assertEqual(list(_boxes(data, 0, len(data))), [(b'free', 16, 20), (b'skip', 28, 30)])
+        # Size 0 runs to the end of the parent.
+        data = struct.pack('>I4s', 0, b'mdat') + bytes(10)
+        self.assertEqual(list(_boxes(data, 0, len(data))), [(b'mdat', 8, 18)])
+        for data in (struct.pack('>I4s', 1, b'mdat') + bytes(4), struct.pack('>I4s', 4, b'free'),
+                     mp4_box(b'free', bytes(8))[:12]):
+            with self.assertRaises(ProbeError):
+                list(_boxes(data, 0, len(data)))
+
+    def test_truncated_file(self):
+        whole = mp4_box(b'ftyp', b'isom', bytes(4)) + mp4_box(b'mdat', bytes(100)) + mp4_movie()
+        for cut in (len(whole) - 40, 60):
+            path = self.write(whole[:cut])
+            with self.assertRaises(ProbeError):
+                probe_mp4(path)
+            with self.settings(MEDIA_PROBERS=['courses.probing.probe_mp4']), \
+                    self.assertLogs('courses.probing', 'WARNING'):
+                self.assertIsNone(probe(path))
+
+    def test_other_formats(self):
+        self.assertIsNone(probe_mp4(self.write(b'RIFF\x00\x00\x00\x00WEBPVP8 ')))
+        self.assertIsNone(probe_mp4(self.write(b'tiny')))
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        student = create_user('payer')
+        course = create_course()
+        payments = [Payment.objects.create(student=student, course=course, amount=course.price) for _ in range(7)]
+        # Three rows share a timestamp, so only the id orders them.
+        base = timezone.now().replace(microsecond=123456)
+        stamps = [base, base + timedelta(seconds=1), base + timedelta(seconds=1), base + timedelta(seconds=1),
+                  base + timedelta(seconds=2), base + timedelta(seconds=3), base + timedelta(seconds=3)]
+        for payment, stamp in zip(payments, stamps):
+            Payment.objects.filter(pk=payment.pk).update(created_at=stamp)
+        cls.newest_first = list(Payment.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_cursor_round_trip(self):
+        created_at = timezone.now().replace(microsecond=1)
+        self.assertEqual(decode_cursor(encode_cursor(created_at, 42)), (created_at, 42))
+        self.assertNotIn('=', encode_cursor(created_at, 42))
+        for cursor in ('', 'not base64!', encode_cursor(created_at, 42)[:-3], 'MjAyNnwx'):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
+
+    def test_pages_forward_and_back_through_ties(self):
+        queryset = Payment.objects.all()
+        pages, page = [], keyset_paginate(queryset, 2)
+        self.assertFalse(page.has_previous)
+        while True:
+            pages.append([payment.id for payment in page])
+            if not page.has_next:
+                break
+            page = keyset_paginate(queryset, 2, after=page.next_cursor)
+        self.assertEqual(sum(pages, []), self.newest_first)
+        self.assertEqual([len(ids) for ids in pages], [2, 2, 2, 1])
+
+        back = []
+        while page.has_previous:
+            page = keyset_paginate(queryset, 2, before=page.previous_cursor)
+            back.append([payment.id for payment in page])
+        self.assertEqual(back, pages[-2::-1])
+
+    def test_empty(self):
+        page = keyset_paginate(Payment.objects.none(), 2)
+        self.assertEqual((len(page), page.has_next, page.has_previous), (0, False, False))
+
+
+class RevenueRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_user('payer')
+        cls.course = create_course(price='49.00')
+        cls.other = create_course('Other', price='10.00')
+
+    def rollups(self):
+        return {
+            (row.day, row.course_id, row.status): (row.payment_count, row.amount)
+            for row in DailyRevenue.objects.all() if row.payment_count
+        }
+
+    def assertInStep(self):
+        kept = self.rollups()
+        rebuild_revenue()
+        self.assertEqual(kept, self.rollups())
+
+    def pay(self, course, status='completed', amount=None):
+        return Payment.objects.create(student=self.student, course=course, amount=amount or course.price,
+                                      payment_status=status)
+
+    def test_rollups_follow_payment_changes(self):
+        first = self.pay(self.course)
+        second = self.pay(self.course, status='pending')
+        self.pay(self.other)
+        self.assertEqual(completed_revenue(), Decimal('59.00'))
+        self.assertInStep()
+
+        second.payment_status = 'completed'
+        second.save()
+        self.assertEqual(completed_revenue(), Decimal('108.00'))
+        self.assertInStep()
+
+        first.amount = Decimal('39.00')
+        first.save()
+        self.assertEqual(completed_revenue(), Decimal('98.00'))
+        self.assertInStep()
+
+        second.delete()
+        self.assertEqual(completed_revenue(), Decimal('49.00'))
+        self.assertInStep()
+
+        # A course deleted with its payments takes its rollups along.
+        self.other.delete()
+        self.assertEqual(completed_revenue(), Decimal('39.00'))
+        self.assertInStep()
+
+    def test_series(self):
+        payment = self.pay(self.course)
+        Payment.objects.filter(pk=payment.pk).update(created_at=timezone.now() - timedelta(days=1))
+        self.pay(self.course)
+        self.pay(self.course, status='failed')
+        rebuild_revenue()
+        series = revenue_series()
+        self.assertEqual({period: len(buckets) for period, buckets in series.items()},
+                         {'day': 30, 'week': 12, 'month': 12})
+        self.assertEqual([bucket['amount'] for bucket in series['day'][-2:]], [Decimal('49.00')] * 2)
+        self.assertEqual(series['day'][-1]['percent'], 100)
+        self.assertEqual(sum(bucket['payments'] for bucket in series['month']), 2)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class StudentImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = create_course()
+        cls.other = create_course('Other')
+
+    def run_import(self, text, reader=read_csv, batch_size=500):
+        importer = StudentImport(batch_size=batch_size, processes=1)
+        importer.run(reader(io.StringIO(text)))
+        return importer
+
+    def test_creates_and_enrolls(self):
+        stored = make_password('kept-as-is')
+        importer = self.run_import(
+            'username,email,password,password_hash,courses\n'
+            f'ann,ann@example.com,Correct-Horse-9,,{self.course.id}\n'
+            f'bob,bob@example.com,,{stored},{self.course.id}; {self.other.id}\n'
+            'cy,cy@example.com,,,\n'
+        )
+        self.assertEqual(importer.errors, [])
+        self.assertEqual((importer.users_created, importer.enrollments_created), (3, 3))
+        CustomUser = get_user_model()
+        self.assertTrue(CustomUser.objects.get(username='ann').check_password('Correct-Horse-9'))
+        self.assertEqual(CustomUser.objects.get(username='bob').password, stored)
+        self.assertFalse(CustomUser.objects.get(username='cy').has_usable_password())
+        enrollment = StudentCourse.objects.get(student__username='ann')
+        self.assertEqual(enrollment.total_videos, 0)
+
+    def test_validation_errors(self):
+        importer = self.run_import(
+            'username,email,password,password_hash,courses\n'
+            'ok,ok@example.com,,,\n'
+            ',nobody@example.com,,,\n'
+            'bad,not-an-email,,,\n'
+            'ok,again@example.com,,,\n'
+            'weak,weak@example.com,123,,\n'
+            'hashy,hashy@example.com,,plaintext,\n'
+            f'lost,lost@example.com,,,{self.course.id};999;x\n'
+        )
+        errors = dict(importer.errors)
+        self.assertEqual(sorted(errors), [2, 3, 4, 5, 6, 7])
+        self.assertIn('username: This field is required.', errors[2])
+        self.assertIn('email:', errors[3])
+        self.assertIn('appears earlier in the file', errors[4])
+        self.assertIn('password:', errors[5])
+        self.assertIn('password_hash:', errors[6])
+        self.assertIn("No course with id 999", errors[7])
+        self.assertIn("No course with id None", errors[7])
+        self.assertEqual(importer.users_created, 1)
+        self.assertFalse(get_user_model().objects.filter(username='lost').exists())
+
+        importer = self.run_import('{"username": "nd", "email": "nd@example.com", "courses": [%d]}\n\n'
+                                   '[1, 2]\n{oops\n' % self.course.id, read_ndjson)
+        self.assertEqual([number for number, _ in importer.errors], [3, 4])
+        self.assertEqual(importer.enrollments_created, 1)
+
+    def test_existing_usernames(self):
+        trainer = self.course.trainer
+        student = create_user('known')
+        StudentCourse.objects.create(student=student, course=self.course)
+        importer = self.run_import(
+            'username,email,courses\n'
+            f'{trainer.username},t@example.com,{self.other.id}\n'
+            f'known,k@example.com,{self.course.id};{self.other.id}\n'
+        )
+        self.assertEqual(importer.errors, [(1, f'username: {trainer.username} belongs to a trainer.')])
+        self.assertEqual((importer.users_created, importer.users_existing, importer.enrollments_created),
+                         (0, 1, 1))
+        self.assertFalse(StudentCourse.objects.filter(student=trainer).exists())
+        trainer.refresh_from_db()
+        self.assertEqual((trainer.user_type, trainer.email), ('trainer', f'{trainer.username}@example.com'))
+
+    def test_command_resumes_from_its_checkpoint(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'students.csv')
+        with open(path, 'w') as f:
+            f.write('username,email\n' + ''.join(f's{n},s{n}@example.com\n' for n in range(1, 6)))
+        checkpoint = f'{path}.checkpoint'
+        write = StudentImport.write
+
+        def crash_on_third_batch(importer, batch, hashed, on_batch):
+            if batch[0][0] == 3:
+                raise RuntimeError('killed')
+            write(importer, batch, hashed, on_batch)
+
+        with mock.patch.object(StudentImport, 'write', crash_on_third_batch), self.assertRaises(RuntimeError):
+            call_command('import_students', path, batch_size=1, processes=1, stdout=io.StringIO())
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f), {'record': 2})
+
+        out = io.StringIO()
+        call_command('import_students', path, batch_size=2, processes=1, stdout=out)
+        self.assertIn('Resuming after record 2.', out.getvalue())
+        self.assertIn('3 students created', out.getvalue())
+        self.assertEqual(get_user_model().objects.filter(username__startswith='s').count(), 5)
+        self.assertFalse(os.path.exists(checkpoint))
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.reads = []
+
+        @read_from_replica
+        def view(request):
+            self.reads.append(ReplicaRouter().db_for_read(Course))
+            return HttpResponse()
+
+        self.view = view
+
+    def visit(self, method='get', beat_age=0, session=None):
+        request = getattr(self.factory, method)('/')
+        request.session = {} if session is None else session
+        beat_at = timezone.now() - timedelta(seconds=beat_age)
+        with mock.patch('courses.replicas.replica_heartbeat', return_value=beat_at):
+            self.view(request)
+        return self.reads[-1]
+
+    def test_the_test_mirror_is_the_primary(self):
+        self.assertIsNone(replica_heartbeat())
+        self.view(self.factory.get('/'))
+        self.assertEqual(self.reads, [None])
+
+    @override_settings(REPLICA_MAX_LAG=60)
+    def test_a_lagging_replica_falls_back_to_the_primary(self):
+        self.assertEqual(self.visit(beat_age=30), 'replica')
+        self.assertIsNone(self.visit(beat_age=90))
+        self.assertIsNone(self.visit('head', beat_age=90))
+        # Only reads of GET and HEAD requests leave the primary.
+        self.assertIsNone(self.visit('post'))
+        # Writes go to the primary whatever the view read from.
+        self.assertEqual(ReplicaRouter().db_for_write(Course), 'default')
+        self.assertFalse(ReplicaRouter().allow_migrate('replica', 'courses'))
+
+    def test_a_write_pins_the_session_until_the_replica_catches_up(self):
+        session = {}
+        self.visit('post', session=session)
+        wrote_at = session[WROTE_AT_SESSION_KEY]
+        # A snapshot taken before the write doesn't have it.
+        self.assertIsNone(self.visit(beat_age=time.time() - wrote_at + 1, session=session))
+        self.assertIn(WROTE_AT_SESSION_KEY, session)
+        # Another session reads from the replica meanwhile.
+        self.assertEqual(self.visit(beat_age=1), 'replica')
+        # Once a later snapshot arrives, the pin is dropped.
+        self.assertEqual(self.visit(beat_age=-1, session=session), 'replica')
+        self.assertNotIn(WROTE_AT_SESSION_KEY, session)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        trainer = create_user('ada', 'trainer', first_name='Ada', last_name='Lovelace')
+        cls.course = create_course('Django <b>Forms</b>', trainer)
+        cls.course.description = 'Forms, "validation" AND widgets.'
+        cls.course.save()
+        cls.video = Video.objects.create(course=cls.course, title='Formsets', description='Many forms at once.',
+                                         video_file='videos/formsets.mp4', duration=60)
+        create_course('Hidden forms', trainer, is_active=False)
+
+    def hits(self, query, backend='courses.search.FTS5Search'):
+        with self.settings(SEARCH_BACKEND=backend):
+            return [(hit['kind'], hit['id']) for hit in search(query)]
+
+    def test_queries_are_words_not_fts_syntax(self):
+        for query in ['forms AND', '"forms', 'forms*', '(forms', '^forms', 'forms:', '-validation forms']:
+            with self.subTest(query=query):
+                self.assertIn(('course', self.course.id), self.hits(query))
+        # Operators are words like any other, which every hit must contain.
+        self.assertEqual(self.hits('forms OR nothing'), [])
+        self.assertEqual(self.hits('NEAR(forms widgets)'), [])
+        self.assertEqual(self.hits('*"()'), [])
+
+    def test_matches_are_highlighted_in_escaped_text(self):
+        for backend in ['courses.search.FTS5Search', 'courses.search.DatabaseSearch']:
+            with self.subTest(backend=backend), self.settings(SEARCH_BACKEND=backend):
+                hit = next(hit for hit in search('forms') if hit['kind'] == 'course')
+                self.assertEqual(hit['title'], 'Django &lt;b&gt;<mark>Forms</mark>&lt;/b&gt;')
+                self.assertIn('<mark>Forms</mark>, &quot;validation&quot;', hit['snippet'])
+
+    def test_index_follows_the_courses(self):
+        self.assertEqual(self.hits('lovelace formsets'), [('video', self.video.id)])
+        self.assertEqual(self.hits('formsets', 'courses.search.DatabaseSearch'), [('video', self.video.id)])
+        self.course.is_active = False
+        self.course.save()
+        self.assertEqual(self.hits('forms'), [])
+        hidden = Course.objects.get(title='Hidden forms')
+        hidden.is_active = True
+        hidden.save()
+        self.assertEqual(self.hits('hidden'), [('course', hidden.id)])
+        hidden.delete()
+        self.assertEqual(self.hits('hidden'), [])
+
+    def test_suggestions_expand_the_last_word(self):
+        with self.settings(SEARCH_BACKEND='courses.search.FTS5Search'):
+            self.assertEqual([hit['kind'] for hit in suggest('djan')], ['course'])
+            self.assertEqual(suggest('f'), [])
+        self.client.force_login(self.course.trainer)
+        response = self.client.get(reverse('search_suggest'), {'q': 'formse'})
+        self.assertEqual(response.json()['suggestions'],
+                         [{'kind': 'video', 'title': '<mark>Formsets</mark>',
+                           'url': reverse('course_detail', args=[self.course.id])}])
+
+
+class CourseFragmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = create_course()
+        cls.student = create_user('sam')
+        cls.video = Video.objects.create(course=cls.course, title='Variables', video_file='videos/variables.mp4',
+                                         duration=60)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.student)
+
+    def page(self):
+        return self.client.get(reverse('course_detail', args=[self.course.id])).content.decode()
+
+    def test_fragments_are_cached_until_the_course_changes(self):
+        self.assertIn('Variables', self.page())
+        # Writes that skip the signals don't reach the cached page.
+        Video.objects.filter(pk=self.video.pk).update(title='Loops')
+        self.assertNotIn('Loops', self.page())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Video.objects.create(course=self.course, title='Functions', video_file='videos/functions.mp4',
+                                 duration=60)
+        page = self.page()
+        self.assertIn('Loops', page)
+        self.assertIn('Functions', page)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.video.delete()
+        self.assertNotIn('Loops', self.page())
+
+    def test_changes_wait_for_the_commit(self):
+        self.page()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.course.trainer.first_name = 'Grace'
+            self.course.trainer.save()
+        self.assertNotIn('Grace', self.page())
+        for callback in callbacks:
+            callback()
+        self.assertIn('Grace', self.page())
+
+    def test_enrolling_shows_the_enrolled_copy(self):
+        self.assertIn('Enroll to access', self.page())
+        with self.captureOnCommitCallbacks(execute=True):
+            StudentCourse.objects.create(student=self.student, course=self.course)
+        page = self.page()
+        self.assertNotIn('Enroll to access', page)
+        self.assertIn(reverse('watch_video', args=[self.video.id]), page)
+        # Students not enrolled still share the other copy.
+        self.client.force_login(create_user('kim'))
+        self.assertIn('Enroll to access', self.page())
+
+
+class ProgressReportTests(TestCase):
+    def test_enrollments_are_listed_in_enrollment_order(self):
+        second, first = create_course('Algebra'), create_course('Zoology')
+        student = create_user('sam')
+        for course in [first, second]:
+            StudentCourse.objects.create(student=student, course=course)
+        students = get_user_model().objects.filter(user_type='student')
+        [row] = student_progress_report(students)
+        self.assertEqual([enrollment.course for enrollment in row['enrollments']], [first, second])
+        self.assertEqual(row['total_enrollments'], 2)
+
+
+class ProgressCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = create_course()
+        cls.student = create_user('sam')
+        cls.videos = [
+            Video.objects.create(course=cls.course, title=f'Part {n}', video_file=f'videos/{n}.mp4', duration=60)
+            for n in range(2)
+        ]
+        cls.enrollment = StudentCourse.objects.create(student=cls.student, course=cls.course)
+
+    def counters(self):
+        self.enrollment.refresh_from_db()
+        return (self.enrollment.completed_videos, self.enrollment.total_videos,
+                self.enrollment.progress_percentage, self.enrollment.completed)
+
+    def test_completed_follows_the_counters(self):
+        self.assertEqual(self.counters(), (0, 2, 0, False))
+        for video in self.videos:
+            VideoProgress.objects.create(student=self.student, video=video, completed=True)
+        self.assertEqual(self.counters(), (2, 2, 100, True))
+        # A new lecture leaves the course unfinished again.
+        extra = Video.objects.create(course=self.course, title='Part 3', video_file='videos/3.mp4', duration=60)
+        self.assertEqual(self.counters()[1:], (3, 2 / 3 * 100, False))
+        extra.delete()
+        self.assertEqual(self.counters(), (2, 2, 100, True))
+
+    def test_a_course_without_videos_is_not_completed(self):
+        for video in self.videos:
+            video.delete()
+        StudentCourse.objects.filter(pk=self.enrollment.pk).update(completed=True)
+        refresh_progress(StudentCourse.objects.filter(pk=self.enrollment.pk))
+        self.assertEqual(self.counters(), (0, 0, 0, False))
@@ -0,0 +1,146 @@
+import logging
+import os
+import shutil
+import subprocess
+
+from django.conf import settings
+
+from .jobs import task
+from .models import Video
+
+logger = logging.getLogger(__name__)
+
+HLS_DIR = 'hls'
+MASTER_PLAYLIST = 'master.m3u8'
+
+
+class PackagingError(Exception):
+    pass
+
+
+def hls_media_dir(video):
+    return os.path.join(HLS_DIR, str(video.id))
+
+
+def _source_height(path):
+    ffprobe = shutil.which(settings.HLS_FFPROBE_BINARY)
+    if not ffprobe:
+        return None
+    result = subprocess.run(
+        [ffprobe, '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=height', '-of', 'csv=p=0', path],
+        capture_output=True, text=True, timeout=60,
+    )
+    try:
+        return int(result.stdout.strip().splitlines()[0])
+    except (IndexError, ValueError):
+        return None
+
+
+def _ladder(source_height):
+    renditions = sorted(settings.HLS_RENDITIONS, key=lambda rendition: rendition['height'])
+    if source_height:
+        # Never upscale; always keep at least the smallest rung.
+        fitting = [rendition for rendition in renditions if rendition['height'] <= source_height]
+        renditions = fitting or renditions[:1]
+    return renditions
+
+
+def _encode_rendition(ffmpeg, source, out_dir, rendition):
+    name = rendition['name']
+    video_bitrate = rendition['video_bitrate']
+    command = [
+        ffmpeg, '-y', '-hide_banner', '-loglevel', 'error',
+        '-i', source,
+        '-vf', f"scale=-2:{rendition['height']}",
+        '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'main',
+        '-b:v', f'{video_bitrate}k', '-maxrate', f'{int(video_bitrate * 1.07)}k', '-bufsize', f'{video_bitrate * 2}k',
+        '-g', str(settings.HLS_SEGMENT_SECONDS * 30), '-sc_threshold', '0',
+        '-c:a', 'aac', '-b:a', f"{rendition['audio_bitrate']}k", '-ac', '2',
+        '-f', 'hls',
+        '-hls_time', str(settings.HLS_SEGMENT_SECONDS),
+        '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(out_dir, f'{name}_%05d.ts'),
+        os.path.join(out_dir, f'{name}.m3u8'),
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise PackagingError(f'{name}: {result.stderr.strip()[-1000:]}')
+
+    return {
+        'name': name,
+        'height': rendition['height'],
+        'bandwidth': (video_bitrate + rendition['audio_bitrate']) * 1000,
+        'playlist': f'{name}.m3u8',
+    }
+
+
+def _write_master(out_dir, renditions):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for rendition in renditions:
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={rendition['bandwidth']},NAME=\"{rendition['name']}\"")
+        lines.append(rendition['playlist'])
+    with open(os.path.join(out_dir, MASTER_PLAYLIST), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def package_hls(video):
+    """
+    Encode the uploaded file of ``video`` into the configured HLS ladder and
+    write a master playlist under MEDIA_ROOT/hls/<video id>/. The previous
+    packaging, if any, is only replaced once every rendition has succeeded.
+    """
+    Video.objects.filter(pk=video.pk).update(hls_status='processing', hls_error='')
+
+    try:
+        ffmpeg = shutil.which(settings.HLS_FFMPEG_BINARY)
+        if not ffmpeg:
+            raise PackagingError(f'Encoder not found: {settings.HLS_FFMPEG_BINARY}')
+        if not video.video_file:
+            raise PackagingError('Video has no uploaded file.')
+
+        source = video.video_file.path
+        media_dir = hls_media_dir(video)
+        final_dir = os.path.join(settings.MEDIA_ROOT, media_dir)
+        work_dir = final_dir + '.tmp'
+        shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir)
+
+        try:
+            renditions = [
+                _encode_rendition(ffmpeg, source, work_dir, rendition)
+                for rendition in _ladder(video.height or _source_height(source))
+            ]
+            _write_master(work_dir, renditions)
+        except BaseException:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            raise
+
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.rename(work_dir, final_dir)
+    except (PackagingError, OSError, subprocess.SubprocessError) as e:
+        logger.warning('HLS packaging failed for video %s: %s', video.pk, e)
+        Video.objects.filter(pk=video.pk).update(hls_status='failed', hls_error=str(e))
+        return False
+
+    Video.objects.filter(pk=video.pk).update(
+        hls_status='ready',
+        hls_playlist=os.path.join(media_dir, MASTER_PLAYLIST),
+        hls_renditions=renditions,
+        hls_error='',
+    )
+    return True
+
+
+@task(queue='video', max_attempts=2, timeout=6 * 60 * 60)
+def package_video(video_id):
+    video = Video.objects.filter(pk=video_id).first()
+    if video is not None:
+        package_hls(video)
+
+
+def schedule_packaging(video):
+    Video.objects.filter(pk=video.pk).update(hls_status='pending')
+    if settings.HLS_AUTO_PACKAGE:
+        # Queued with the caller's transaction; a `run_jobs --queue video`
+        # worker picks it up.
+        package_video.enqueue(video.pk)
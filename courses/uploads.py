@@ -0,0 +1,173 @@
+import hashlib
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .models import UploadChunk, Video, VideoUpload
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+def start_upload(course, trainer, filename, size):
+    if not 0 < size <= settings.VIDEO_UPLOAD_MAX_SIZE:
+        raise UploadError(f'Size must be between 1 and {settings.VIDEO_UPLOAD_MAX_SIZE} bytes.')
+    upload = VideoUpload.objects.create(
+        course=course, trainer=trainer, filename=os.path.basename(filename)[:255], size=size,
+        chunk_size=settings.VIDEO_UPLOAD_CHUNK_SIZE,
+    )
+    os.makedirs(os.path.dirname(upload.path), exist_ok=True)
+    # A sparse file of the final size, so chunks can land in any order.
+    with open(upload.path, 'wb') as f:
+        f.truncate(size)
+    return upload
+
+
+def parse_content_range(header, upload):
+    """
+    The chunk index a ``Content-Range: bytes start-end/size`` header covers.
+    Chunks must start on a chunk boundary and be exactly one chunk long,
+    except the last.
+    """
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise UploadError('Expected a "Content-Range: bytes <start>-<end>/<size>" header.')
+    start, end, total = map(int, match.groups())
+    index = start // upload.chunk_size
+    if total != upload.size or start % upload.chunk_size or index >= upload.chunk_count:
+        raise UploadError('Content-Range does not match a chunk of this upload.')
+    if end != min(start + upload.chunk_size, upload.size) - 1:
+        raise UploadError(f'Chunks must be {upload.chunk_size} bytes, except the last.')
+    return index, start, end - start + 1
+
+
+def write_chunk(upload, content_range, stream, checksum):
+    """
+    Copy one chunk from the request stream to its offset in the upload file
+    with constant memory, hashing as it goes. Different chunks can be
+    written concurrently; resending a chunk overwrites it.
+    """
+    index, offset, length = parse_content_range(content_range, upload)
+    digest = hashlib.sha256()
+    written = 0
+    fd = os.open(upload.path, os.O_WRONLY)
+    try:
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            os.pwrite(fd, data, offset + written)
+            digest.update(data)
+            written += len(data)
+    finally:
+        os.close(fd)
+
+    error = None
+    if written != length or stream.read(1):
+        error = f'Expected {length} bytes for chunk {index}.'
+    elif digest.hexdigest() != (checksum or '').lower():
+        error = f'Checksum mismatch for chunk {index}.'
+    if error:
+        # Whatever this chunk held before has been overwritten.
+        UploadChunk.objects.filter(upload=upload, index=index).delete()
+        raise UploadError(error)
+    # One upsert statement, so parallel chunks never read-then-write.
+    UploadChunk.objects.bulk_create(
+        [UploadChunk(upload=upload, index=index, sha256=digest.hexdigest())],
+        update_conflicts=True, unique_fields=['upload', 'index'], update_fields=['sha256'],
+    )
+    # Keeps an upload that is still receiving chunks from being purged.
+    VideoUpload.objects.filter(pk=upload.pk).update(updated_at=timezone.now())
+    return index
+
+
+def received_chunks(upload):
+    return sorted(upload.chunks.values_list('index', flat=True))
+
+
+def composite_checksum(digests):
+    """
+    The whole-upload checksum: SHA-256 over the chunks' binary SHA-256
+    digests in order. Clients compute it chunk by chunk, so neither side has
+    to hash a multi-gigabyte file in one go.
+    """
+    return hashlib.sha256(b''.join(bytes.fromhex(digest) for digest in digests)).hexdigest()
+
+
+def finish_upload(upload, checksum, **fields):
+    """
+    Check that every chunk arrived and the checksum matches, then move the
+    file into place and create the Video from ``fields``.
+    """
+    with transaction.atomic():
+        upload = VideoUpload.objects.select_for_update().get(pk=upload.pk)
+        digests = dict(upload.chunks.values_list('index', 'sha256'))
+        missing = [index for index in range(upload.chunk_count) if index not in digests]
+        if missing:
+            raise UploadError(f'{len(missing)} chunks have not been received.')
+        if composite_checksum(digests[index] for index in range(upload.chunk_count)) != (checksum or '').lower():
+            raise UploadError('Checksum does not match the received chunks.')
+
+        name = _claim_storage_name(os.path.join('videos', get_valid_filename(upload.filename)))
+        destination = default_storage.path(name)
+        try:
+            video = Video.objects.create(course_id=upload.course_id, video_file=name, **fields)
+            path = upload.path
+            upload.delete()
+            # A rename on the same filesystem, whatever the size, over the
+            # empty file that holds the name.
+            os.replace(path, destination)
+        except BaseException:
+            os.remove(destination)
+            raise
+    return video
+
+
+def _claim_storage_name(name):
+    """
+    A free storage name based on ``name``, held by an empty file created
+    with O_EXCL, so two uploads finishing with the same filename can't both
+    pick it.
+    """
+    while True:
+        name = default_storage.get_available_name(name)
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+        except FileExistsError:
+            continue
+        return name
+
+
+def abort_upload(upload):
+    path = upload.path
+    upload.delete()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def purge_stale_uploads(max_age=None):
+    """
+    Remove the uploads that received no chunk for ``max_age`` seconds
+    (VIDEO_UPLOAD_EXPIRY by default).
+    """
+    max_age = settings.VIDEO_UPLOAD_EXPIRY if max_age is None else max_age
+    stale = VideoUpload.objects.filter(updated_at__lt=timezone.now() - timedelta(seconds=max_age))
+    count = 0
+    for upload in stale:
+        abort_upload(upload)
+        count += 1
+    return count
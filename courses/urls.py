@@ -4,10 +4,14 @@ from . import views
 urlpatterns = [
 
     path('', views.course_list, name='course_list'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
     path('<int:course_id>/', views.course_detail, name='course_detail'),
     path('<int:course_id>/enroll/', views.enroll_course, name='enroll_course'),
     path('video/<int:video_id>/', views.watch_video, name='watch_video'),
+    path('video/<int:video_id>/stream/', views.stream_video, name='stream_video'),
+    path('video/<int:video_id>/hls/<str:name>', views.hls_file, name='hls_file'),
     path('video/<int:video_id>/rate/', views.rate_video, name='rate_video'),
+    path('progress/heartbeat/', views.progress_heartbeat, name='progress_heartbeat'),
     path('trainer/<int:trainer_id>/rate/', views.rate_trainer, name='rate_trainer'),
     path('trainer/<int:trainer_id>/', views.trainer_details, name='trainer_details'),
 
@@ -15,6 +19,9 @@ urlpatterns = [
     path('trainer/dashboard/', views.trainer_dashboard, name='trainer_dashboard'),
     path('trainer/course/<int:course_id>/students/', views.course_students, name='course_students'),
     path('trainer/course/<int:course_id>/add-video/', views.add_video, name='add_video'),
+    path('trainer/course/<int:course_id>/uploads/', views.start_video_upload, name='start_video_upload'),
+    path('trainer/uploads/<uuid:upload_id>/', views.video_upload, name='video_upload'),
+    path('trainer/uploads/<uuid:upload_id>/complete/', views.complete_video_upload, name='complete_video_upload'),
 
 
     path('manager/payments/', views.manage_payments, name='manage_payments'),
@@ -23,9 +30,12 @@ urlpatterns = [
     path('manager/assign-trainer/<int:course_id>/', views.assign_trainer, name='assign_trainer'),
     path('manager/feedbacks/', views.student_feedbacks, name='student_feedbacks'),
     path('manager/analyze-progress/', views.analyze_student_progress, name='analyze_progress'),
+    path('manager/export/<str:name>/', views.export_data, name='export_data'),
 
 
     path('payment/<int:course_id>/', views.initiate_payment, name='initiate_payment'),
     path('payment/success/', views.payment_success, name='payment_success'),
     path('payment/cancel/', views.payment_cancel, name='payment_cancel'),
+    path('payment/webhook/', views.payment_webhook, name='payment_webhook'),
+    path('payment/fake-checkout/<str:session_id>/', views.fake_checkout, name='fake_checkout'),
 ]
\ No newline at end of file
@@ -1,21 +1,84 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Course, Video, StudentCourse, VideoProgress, Rating, Payment
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
+from django.http import StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods, require_POST, require_safe
+from .models import Course, Video, StudentCourse, VideoProgress, Rating, RatingSummary, Payment, VideoUpload
 from .forms import CourseForm
-from django.db.models import Sum, Avg
-import stripe
+from .catalog import active_catalog, enrolled_course_ids
+from .ratings import RATING_VALUES, TRAINER_TOTALS, VIDEO_TOTALS, save_rating
+from .revenue import completed_revenue, revenue_series
+from .streaming import stream_file
+from .transcoding import hls_media_dir, schedule_packaging
+from .uploads import UploadError, abort_upload, finish_upload, received_chunks, start_upload, write_chunk
+from .heartbeat import progress_buffer
+from .gateway import GatewayUnavailable
+from .metrics import registry
+from .payments import (
+    InvalidWebhook, UnknownCheckout, WebhookNotConfigured, astart_checkout, handle_event, verify_webhook,
+)
+from . import fake_payments
+from .pagination import InvalidCursor, keyset_paginate
+from .probing import probe_video
+from .search import search, suggest
+from .exports import EXPORTS, FORMATS, aiter_chunks, export_chunks, export_filename
+from .replicas import read_from_replica
+from .async_views import aget_object_or_404, async_login_required, async_require_safe
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Prefetch, Q
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.utils.dateparse import parse_date
+from datetime import datetime, time, timedelta
+from urllib.parse import urlencode
+import hmac
+import json
+import logging
+import os
+import re
 from django.conf import settings
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+logger = logging.getLogger(__name__)
+
+SEARCH_RESULTS = 30
+
 
 @login_required
 def course_list(request):
-    courses = Course.objects.filter(is_active=True)
-    if request.user.user_type == 'student':
-        enrolled_courses = StudentCourse.objects.filter(student=request.user).values_list('course_id', flat=True)
-        courses = courses.exclude(id__in=enrolled_courses)
-    return render(request, 'courses/course_list.html', {'courses': courses})
+    query = request.GET.get('q', '').strip()
+    if query:
+        # Matching courses, and the courses of matching lectures, best first;
+        # enrolled courses included so students can find their lectures.
+        hits = search(query, limit=SEARCH_RESULTS)
+        catalog = {course.id: course for course in active_catalog()}
+        ranked = dict.fromkeys(hit['course_id'] for hit in hits)
+        courses = [catalog[course_id] for course_id in ranked if course_id in catalog]
+        lectures = [hit for hit in hits if hit['kind'] == 'video']
+    else:
+        courses = active_catalog()
+        lectures = []
+        if request.user.user_type == 'student':
+            enrolled_courses = enrolled_course_ids(request.user)
+            courses = [course for course in courses if course.id not in enrolled_courses]
+    return render(request, 'courses/course_list.html', {'courses': courses, 'query': query, 'lectures': lectures})
+
+
+@login_required
+@require_safe
+def search_suggest(request):
+    suggestions = [
+        {
+            'kind': hit['kind'],
+            'title': hit['title'],
+            'url': reverse('course_detail', args=[hit['course_id']]),
+        }
+        for hit in suggest(request.GET.get('q', ''))
+    ]
+    return JsonResponse({'suggestions': suggestions})
 
 
 @login_required
@@ -25,19 +88,13 @@ def course_detail(request, course_id):
     progress_data = None
 
     if request.user.user_type == 'student':
-        is_enrolled = StudentCourse.objects.filter(student=request.user, course=course).exists()
+        enrollment = StudentCourse.objects.filter(student=request.user, course=course).first()
+        is_enrolled = enrollment is not None
         if is_enrolled:
-            total_videos = course.videos.count()
-            completed_videos = VideoProgress.objects.filter(
-                student=request.user,
-                video__course=course,
-                completed=True
-            ).count()
-            progress_percentage = (completed_videos / total_videos * 100) if total_videos > 0 else 0
             progress_data = {
-                'completed': completed_videos,
-                'total': total_videos,
-                'percentage': progress_percentage
+                'completed': enrollment.completed_videos,
+                'total': enrollment.total_videos,
+                'percentage': enrollment.progress_percentage
             }
 
     return render(request, 'courses/course_detail.html', {
@@ -80,68 +137,152 @@ def enroll_course(request, course_id):
     return redirect('course_detail', course_id=course_id)
 
 
-@login_required
-def watch_video(request, video_id):
-    video = get_object_or_404(Video, id=video_id)
-
+@async_login_required
+async def watch_video(request, video_id):
+    # Everything the template reads is loaded here: rendering runs on a
+    # thread, but lazy relations should not cost a query each.
+    video = await aget_object_or_404(
+        Video.objects.select_related('course__trainer').prefetch_related('course__videos'), id=video_id,
+    )
 
-    if not StudentCourse.objects.filter(student=request.user, course=video.course).exists():
+    enrollment = await StudentCourse.objects.filter(student=request.user, course_id=video.course_id).afirst()
+    if enrollment is None:
         messages.error(request, 'You are not enrolled in this course.')
         return redirect('course_list')
 
 
-    progress, created = VideoProgress.objects.get_or_create(
+    progress, created = await VideoProgress.objects.aget_or_create(
         student=request.user,
         video=video
     )
 
     if request.method == 'POST' and 'completed' in request.POST:
         progress.completed = True
-        progress.save()
+        await progress.asave()
         messages.success(request, 'Video marked as completed!')
         return redirect('watch_video', video_id=video_id)
 
 
-    next_video = Video.objects.filter(
-        course=video.course,
+    next_video = await Video.objects.filter(
+        course_id=video.course_id,
         order__gt=video.order
-    ).order_by('order').first()
-
+    ).order_by('order').afirst()
 
-    ratings = Rating.objects.filter(video=video)
 
+    ratings = [rating async for rating in Rating.objects.filter(video=video).select_related('student')]
 
-    total_videos = video.course.videos.count()
-    completed_videos = VideoProgress.objects.filter(
-        student=request.user,
-        video__course=video.course,
-        completed=True
-    ).count()
-    progress_percentage = (completed_videos / total_videos * 100) if total_videos > 0 else 0
-
-    return render(request, 'courses/watch_video.html', {
+    return await sync_to_async(render)(request, 'courses/watch_video.html', {
         'video': video,
         'progress': progress,
         'next_video': next_video,
         'ratings': ratings,
-        'completed_videos': completed_videos,
-        'total_videos': total_videos,
-        'progress_percentage': progress_percentage
+        'completed_videos': enrollment.completed_videos,
+        'total_videos': enrollment.total_videos,
+        'progress_percentage': enrollment.progress_percentage,
+        'heartbeat_seconds': settings.PROGRESS_HEARTBEAT_SECONDS,
     })
 
 
+async def can_watch(user, course):
+    if user.user_type == 'manager' or user.is_staff:
+        return True
+    if user.user_type == 'trainer':
+        return course.trainer_id == user.id
+    return await StudentCourse.objects.filter(student=user, course=course).aexists()
+
+
+@async_login_required
+@async_require_safe
+async def stream_video(request, video_id):
+    video = await aget_object_or_404(Video.objects.select_related('course'), id=video_id)
+
+    if not await can_watch(request.user, video.course):
+        return HttpResponseForbidden('You are not enrolled in this course.')
+
+    if not video.video_file:
+        raise Http404('Video file not uploaded yet.')
+
+    try:
+        return stream_file(request, video.video_file.path, video.video_file.name)
+    except FileNotFoundError:
+        raise Http404('Video file not found.')
+
+
+HLS_CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+}
+
+
+@async_login_required
+@async_require_safe
+async def hls_file(request, video_id, name):
+    video = await aget_object_or_404(Video.objects.select_related('course'), id=video_id, hls_status='ready')
+
+    if not await can_watch(request.user, video.course):
+        return HttpResponseForbidden('You are not enrolled in this course.')
+
+    extension = os.path.splitext(name)[1]
+    if not re.fullmatch(r'[\w.-]+', name) or extension not in HLS_CONTENT_TYPES:
+        raise Http404('Unknown playlist file.')
+
+    media_name = os.path.join(hls_media_dir(video), name)
+    try:
+        return stream_file(
+            request,
+            os.path.join(settings.MEDIA_ROOT, media_name),
+            media_name,
+            content_type=HLS_CONTENT_TYPES[extension],
+        )
+    except FileNotFoundError:
+        raise Http404('Playlist file not found.')
+
+
+@login_required
+@require_POST
+def progress_heartbeat(request):
+    try:
+        updates = json.loads(request.body)['updates']
+        positions = {int(update['video']): int(update['position']) for update in updates}
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected {"updates": [{"video": <id>, "position": <seconds>}]}'}, status=400)
+
+    if len(positions) > settings.PROGRESS_HEARTBEAT_MAX_VIDEOS:
+        return JsonResponse({'error': 'Too many videos in one heartbeat.'}, status=400)
+
+    allowed = Video.objects.filter(
+        id__in=positions,
+        course__studentcourse__student=request.user,
+    ).values_list('id', flat=True)
+
+    accepted = []
+    for video_id in allowed:
+        position = positions[video_id]
+        if position >= 0:
+            progress_buffer.add(request.user.id, video_id, position)
+            accepted.append(video_id)
+
+    return JsonResponse({'accepted': accepted})
+
+
+def _posted_rating(request):
+    try:
+        value = int(request.POST.get('rating', ''))
+    except ValueError:
+        return None
+    return value if value in RATING_VALUES else None
+
+
 @login_required
 def rate_video(request, video_id):
     if request.method == 'POST':
         video = get_object_or_404(Video, id=video_id)
-        rating_value = int(request.POST.get('rating'))
+        rating_value = _posted_rating(request)
+        if rating_value is None:
+            return HttpResponseBadRequest('Rating must be a whole number from 1 to 5.')
         comment = request.POST.get('comment', '')
 
-        rating, created = Rating.objects.update_or_create(
-            student=request.user,
-            video=video,
-            defaults={'rating': rating_value, 'comment': comment}
-        )
+        rating, created = save_rating(request.user, rating_value, comment, video=video)
 
         messages.success(request, 'Thank you for your rating!')
         return redirect('watch_video', video_id=video_id)
@@ -152,14 +293,12 @@ def rate_trainer(request, trainer_id):
     if request.method == 'POST':
         from users.models import CustomUser
         trainer = get_object_or_404(CustomUser, id=trainer_id, user_type='trainer')
-        rating_value = int(request.POST.get('rating'))
+        rating_value = _posted_rating(request)
+        if rating_value is None:
+            return HttpResponseBadRequest('Rating must be a whole number from 1 to 5.')
         comment = request.POST.get('comment', '')
 
-        rating, created = Rating.objects.update_or_create(
-            student=request.user,
-            trainer=trainer,
-            defaults={'rating': rating_value, 'comment': comment}
-        )
+        rating, created = save_rating(request.user, rating_value, comment, trainer=trainer)
 
         messages.success(request, 'Thank you for rating the trainer!')
         return redirect('trainer_details', trainer_id=trainer_id)
@@ -169,10 +308,31 @@ def rate_trainer(request, trainer_id):
 def trainer_details(request, trainer_id):
     from users.models import CustomUser
     trainer = get_object_or_404(CustomUser, id=trainer_id, user_type='trainer')
-    courses = Course.objects.filter(trainer=trainer, is_active=True)
+    courses = [course for course in active_catalog() if course.trainer_id == trainer.id]
+
+    summaries = RatingSummary.objects.filter(
+        Q(trainer=trainer) | Q(course_id__in=[course.id for course in courses])
+    )
+    trainer_rating = None
+    course_summaries = {}
+    for summary in summaries:
+        if summary.trainer_id:
+            trainer_rating = summary
+        else:
+            course_summaries[summary.course_id] = summary
+
+    for course in courses:
+        summary = course_summaries.get(course.id)
+        course.avg_rating = summary.average if summary else 0
+        course.rating_count = summary.rating_count if summary else 0
+
     return render(request, 'courses/trainer_details.html', {
         'trainer': trainer,
-        'courses': courses
+        'courses': courses,
+        'trainer_rating': {
+            'avg_rating': trainer_rating.average,
+            'total_ratings': trainer_rating.rating_count,
+        } if trainer_rating and trainer_rating.rating_count else None,
     })
 
 
@@ -186,7 +346,12 @@ def trainer_dashboard(request):
 
     try:
 
-        my_courses = Course.objects.filter(trainer=request.user)
+        my_courses = Course.objects.filter(trainer=request.user).select_related('category').annotate(
+            student_count=Count('studentcourse', distinct=True),
+            video_count=Count('videos', distinct=True),
+        ).prefetch_related(
+            Prefetch('studentcourse_set', queryset=StudentCourse.objects.select_related('student'))
+        )
 
 
         courses_data = []
@@ -194,12 +359,11 @@ def trainer_dashboard(request):
 
         for course in my_courses:
 
-            student_count = StudentCourse.objects.filter(course=course).count()
-            total_students_count += student_count
+            total_students_count += course.student_count
 
             courses_data.append({
                 'course': course,
-                'student_count': student_count
+                'student_count': course.student_count
             })
 
         context = {
@@ -235,29 +399,17 @@ def course_students(request, course_id):
     enrollments = StudentCourse.objects.filter(course=course).select_related('student')
 
 
-    print(f"DEBUG: Course: {course.title}")
-    print(f"DEBUG: Enrollments count: {enrollments.count()}")
-
     student_progress = []
 
     for enrollment in enrollments:
 
-        total_videos = course.videos.count()
-        completed_videos = VideoProgress.objects.filter(
-            student=enrollment.student,
-            video__course=course,
-            completed=True
-        ).count()
-
-        progress_percentage = (completed_videos / total_videos * 100) if total_videos > 0 else 0
-
         student_progress.append({
             'student': enrollment.student,
             'enrolled_at': enrollment.enrolled_at,
             'completed': enrollment.completed,
-            'progress_percentage': progress_percentage,
-            'completed_videos': completed_videos,
-            'total_videos': total_videos,
+            'progress_percentage': enrollment.progress_percentage,
+            'completed_videos': enrollment.completed_videos,
+            'total_videos': enrollment.total_videos,
             'time_spent': 0,  # Simplified for now
             'last_activity': enrollment.enrolled_at
         })
@@ -290,15 +442,21 @@ def add_video(request, course_id):
         order = request.POST.get('order', 0)
         video_file = request.FILES.get('video_file')
 
-        if title and duration:
+        # The duration is read from the file when it can be; typing it is
+        # only needed without one.
+        if title and (duration or video_file):
             video = Video.objects.create(
                 course=course,
                 title=title,
                 description=description,
-                duration=duration,
+                duration=duration or 0,
                 order=order,
                 video_file=video_file if video_file else None
             )
+            if video.video_file:
+                if not probe_video(video) and not duration:
+                    messages.warning(request, 'Could not read the length of the video file; please set its duration.')
+                schedule_packaging(video)
             messages.success(request, 'Video added successfully!')
             return redirect('trainer_dashboard')
         else:
@@ -307,8 +465,92 @@ def add_video(request, course_id):
     return render(request, 'courses/add_video.html', {'course': course})
 
 
+def _upload_state(upload, received):
+    return {
+        'id': str(upload.id),
+        'size': upload.size,
+        'chunk_size': upload.chunk_size,
+        'chunk_count': upload.chunk_count,
+        'received': received,
+        'url': reverse('video_upload', args=[upload.id]),
+        'complete_url': reverse('complete_video_upload', args=[upload.id]),
+    }
+
+
+@login_required
+@require_POST
+def start_video_upload(request, course_id):
+    if request.user.user_type != 'trainer':
+        return HttpResponseForbidden()
+    course = get_object_or_404(Course, id=course_id, trainer=request.user)
+    try:
+        data = json.loads(request.body)
+        filename, size = str(data['filename']), int(data['size'])
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected {"filename": <name>, "size": <bytes>}'}, status=400)
+    try:
+        upload = start_upload(course, request.user, filename, size)
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(_upload_state(upload, []), status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'PUT', 'DELETE'])
+def video_upload(request, upload_id):
+    """
+    GET reports which chunks have arrived, so an interrupted upload can
+    resume. PUT stores one chunk, given by its Content-Range and checked
+    against its X-Chunk-SHA256 header. DELETE abandons the upload.
+    """
+    upload = get_object_or_404(VideoUpload, id=upload_id, trainer=request.user)
+    if request.method == 'GET':
+        return JsonResponse(_upload_state(upload, received_chunks(upload)))
+    if request.method == 'DELETE':
+        abort_upload(upload)
+        return HttpResponse(status=204)
+
+    try:
+        index = write_chunk(upload, request.headers.get('Content-Range'), request,
+                            request.headers.get('X-Chunk-SHA256'))
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except FileNotFoundError:
+        raise Http404('Upload already finished.')
+    return JsonResponse({'chunk': index})
+
 
 @login_required
+@require_POST
+def complete_video_upload(request, upload_id):
+    upload = get_object_or_404(VideoUpload, id=upload_id, trainer=request.user)
+    try:
+        data = json.loads(request.body)
+        fields = {
+            'title': str(data['title']),
+            'description': str(data.get('description', '')),
+            'duration': int(data.get('duration') or 0),
+            'order': int(data.get('order', 0)),
+        }
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected title, order, description, sha256 and optionally duration.'}, status=400)
+    if not fields['title']:
+        return JsonResponse({'error': 'Please fill all required fields.'}, status=400)
+
+    try:
+        video = finish_upload(upload, data.get('sha256'), **fields)
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not probe_video(video) and not fields['duration']:
+        messages.warning(request, 'Could not read the length of the video file; please set its duration.')
+    schedule_packaging(video)
+    messages.success(request, 'Video added successfully!')
+    return JsonResponse({'video': video.id, 'redirect': reverse('trainer_dashboard')}, status=201)
+
+
+
+@login_required
+@read_from_replica
 def manager_dashboard(request):
     if request.user.user_type != 'manager':
         messages.error(request, 'Access denied. Manager only.')
@@ -327,7 +569,8 @@ def manager_dashboard(request):
     recent_feedbacks = Rating.objects.select_related('student', 'video', 'trainer').order_by('-created_at')[:5]
 
 
-    total_revenue = Payment.objects.filter(payment_status='completed').aggregate(Sum('amount'))['amount__sum'] or 0
+    total_revenue = completed_revenue()
+    revenue_trend = revenue_series()
 
 
     courses_without_trainers = Course.objects.filter(trainer__isnull=True)
@@ -337,6 +580,7 @@ def manager_dashboard(request):
         'total_students': total_students,
         'total_trainers': total_trainers,
         'total_revenue': total_revenue,
+        'revenue_trend': revenue_trend,
         'recent_payments': recent_payments,
         'recent_feedbacks': recent_feedbacks,
         'courses_without_trainers': courses_without_trainers,
@@ -345,19 +589,23 @@ def manager_dashboard(request):
     return render(request, 'manager/dashboard.html', context)
 
 
+def _start_of_day(value, days=0):
+    try:
+        day = parse_date(value)
+    except ValueError:
+        return None
+    if day is None:
+        return None
+    return timezone.make_aware(datetime.combine(day + timedelta(days=days), time.min))
+
+
 @login_required
+@read_from_replica
 def manage_payments(request):
     if request.user.user_type != 'manager':
         messages.error(request, 'Access denied.')
         return redirect('dashboard')
 
-    payments = Payment.objects.select_related('student', 'course').all().order_by('-created_at')
-
-
-    completed_payments = payments.filter(payment_status='completed')
-    pending_payments = payments.filter(payment_status='pending')
-    failed_payments = payments.filter(payment_status='failed')
-
     if request.method == 'POST':
         payment_id = request.POST.get('payment_id')
         new_status = request.POST.get('payment_status')
@@ -367,15 +615,63 @@ def manage_payments(request):
             payment.payment_status = new_status
             payment.save()
             messages.success(request, f'Payment status updated to {new_status}')
-            return redirect('manage_payments')  # Redirect to refresh the page
+            return redirect(request.get_full_path())  # Redirect to refresh the page
         except Payment.DoesNotExist:
             messages.error(request, 'Payment not found')
 
+    filters = {
+        'status': request.GET.get('status', ''),
+        'course': request.GET.get('course', ''),
+        'student': request.GET.get('student', '').strip(),
+        'date_from': request.GET.get('date_from', ''),
+        'date_to': request.GET.get('date_to', ''),
+    }
+
+    # Everything but the status filter; the status cards are counted over this.
+    payments = Payment.objects.all()
+    if filters['course'].isdigit():
+        payments = payments.filter(course_id=filters['course'])
+    if filters['student']:
+        payments = payments.filter(student__username=filters['student'])
+    date_from = _start_of_day(filters['date_from'])
+    if date_from:
+        payments = payments.filter(created_at__gte=date_from)
+    date_to = _start_of_day(filters['date_to'], days=1)
+    if date_to:
+        payments = payments.filter(created_at__lt=date_to)
+
+    status_counts = dict(
+        payments.order_by().values_list('payment_status').annotate(total=Count('id'))
+    )
+    total_count = sum(status_counts.values())
+
+    if filters['status'] in dict(Payment.PAYMENT_STATUS_CHOICES):
+        payments = payments.filter(payment_status=filters['status'])
+        matching_count = status_counts.get(filters['status'], 0)
+    else:
+        filters['status'] = ''
+        matching_count = total_count
+
+    payments = payments.select_related('student', 'course__category', 'course__trainer')
+    try:
+        page = keyset_paginate(
+            payments, settings.PAYMENTS_PAGE_SIZE,
+            after=request.GET.get('after'), before=request.GET.get('before'),
+        )
+    except InvalidCursor:
+        page = keyset_paginate(payments, settings.PAYMENTS_PAGE_SIZE)
+
     context = {
-        'payments': payments,
-        'completed_payments': completed_payments,
-        'pending_payments': pending_payments,
-        'failed_payments': failed_payments,
+        'payments': page,
+        'total_count': total_count,
+        'matching_count': matching_count,
+        'completed_count': status_counts.get('completed', 0),
+        'pending_count': status_counts.get('pending', 0),
+        'failed_count': status_counts.get('failed', 0),
+        'filters': filters,
+        'filter_query': urlencode({name: value for name, value in filters.items() if value}),
+        'status_choices': Payment.PAYMENT_STATUS_CHOICES,
+        'courses': Course.objects.only('id', 'title').order_by('title'),
     }
 
     return render(request, 'manager/manage_payments.html', context)
@@ -481,120 +777,67 @@ def assign_trainer(request, course_id):
 
 
 @login_required
+@read_from_replica
 def student_feedbacks(request):
     if request.user.user_type != 'manager':
         messages.error(request, 'Access denied.')
         return redirect('dashboard')
 
 
-    video_ratings = Rating.objects.filter(video__isnull=False).select_related('student', 'video', 'video__course')
+    video_ratings = Rating.objects.filter(video__isnull=False).select_related(
+        'student', 'video', 'video__course', 'video__course__trainer'
+    )
     trainer_ratings = Rating.objects.filter(trainer__isnull=False).select_related('student', 'trainer')
 
 
-    video_avg_rating = video_ratings.aggregate(avg=Avg('rating'))['avg'] or 0
-    trainer_avg_rating = trainer_ratings.aggregate(avg=Avg('rating'))['avg'] or 0
+    summaries = RatingSummary.objects.filter(key__in=[VIDEO_TOTALS, TRAINER_TOTALS])
+    summaries = {summary.key: summary for summary in summaries}
+    video_summary = summaries.get(VIDEO_TOTALS, RatingSummary())
+    trainer_summary = summaries.get(TRAINER_TOTALS, RatingSummary())
 
 
     rating_distribution = {}
     for i in range(1, 6):
         rating_distribution[i] = {
-            'video_count': video_ratings.filter(rating=i).count(),
-            'trainer_count': trainer_ratings.filter(rating=i).count(),
+            'video_count': video_summary.histogram[i],
+            'trainer_count': trainer_summary.histogram[i],
         }
 
     context = {
         'video_ratings': video_ratings,
         'trainer_ratings': trainer_ratings,
-        'video_avg_rating': video_avg_rating,
-        'trainer_avg_rating': trainer_avg_rating,
+        'video_rating_count': video_summary.rating_count,
+        'trainer_rating_count': trainer_summary.rating_count,
+        'video_avg_rating': video_summary.average,
+        'trainer_avg_rating': trainer_summary.average,
         'rating_distribution': rating_distribution,
-        'total_feedbacks': video_ratings.count() + trainer_ratings.count(),
+        'total_feedbacks': video_summary.rating_count + trainer_summary.rating_count,
     }
 
     return render(request, 'manager/student_feedbacks.html', context)
 
 
 @login_required
+@read_from_replica
 def analyze_student_progress(request):
     if request.user.user_type != 'manager':
         messages.error(request, 'Access denied.')
         return redirect('dashboard')
 
     from users.models import CustomUser
-    from courses.models import Course, StudentCourse, VideoProgress
+    from courses.analytics import student_progress_report, course_progress_report
 
 
     students = CustomUser.objects.filter(user_type='student')
+    courses = Course.objects.select_related('category', 'trainer')
 
+    student_progress_data = student_progress_report(students)
+    course_progress_data = course_progress_report(courses)
 
-    student_progress_data = []
 
-    for student in students:
-
-        enrollments = StudentCourse.objects.filter(student=student)
-        total_enrollments = enrollments.count()
-        completed_courses = enrollments.filter(completed=True).count()
-
-
-        total_videos_watched = VideoProgress.objects.filter(
-            student=student,
-            completed=True
-        ).count()
-
-        total_videos_assigned = 0
-        for enrollment in enrollments:
-            total_videos_assigned += enrollment.course.videos.count()
-
-        overall_progress = (total_videos_watched / total_videos_assigned * 100) if total_videos_assigned > 0 else 0
-
-
-        last_activity = VideoProgress.objects.filter(
-            student=student
-        ).order_by('-last_watched').first()
-
-        student_progress_data.append({
-            'student': student,
-            'total_enrollments': total_enrollments,
-            'completed_courses': completed_courses,
-            'overall_progress': overall_progress,
-            'total_videos_watched': total_videos_watched,
-            'last_activity': last_activity.last_watched if last_activity else None,
-        })
-
-
-    courses = Course.objects.all()
-    course_progress_data = []
-
-    for course in courses:
-        total_students = course.studentcourse_set.count()
-        completed_students = course.studentcourse_set.filter(completed=True).count()
-        avg_progress = 0
-
-        if total_students > 0:
-            total_progress = 0
-            for enrollment in course.studentcourse_set.all():
-                total_videos = course.videos.count()
-                completed_videos = VideoProgress.objects.filter(
-                    student=enrollment.student,
-                    video__course=course,
-                    completed=True
-                ).count()
-                progress = (completed_videos / total_videos * 100) if total_videos > 0 else 0
-                total_progress += progress
-
-            avg_progress = total_progress / total_students
-
-        course_progress_data.append({
-            'course': course,
-            'total_students': total_students,
-            'completed_students': completed_students,
-            'avg_progress': avg_progress,
-        })
-
-
-    total_students_count = students.count()
+    total_students_count = len(student_progress_data)
     active_students = students.filter(last_login__isnull=False).count()
-    total_courses_count = courses.count()
+    total_courses_count = len(course_progress_data)
     total_completions = StudentCourse.objects.filter(completed=True).count()
 
     context = {
@@ -604,115 +847,150 @@ def analyze_student_progress(request):
         'active_students': active_students,
         'total_courses_count': total_courses_count,
         'total_completions': total_completions,
+        'export_datasets': [('enrollments', 'Enrollments'), ('progress', 'Video progress'), ('ratings', 'Ratings')],
     }
 
     return render(request, 'manager/analyze_progress.html', context)
 
 
 @login_required
-def initiate_payment(request, course_id):
-    course = get_object_or_404(Course, id=course_id)
-    if StudentCourse.objects.filter(student=request.user, course=course).exists():
+@require_safe
+def export_data(request, name):
+    if request.user.user_type != 'manager':
+        messages.error(request, 'Access denied.')
+        return redirect('dashboard')
+    fmt = request.GET.get('format', 'csv')
+    if name not in EXPORTS or fmt not in FORMATS:
+        raise Http404('No such export')
+
+    course = request.GET.get('course', '')
+    gzip = request.GET.get('gzip') == '1'
+    chunks = export_chunks(
+        name, fmt, gzip=gzip,
+        date_from=_start_of_day(request.GET.get('date_from', '')),
+        date_to=_start_of_day(request.GET.get('date_to', ''), days=1),
+        course_id=int(course) if course.isdigit() else None,
+    )
+    if isinstance(request, ASGIRequest):
+        chunks = aiter_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type='application/gzip' if gzip else FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(name, fmt, gzip)}"'
+    return response
+
+
+@async_login_required
+async def initiate_payment(request, course_id):
+    course = await aget_object_or_404(Course.objects.all(), id=course_id)
+    if await StudentCourse.objects.filter(student=request.user, course=course).aexists():
         messages.info(request, "You are already enrolled in this course.")
         return redirect('course_detail', course_id=course.id)
 
 
     if course.price == 0:
-        StudentCourse.objects.create(student=request.user, course=course)
+        await StudentCourse.objects.acreate(student=request.user, course=course)
         messages.success(request, "Successfully enrolled in the free course!")
         return redirect('course_detail', course_id=course.id)
 
     try:
-
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[{
-                'price_data': {
-                    'currency': 'usd',
-                    'product_data': {
-                        'name': course.title,
-                        'description': course.description,
-                    },
-                    'unit_amount': int(course.price * 100),  # Convert to cents
-                },
-                'quantity': 1,
-            }],
-            mode='payment',
-            success_url=request.build_absolute_uri(
-                f'/courses/payment/success/?course_id={course.id}'
-            ),
-            cancel_url=request.build_absolute_uri(
-                f'/courses/payment/cancel/?course_id={course.id}'
-            ),
-            customer_email=request.user.email,
-            metadata={
-                'course_id': course.id,
-                'student_id': request.user.id
-            }
-        )
-
-
-        Payment.objects.create(
-            student=request.user,
-            course=course,
-            amount=course.price,
-            stripe_payment_intent_id=checkout_session.id,
-            payment_status='pending'
-        )
-
-        return redirect(checkout_session.url)
-
+        return redirect(await astart_checkout(request, course, request.user))
+    except GatewayUnavailable:
+        messages.error(request, "Payments are temporarily unavailable. Please try again in a few minutes.")
+        return redirect('course_detail', course_id=course.id)
     except Exception as e:
         messages.error(request, f"Payment error: {str(e)}")
         return redirect('course_detail', course_id=course.id)
 
 
-@login_required
-def payment_success(request):
-    course_id = request.GET.get('course_id')
-
-    if course_id:
-        try:
-
-            payment = Payment.objects.filter(
-                student=request.user,
-                course_id=course_id,
-                payment_status='pending'
-            ).order_by('-created_at').first()
-
-            if payment:
-
-                session_id = payment.stripe_payment_intent_id
-
+@async_login_required
+async def payment_success(request):
+    """
+    Enrollment is done by the payment webhook, so this only reads the
+    payment's status. Until the webhook lands the page polls by reloading.
+    """
+    payments = Payment.objects.filter(student=request.user).select_related('course')
+    session_id = request.GET.get('session_id')
+    course_id = request.GET.get('course_id', '')
+    if session_id:
+        payment = await payments.filter(stripe_session_id=session_id).afirst()
+    elif course_id.isdigit():
+        payment = await payments.filter(course_id=course_id).order_by('-created_at').afirst()
+    else:
+        payment = None
 
-                session = stripe.checkout.Session.retrieve(session_id)
+    if payment is None:
+        messages.error(request, "No payment record found.")
+    elif payment.payment_status == 'completed':
+        messages.success(request, "Payment successful! You are now enrolled in the course.")
+        return redirect('course_detail', course_id=payment.course_id)
 
-                if session.payment_status == 'paid':
+    return await sync_to_async(render)(request, 'payments/success.html', {'payment': payment})
 
-                    payment.payment_status = 'completed'
-                    payment.save()
 
+@csrf_exempt
+@require_POST
+def payment_webhook(request):
+    try:
+        handle_event(verify_webhook(request.body, request.headers.get('Stripe-Signature')))
+    except WebhookNotConfigured as e:
+        # Stripe keeps retrying a 503 until the secret is set.
+        logger.error('Payment webhook refused: %s', e)
+        return HttpResponse(status=503)
+    except InvalidWebhook:
+        return HttpResponseBadRequest()
+    except UnknownCheckout:
+        # Stripe retries, so an event that beat astart_checkout's save lands later.
+        return HttpResponse(status=404)
+    return HttpResponse()
 
-                    from courses.models import StudentCourse
-                    StudentCourse.objects.get_or_create(
-                        student=request.user,
-                        course_id=course_id
-                    )
 
-                    messages.success(request, "Payment successful! You are now enrolled in the course.")
-                    return redirect('course_detail', course_id=course_id)
-                else:
-                    messages.warning(request, "Payment is still processing.")
-            else:
-                messages.error(request, "No payment record found.")
+@login_required
+def fake_checkout(request, session_id):
+    if settings.PAYMENT_PROVIDER != 'fake':
+        raise Http404
+    payment = get_object_or_404(Payment.objects.select_related('course'), stripe_session_id=session_id,
+                                student=request.user)
+    success_url = request.GET.get('success_url', '')
+    cancel_url = request.GET.get('cancel_url', '')
+    if not url_has_allowed_host_and_scheme(success_url, allowed_hosts={request.get_host()}):
+        success_url = reverse('payment_success') + '?session_id={CHECKOUT_SESSION_ID}'
+    if not url_has_allowed_host_and_scheme(cancel_url, allowed_hosts={request.get_host()}):
+        cancel_url = reverse('payment_cancel') + f'?course_id={payment.course_id}'
 
-        except Exception as e:
-            messages.error(request, f"Error verifying payment: {str(e)}")
+    if request.method == 'POST':
+        outcome = request.POST.get('outcome')
+        if outcome == 'cancel':
+            return redirect(cancel_url)
+        if outcome == 'fail':
+            event = fake_payments.checkout_event(payment, 'checkout.session.async_payment_failed', paid=False)
+        else:
+            event = fake_payments.checkout_event(payment)
+        fake_payments.send(event, request.build_absolute_uri(reverse('payment_webhook')))
+        return redirect(success_url.replace('{CHECKOUT_SESSION_ID}', session_id))
 
-    return render(request, 'payments/success.html')
+    return render(request, 'payments/fake_checkout.html', {'payment': payment, 'course': payment.course})
 
 @login_required
 def payment_cancel(request):
     course_id = request.GET.get('course_id')
     messages.info(request, "Payment was cancelled.")
-    return redirect('course_detail', course_id=course_id)
\ No newline at end of file
+    return redirect('course_detail', course_id=course_id)
+
+
+def _metrics_token_valid(request):
+    # Not REMOTE_ADDR: behind the reverse proxy every request comes from it.
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return (bool(settings.METRICS_TOKEN) and scheme.lower() == 'bearer'
+            and hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()))
+
+
+@require_safe
+def metrics(request):
+    if not request.user.is_superuser and not _metrics_token_valid(request):
+        return HttpResponseForbidden()
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'views': registry.snapshot(),
+            'payment_provider': registry.provider_snapshot(),
+            'fragment_cache': registry.fragment_snapshot(),
+        })
+    return HttpResponse(registry.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
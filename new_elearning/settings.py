@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'courses.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,7 +56,7 @@ ROOT_URLCONF = 'new_elearning.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'courses.metrics.InstrumentedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -77,10 +78,51 @@ WSGI_APPLICATION = 'new_elearning.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # Django's SQLite backend plus OPTIONS['transaction_mode'] (from 5.1).
+        'ENGINE': 'courses.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # Transactions take the write lock when they start, so a read followed
+        # by a write waits for busy_timeout instead of failing as locked.
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        # Keep each thread's connection between requests, so SQLITE_PRAGMAS
+        # run once per connection rather than on every request.
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # Reporting views read from here while it is fresh (courses/replicas.py).
+    # `manage.py snapshot_replica` fills it from the primary.
+    'replica': {
+        'ENGINE': 'courses.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+DATABASE_ROUTERS = ['courses.replicas.ReplicaRouter']
+# The alias read_from_replica views read from, or None for the primary. A
+# replica more than REPLICA_MAX_LAG seconds behind (by its heartbeat, read
+# at most every REPLICA_CHECK_INTERVAL seconds) is skipped.
+REPLICA_DATABASE = 'replica'
+REPLICA_MAX_LAG = 5 * 60
+REPLICA_CHECK_INTERVAL = 5
+
+# Run on every new SQLite connection (courses/sqlite.py). Writers wait up to
+# busy_timeout ms for the lock. cache_size is in KiB if negative. An empty
+# dict leaves SQLite's defaults.
+SQLITE_PRAGMAS = {
+    'busy_timeout': 20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'memory',
 }
+# WAL lets reads go on during a write; with synchronous=normal a commit skips
+# the fsync, which under WAL only risks the last transactions on power loss,
+# not corruption. WAL is stored in the database file itself, so it is opt-in
+# (SQLITE_WAL=1, as deployments should set): otherwise any manage.py command
+# would convert the checked-in development database.
+if os.environ.get('SQLITE_WAL') == '1':
+    SQLITE_PRAGMAS.update({'journal_mode': 'wal', 'synchronous': 'normal'})
 
 
 # Password validation
@@ -124,6 +166,43 @@ STATIC_ROOT=os.path.join(BASE_DIR,'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Lecture videos are served by courses.views.stream_video. Set the offload mode
+# to 'x-accel-redirect' (nginx, internal location at the prefix below mapped to
+# MEDIA_ROOT) or 'x-sendfile' (Apache/lighttpd) to let the proxy send the bytes.
+VIDEO_STREAM_CHUNK_SIZE = 256 * 1024
+VIDEO_STREAM_OFFLOAD = None
+VIDEO_STREAM_ACCEL_PREFIX = '/protected-media/'
+
+# Uploaded lectures are packaged into HLS renditions with a local ffmpeg
+# install (see courses/transcoding.py). Rungs taller than the source are skipped.
+HLS_AUTO_PACKAGE = True
+HLS_FFMPEG_BINARY = 'ffmpeg'
+HLS_FFPROBE_BINARY = 'ffprobe'
+HLS_SEGMENT_SECONDS = 6
+HLS_RENDITIONS = [
+    {'name': '360p', 'height': 360, 'video_bitrate': 800, 'audio_bitrate': 96},
+    {'name': '480p', 'height': 480, 'video_bitrate': 1400, 'audio_bitrate': 128},
+    {'name': '720p', 'height': 720, 'video_bitrate': 2800, 'audio_bitrate': 128},
+    {'name': '1080p', 'height': 1080, 'video_bitrate': 5000, 'audio_bitrate': 192},
+]
+
+# Tried in order on every uploaded video until one recognises the file (see
+# courses/probing.py). Each takes a path and returns a dict or None.
+MEDIA_PROBERS = [
+    'courses.probing.probe_mp4',
+    'courses.probing.probe_ffprobe',
+]
+
+# The player reports its position every PROGRESS_HEARTBEAT_SECONDS; each worker
+# coalesces positions in memory and writes them every PROGRESS_FLUSH_INTERVAL
+# seconds from a background thread, and once more when it exits cleanly. A
+# worker that is killed (SIGKILL, the OOM killer, a hard timeout) loses up to
+# PROGRESS_FLUSH_INTERVAL seconds of positions, which the next heartbeats of
+# those viewers replace.
+PROGRESS_HEARTBEAT_SECONDS = 15
+PROGRESS_HEARTBEAT_MAX_VIDEOS = 20
+PROGRESS_FLUSH_INTERVAL = 10
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 AUTH_USER_MODEL = 'users.CustomUser'
@@ -133,7 +212,114 @@ LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'home'
 
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+# Mail is queued as a background job and delivered by a worker through
+# JOBS_EMAIL_BACKEND.
+EMAIL_BACKEND = 'courses.mail.QueuedEmailBackend'
+JOBS_EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# Catalog snapshots are invalidated by signals, so in multi-process deployments
+# point this at a shared backend (Redis/Memcached) for invalidation to reach
+# every worker.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+CATALOG_CACHE_TIMEOUT = 60 * 60
+# Course page fragments ({% coursecache %}) are keyed on a per-course version
+# that signals change, so the timeout only bounds what stale copies cost.
+FRAGMENT_CACHE_TIMEOUT = 24 * 60 * 60
+# Browser lifetime of the state/district lists (users/views.py). Pages request
+# them with the geo tree's version, which changes on every edit.
+GEO_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+# Seconds between each process's checks of the geo tree's version, so an
+# edit made through one worker reaches the others within this long.
+GEO_VERSION_CHECK_INTERVAL = 5
+
+PAYMENTS_PAGE_SIZE = 50
+
+# Streaming exports (courses/exports.py): rows fetched per database round
+# trip, and the size the output is gathered into before it is sent.
+EXPORT_QUERY_CHUNK_SIZE = 2000
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# Course and lecture search (courses/search.py). FTS5Search needs SQLite
+# with FTS5; 'courses.search.DatabaseSearch' works on any database, unranked.
+SEARCH_BACKEND = 'courses.search.FTS5Search'
+
+# Resumable video uploads: chunk size in bytes, largest accepted file, and
+# seconds without a new chunk before an unfinished upload is removed by
+# `manage.py purge_uploads`.
+VIDEO_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+VIDEO_UPLOAD_MAX_SIZE = 20 * 1024 ** 3
+VIDEO_UPLOAD_EXPIRY = 24 * 60 * 60
+
+# Background jobs (courses/jobs.py) run in `manage.py run_jobs` workers. Jobs
+# on the queues listed in JOBS_IMMEDIATE (True for all) run in the web process
+# after the request commits instead; under DEBUG that is mail, so it is sent
+# without a worker. Video packaging takes minutes, so keep it off this list and
+# run at least one worker; with no --queue it takes every queue (mail, video
+# and default), or split them, e.g.:
+#   manage.py run_jobs --queue default --queue mail
+#   manage.py run_jobs --queue video
+# Failed attempts are retried after up to JOBS_RETRY_BACKOFF * 2^n seconds.
+JOBS_IMMEDIATE = ['mail'] if DEBUG else []
+JOBS_RETRY_BACKOFF = 5
+
+# Request metrics are served at /metrics/ to superusers and to scrapers that
+# send "Authorization: Bearer <METRICS_TOKEN>". Left unset, only superusers.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# A request that runs the same statement this many times is logged as a
+# likely N+1.
+QUERY_DUPLICATE_THRESHOLD = 5
+# Maximum SQL queries per view, session and auth lookups included. Going over
+# is logged, or raises QueryBudgetExceeded when QUERY_BUDGET_ACTION is 'raise'.
+QUERY_BUDGETS = {
+    'dashboard': 10,
+    'manager_dashboard': 10,
+    'trainer_dashboard': 6,
+    'course_list': 5,
+    'search_suggest': 3,
+    'course_detail': 15,
+    'watch_video': 25,
+    'stream_video': 5,
+    'hls_file': 5,
+    'progress_heartbeat': 5,
+    'trainer_details': 6,
+    'course_students': 6,
+    'manage_payments': 6,
+    'payment_success': 4,
+    'analyze_progress': 15,
+    'student_feedbacks': 8,
+}
+QUERY_BUDGET_ACTION = 'log'
 
 STRIPE_PUBLISHABLE_KEY='pk_test_51SCOUl2WWjNRzxDIWXplgj3H4ZU0p7Us9Ho1QnIz5HL3bFHIHP0aYlAlpxwnNwW9cVJ3Chtgws9ixTGjKnSytlfN00UmLlgaMZ'
-STRIPE_SECRET_KEY='sk_test_51SCOUl2WWjNRzxDIs9GlPziW0RXuJQKQR1EMHlw9mjHyGFsNr4xbi5oWtIYHacQTr1Wp45DEvVMvNedMSmr7N0rA00a4StkThC'
\ No newline at end of file
+STRIPE_SECRET_KEY='sk_test_51SCOUl2WWjNRzxDIs9GlPziW0RXuJQKQR1EMHlw9mjHyGFsNr4xbi5oWtIYHacQTr1Wp45DEvVMvNedMSmr7N0rA00a4StkThC'
+# Outbound calls to the payment provider (courses/gateway.py). Timeouts and
+# the deadline are in seconds; the deadline bounds all retries together.
+# Point PAYMENT_GATEWAY_API_BASE at `manage.py run_payment_stub` to test
+# against a local stub instead of api.stripe.com.
+PAYMENT_GATEWAY_API_BASE = os.environ.get('PAYMENT_GATEWAY_API_BASE') or None
+PAYMENT_GATEWAY_CONNECT_TIMEOUT = 3
+PAYMENT_GATEWAY_READ_TIMEOUT = 5
+PAYMENT_GATEWAY_RETRIES = 2
+PAYMENT_GATEWAY_DEADLINE = 8
+PAYMENT_GATEWAY_POOL_SIZE = 10
+# Consecutive failed requests that open the circuit, and how long it stays
+# open before a trial request is let through.
+PAYMENT_GATEWAY_FAILURE_THRESHOLD = 5
+PAYMENT_GATEWAY_RESET_TIMEOUT = 30
+# Signs payment webhooks. While it is unset every webhook is refused with a
+# 503, except with the fake provider, which signs with a key derived from
+# SECRET_KEY.
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
+# Seconds of clock skew allowed on webhook signatures before they are
+# treated as replays.
+STRIPE_WEBHOOK_TOLERANCE = 300
+# 'stripe', or 'fake' to check out against the local stand-in in
+# courses/fake_payments.py.
+PAYMENT_PROVIDER = os.environ.get('PAYMENT_PROVIDER', 'stripe')
+# Seconds the fake provider waits before posting its webhook; None handles
+# the event in-process during the checkout request.
+FAKE_PAYMENT_WEBHOOK_DELAY = 1
@@ -30,6 +30,7 @@ urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
     path('trainer/dashboard/', courses_views.trainer_dashboard, name='trainer_dashboard'),
     path('manager/dashboard/', courses_views.manager_dashboard, name='manager_dashboard'),
+    path('metrics/', courses_views.metrics, name='metrics'),
     path('profile/', views.profile, name='profile'),
     path('profile/update/', views.update_profile, name='update_profile'),
     path('users/', include('users.urls')),
@@ -71,6 +72,7 @@ urlpatterns = [
 handler404 = 'new_elearning.views.handler404'
 handler500 = 'new_elearning.views.handler500'
 
+# MEDIA_ROOT holds lecture videos, HLS renditions and unfinished uploads, so
+# it is never served as is: stream_video and hls_file check enrollment first.
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
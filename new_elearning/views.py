@@ -13,49 +13,44 @@ def dashboard(request):
     context = {'user': user}
 
     if user.user_type == 'student':
-        from courses.models import StudentCourse, VideoProgress
-        enrolled_courses = StudentCourse.objects.filter(student=user)
+        from courses.models import StudentCourse
+        enrolled_courses = StudentCourse.objects.filter(student=user).select_related('course')
         progress_data = []
         for course_enrollment in enrolled_courses:
-            total_videos = course_enrollment.course.videos.count()
-            completed_videos = VideoProgress.objects.filter(
-                student=user,
-                video__course=course_enrollment.course,
-                completed=True
-            ).count()
-            progress_percentage = (completed_videos / total_videos * 100) if total_videos > 0 else 0
             progress_data.append({
                 'course': course_enrollment.course,
-                'progress': progress_percentage,
-                'completed_videos': completed_videos,
-                'total_videos': total_videos
+                'progress': course_enrollment.progress_percentage,
+                'completed_videos': course_enrollment.completed_videos,
+                'total_videos': course_enrollment.total_videos
             })
         context['progress_data'] = progress_data
 
     elif user.user_type == 'trainer':
+        from django.db.models import Count
         from courses.models import Course
-        courses = Course.objects.filter(trainer=user)
+        courses = Course.objects.filter(trainer=user).annotate(
+            enrolled_students=Count('studentcourse', distinct=True),
+            total_videos=Count('videos', distinct=True),
+        )
         course_data = []
         for course in courses:
-            enrolled_students = course.studentcourse_set.count()
-            total_videos = course.videos.count()
             course_data.append({
                 'course': course,
-                'enrolled_students': enrolled_students,
-                'total_videos': total_videos
+                'enrolled_students': course.enrolled_students,
+                'total_videos': course.total_videos
             })
+        context['courses'] = courses
         context['course_data'] = course_data
 
     elif user.user_type == 'manager':
         from courses.models import Course, Payment
+        from courses.revenue import completed_revenue
         from users.models import CustomUser
         total_courses = Course.objects.count()
         total_students = CustomUser.objects.filter(user_type='student').count()
         total_trainers = CustomUser.objects.filter(user_type='trainer').count()
         recent_payments = Payment.objects.select_related('student', 'course').order_by('-created_at')[:10]
-        total_revenue = sum([payment.amount for payment in
-                             Payment.objects.filter(payment_status='completed')]) if Payment.objects.filter(
-            payment_status='completed').exists() else 0
+        total_revenue = completed_revenue()
 
         context.update({
             'total_courses': total_courses,
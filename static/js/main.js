@@ -13,35 +13,31 @@ document.addEventListener('DOMContentLoaded', function() {
     const stateSelect = document.getElementById('id_state');
     const districtSelect = document.getElementById('id_district');
 
+    // Each select's data-options-url lists the options of the next one down.
+    function loadOptions(select, parentParam, target, emptyLabel) {
+        fetch(`${select.dataset.optionsUrl}&${parentParam}=${encodeURIComponent(select.value)}`)
+            .then(response => response.json())
+            .then(data => {
+                target.replaceChildren(new Option(emptyLabel, ''));
+                data.forEach(item => target.add(new Option(item.name, item.id)));
+            });
+    }
+
     if (countrySelect) {
         countrySelect.addEventListener('change', function() {
-            const countryId = this.value;
-            if (countryId) {
-                fetch(`/users/get-states/?country_id=${countryId}`)
-                    .then(response => response.json())
-                    .then(data => {
-                        stateSelect.innerHTML = '<option value="">Select State</option>';
-                        districtSelect.innerHTML = '<option value="">Select District</option>';
-                        data.forEach(state => {
-                            stateSelect.innerHTML += `<option value="${state.id}">${state.name}</option>`;
-                        });
-                    });
+            stateSelect.replaceChildren(new Option('Select State', ''));
+            districtSelect.replaceChildren(new Option('Select District', ''));
+            if (this.value) {
+                loadOptions(this, 'country_id', stateSelect, 'Select State');
             }
         });
     }
 
     if (stateSelect) {
         stateSelect.addEventListener('change', function() {
-            const stateId = this.value;
-            if (stateId) {
-                fetch(`/users/get-districts/?state_id=${stateId}`)
-                    .then(response => response.json())
-                    .then(data => {
-                        districtSelect.innerHTML = '<option value="">Select District</option>';
-                        data.forEach(district => {
-                            districtSelect.innerHTML += `<option value="${district.id}">${district.name}</option>`;
-                        });
-                    });
+            districtSelect.replaceChildren(new Option('Select District', ''));
+            if (this.value) {
+                loadOptions(this, 'state_id', districtSelect, 'Select District');
             }
         });
     }
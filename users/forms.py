@@ -1,8 +1,52 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
+from .geo import geo_tree
 from .models import CustomUser, Country, State, District
 
 
+class GeoChoiceIterator:
+    def __init__(self, field):
+        self.field = field
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        yield from geo_tree().options(self.field.queryset.model, self.field.parent_id)
+
+
+class GeoChoiceField(forms.ModelChoiceField):
+    """
+    A country, state or district, offered and validated from the in-memory
+    geo tree instead of a query. ``parent_id`` is the country whose states
+    (or the state whose districts) may be chosen.
+    """
+
+    def __init__(self, queryset, **kwargs):
+        self.parent_id = None
+        super().__init__(queryset, **kwargs)
+
+    def _get_choices(self):
+        # Read when the options are rendered, after parent_id is set.
+        return GeoChoiceIterator(self)
+
+    choices = property(_get_choices, forms.ChoiceField._set_choices)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        instance = geo_tree().get(self.queryset.model, value, self.parent_id)
+        if instance is None:
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value},
+            )
+        return instance
+
+
+def limit_geo_choices(form, country_id, state_id):
+    form.fields['state'].parent_id = country_id
+    form.fields['district'].parent_id = state_id
+
+
 class UserRegistrationForm(UserCreationForm):
     email = forms.EmailField(
         required=True,
@@ -20,20 +64,20 @@ class UserRegistrationForm(UserCreationForm):
     )
 
 
-    country = forms.ModelChoiceField(
+    country = GeoChoiceField(
         queryset=Country.objects.all(),
         required=False,
         widget=forms.Select(attrs={'class': 'form-control'}),
         empty_label="Select Country"
     )
-    state = forms.ModelChoiceField(
-        queryset=State.objects.none(),
+    state = GeoChoiceField(
+        queryset=State.objects.all(),
         required=False,
         widget=forms.Select(attrs={'class': 'form-control'}),
         empty_label="Select State"
     )
-    district = forms.ModelChoiceField(
-        queryset=District.objects.none(),
+    district = GeoChoiceField(
+        queryset=District.objects.all(),
         required=False,
         widget=forms.Select(attrs={'class': 'form-control'}),
         empty_label="Select District"
@@ -78,23 +122,7 @@ class UserRegistrationForm(UserCreationForm):
 
 
         if self.data:
-            country_id = self.data.get('country')
-            state_id = self.data.get('state')
-        else:
-            country_id = None
-            state_id = None
-
-
-        if country_id:
-            self.fields['state'].queryset = State.objects.filter(country_id=country_id).order_by('name')
-        else:
-            self.fields['state'].queryset = State.objects.none()
-
-
-        if state_id:
-            self.fields['district'].queryset = District.objects.filter(state_id=state_id).order_by('name')
-        else:
-            self.fields['district'].queryset = District.objects.none()
+            limit_geo_choices(self, self.data.get('country'), self.data.get('state'))
 
     def save(self, commit=True):
         user = super().save(commit=False)
@@ -115,6 +143,9 @@ class CustomUserForm(forms.ModelForm):
         required=False,
         label="Confirm Password"
     )
+    country = GeoChoiceField(queryset=Country.objects.all(), required=False, empty_label="Select Country")
+    state = GeoChoiceField(queryset=State.objects.all(), required=False, empty_label="Select State")
+    district = GeoChoiceField(queryset=District.objects.all(), required=False, empty_label="Select District")
 
     class Meta:
         model = CustomUser
@@ -128,27 +159,9 @@ class CustomUserForm(forms.ModelForm):
 
 
         if self.data:
-            country_id = self.data.get('country')
-            state_id = self.data.get('state')
+            limit_geo_choices(self, self.data.get('country'), self.data.get('state'))
         elif self.instance.pk:
-
-            country_id = self.instance.country_id
-            state_id = self.instance.state_id
-        else:
-            country_id = None
-            state_id = None
-
-
-        if country_id:
-            self.fields['state'].queryset = State.objects.filter(country_id=country_id).order_by('name')
-        else:
-            self.fields['state'].queryset = State.objects.none()
-
-
-        if state_id:
-            self.fields['district'].queryset = District.objects.filter(state_id=state_id).order_by('name')
-        else:
-            self.fields['district'].queryset = District.objects.none()
+            limit_geo_choices(self, self.instance.country_id, self.instance.state_id)
 
     def clean(self):
         cleaned_data = super().clean()
@@ -0,0 +1,163 @@
+"""
+The Country → State → District tree, read once per process and kept in
+memory. Edits stamp a new version in the GeoVersion row (users/signals.py).
+Each process reads that row at most once per GEO_VERSION_CHECK_INTERVAL
+seconds and reloads the tree when it changed, so an edit reaches every
+worker within the interval, and the registration cascade and the address
+fields of the user forms don't query the three tables per request.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Country, District, GeoVersion, State
+
+# The attribute holding each level's parent; countries have none.
+PARENTS = {Country: None, State: 'country_id', District: 'state_id'}
+
+
+def _pk(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# (checked at, version) of this process's last read of the GeoVersion row.
+_checked = (None, None)
+
+
+def geo_version():
+    global _checked
+    now = time.monotonic()
+    checked_at, version = _checked
+    if checked_at is None or now - checked_at >= settings.GEO_VERSION_CHECK_INTERVAL:
+        version = GeoVersion.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+        _checked = (now, version)
+    return version
+
+
+def bump_geo_version():
+    global _checked
+    version = time.time_ns()
+    GeoVersion.objects.update_or_create(pk=1, defaults={'version': version})
+    # This process reloads straight away; the others within the interval.
+    _checked = (time.monotonic(), version)
+
+
+class GeoTree:
+    def __init__(self, version):
+        self.version = version
+        # {model: {id: (name, parent_id)}} and {model: {parent_id: [(id, name), ...]}}
+        self.rows = {}
+        self.children = {}
+        self._payloads = {}
+        for model, parent in PARENTS.items():
+            fields = ['id', 'name', parent] if parent else ['id', 'name']
+            rows = {}
+            children = {}
+            for row in model.objects.order_by('name', 'id').values_list(*fields):
+                parent_id = row[2] if parent else None
+                rows[row[0]] = (row[1], parent_id)
+                children.setdefault(parent_id, []).append((row[0], row[1]))
+            self.rows[model] = rows
+            self.children[model] = children
+
+    def options(self, model, parent_id=None):
+        """
+        (id, name) pairs of the countries, or of the states of a country or
+        the districts of a state, by name.
+        """
+        if PARENTS[model] is None:
+            return self.children[model].get(None, [])
+        return self.children[model].get(_pk(parent_id), [])
+
+    def get(self, model, pk, parent_id=None):
+        """
+        The instance with this primary key under ``parent_id``, built without
+        a query, or None.
+        """
+        pk = _pk(pk)
+        row = self.rows[model].get(pk)
+        if row is None:
+            return None
+        name, row_parent_id = row
+        if PARENTS[model] is None:
+            return model.from_db('default', ['id', 'name'], [pk, name])
+        if row_parent_id != _pk(parent_id):
+            return None
+        return model.from_db('default', ['id', 'name', PARENTS[model]], [pk, name, row_parent_id])
+
+    def payload(self, model, parent_id=None):
+        """
+        The options as compact JSON and a strong ETag over it, built once.
+        """
+        key = (model, _pk(parent_id))
+        if key not in self._payloads:
+            body = json.dumps([{'id': pk, 'name': name} for pk, name in self.options(model, key[1])],
+                              separators=(',', ':'), ensure_ascii=False).encode()
+            self._payloads[key] = (body, f'"{hashlib.sha1(body).hexdigest()[:20]}"')
+        return self._payloads[key]
+
+
+_tree = None
+_tree_lock = threading.Lock()
+
+
+def geo_tree():
+    global _tree
+    version = geo_version()
+    tree = _tree
+    if tree is None or tree.version != version:
+        with _tree_lock:
+            if _tree is None or _tree.version != version:
+                _tree = GeoTree(version)
+            tree = _tree
+    return tree
+
+
+def _create_missing(model, wanted, batch_size):
+    """
+    Bulk-create the (parent_id, name) pairs in ``wanted`` that do not exist
+    yet. Returns the id of every pair and how many were created.
+    """
+    parent = PARENTS[model]
+
+    def existing():
+        fields = ['id', parent, 'name'] if parent else ['id', 'name']
+        return {(row[1] if parent else None, row[-1]): row[0] for row in model.objects.values_list(*fields)}
+
+    ids = existing()
+    missing = [pair for pair in wanted if pair not in ids]
+    model.objects.bulk_create(
+        (model(name=name, **({parent: parent_id} if parent else {})) for parent_id, name in missing),
+        batch_size=batch_size,
+    )
+    return (existing() if missing else ids), len(missing)
+
+
+def load_geo(rows, batch_size=5000):
+    """
+    Add the places in ``rows`` of (country, state, district) names, where
+    state and district may be blank, skipping any that already exist. One
+    bulk insert per level in a single transaction. Returns the number of
+    rows created per model.
+    """
+    rows = [tuple(name.strip() for name in row) for row in rows]
+    with transaction.atomic():
+        countries, country_count = _create_missing(
+            Country, {(None, country) for country, _, _ in rows if country}, batch_size)
+        states, state_count = _create_missing(
+            State, {(countries[None, country], state) for country, state, _ in rows if country and state},
+            batch_size)
+        districts, district_count = _create_missing(
+            District, {(states[countries[None, country], state], district)
+                       for country, state, district in rows if country and state and district},
+            batch_size)
+        # bulk_create sends no signals.
+        transaction.on_commit(bump_geo_version)
+    return {'Country': country_count, 'State': state_count, 'District': district_count}
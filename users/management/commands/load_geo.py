@@ -0,0 +1,42 @@
+import csv
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.geo import load_geo
+
+COLUMNS = ('country', 'state', 'district')
+
+
+class Command(BaseCommand):
+    help = ('Bulk-load countries, states and districts from a CSV file with country, state and district '
+            'columns, one row per district (leave district blank for a state without any). Places that '
+            'already exist are skipped, so a dataset can be loaded again after it grows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file, or - for standard input.')
+        parser.add_argument('--delimiter', default=',')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options['path'] == '-':
+            rows = self.read(sys.stdin, options['delimiter'])
+        else:
+            with open(options['path'], newline='', encoding='utf-8-sig') as f:
+                rows = self.read(f, options['delimiter'])
+
+        counts = load_geo(rows, batch_size=options['batch_size'])
+        for model, count in counts.items():
+            self.stdout.write(f'  {model:<9} {count} new')
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {len(rows)} rows in {time.perf_counter() - start:.1f}s.'))
+
+    def read(self, f, delimiter):
+        reader = csv.DictReader(f, delimiter=delimiter)
+        headers = {name.strip().lower(): name for name in reader.fieldnames or []}
+        missing = [column for column in COLUMNS if column not in headers]
+        if missing:
+            raise CommandError(f'Missing column(s): {", ".join(missing)}')
+        return [tuple(row[headers[column]] or '' for column in COLUMNS) for row in reader]
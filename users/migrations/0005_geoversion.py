@@ -0,0 +1,20 @@
+# Generated by Django 4.2.24 on 2026-10-18 23:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_customuser_user_type_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeoVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField()),
+            ],
+        ),
+    ]
@@ -25,6 +25,18 @@ class District(models.Model):
         return self.name
 
 
+class GeoVersion(models.Model):
+    """
+    One row, stamped whenever a Country, State or District changes. Kept in
+    the database so every process sees it, whatever the cache backend
+    (users/geo.py).
+    """
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return str(self.version)
+
+
 class CustomUser(AbstractUser):
     USER_TYPE_CHOICES = (
         ('student', 'Student'),
@@ -66,4 +78,7 @@ class CustomUser(AbstractUser):
 
     class Meta:
 
-        db_table = 'users_customuser'
\ No newline at end of file
+        db_table = 'users_customuser'
+        indexes = [
+            models.Index(fields=['user_type'], name='user_type_idx'),
+        ]
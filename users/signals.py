@@ -0,0 +1,17 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .geo import bump_geo_version
+from .models import Country, District, State
+
+
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+@receiver(post_save, sender=State)
+@receiver(post_delete, sender=State)
+@receiver(post_save, sender=District)
+@receiver(post_delete, sender=District)
+def geo_changed(sender, **kwargs):
+    # After commit, so no process reloads the tree before the edit is visible.
+    transaction.on_commit(bump_geo_version)
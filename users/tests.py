@@ -1,3 +1,84 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from . import geo
+from .models import Country, District, GeoVersion, State
+
+
+class GeoOptionsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.india = Country.objects.create(name='India')
+        cls.kerala = State.objects.create(name='Kerala', country=cls.india)
+        State.objects.create(name='Goa', country=cls.india)
+        District.objects.create(name='Ernakulam', state=cls.kerala)
+
+    def setUp(self):
+        # Each test starts from its own GeoVersion row, not a version or a
+        # tree this process read in an earlier test.
+        geo._checked = (None, None)
+        geo._tree = None
+
+    def states(self, etag=None, **query):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('get_states'), {'country_id': self.india.id, **query}, **headers)
+
+    def edit(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            State.objects.create(country=self.india, **fields)
+
+    def test_options_by_name(self):
+        response = self.states()
+        self.assertEqual([state['name'] for state in response.json()], ['Goa', 'Kerala'])
+        self.assertEqual(response.json()[1]['id'], self.kerala.id)
+        response = self.client.get(reverse('get_districts'), {'state_id': self.kerala.id})
+        self.assertEqual([district['name'] for district in response.json()], ['Ernakulam'])
+        self.assertEqual(self.client.get(reverse('get_states'), {'country_id': 'x'}).status_code, 400)
+
+    def test_etag_revalidation(self):
+        etag = self.states()['ETag']
+        response = self.states(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        self.edit(name='Assam')
+        response = self.states(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()[0]['name'], 'Assam')
+
+    def test_versioned_urls_are_immutable(self):
+        version = geo.geo_tree().version
+        response = self.states(v=version)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=', response['Cache-Control'])
+
+        self.edit(name='Assam')
+        new_version = geo.geo_tree().version
+        self.assertNotEqual(new_version, version)
+        # A page rendered before the edit asks for a version that is gone.
+        self.assertIn('no-cache', self.states(v=version)['Cache-Control'])
+        self.assertIn('no-cache', self.states()['Cache-Control'])
+        self.assertIn('immutable', self.states(v=new_version)['Cache-Control'])
+
+    def test_pages_link_the_current_version(self):
+        response = self.client.get(reverse('register'))
+        self.assertEqual(response.context['geo_version'], geo.geo_tree().version)
+
+    def test_other_processes_edits_arrive_within_the_interval(self):
+        with self.assertNumQueries(4):
+            # The version row, then each level of the tree.
+            tree = geo.geo_tree()
+        # Another process bumps the version: this one reads the row again
+        # only once the interval is up.
+        GeoVersion.objects.update_or_create(pk=1, defaults={'version': 1})
+        with self.settings(GEO_VERSION_CHECK_INTERVAL=60), self.assertNumQueries(0):
+            self.assertIs(geo.geo_tree(), tree)
+        with self.settings(GEO_VERSION_CHECK_INTERVAL=0):
+            self.assertEqual(geo.geo_tree().version, 1)
+
+    def test_lookups_check_the_parent(self):
+        tree = geo.geo_tree()
+        self.assertEqual(tree.get(State, self.kerala.id, self.india.id).name, 'Kerala')
+        self.assertIsNone(tree.get(State, self.kerala.id, self.india.id + 1))
+        self.assertIsNone(tree.get(State, 'nope', self.india.id))
@@ -5,4 +5,6 @@ urlpatterns = [
     path('register/', views.register, name='register'),
     path('profile/', views.profile, name='profile'),
     path('profile/update/', views.update_profile, name='update_profile'),
+    path('get-states/', views.get_states, name='get_states'),
+    path('get-districts/', views.get_districts, name='get_districts'),
 ]
\ No newline at end of file
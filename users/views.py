@@ -1,8 +1,13 @@
 from django.shortcuts import render, redirect
+from django.conf import settings
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Country
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
+from .geo import geo_tree
+from .models import Country, District, State
 from .forms import UserRegistrationForm, CustomUserForm
 
 
@@ -30,11 +35,9 @@ def register(request):
         form = UserRegistrationForm()
 
 
-    countries = Country.objects.all()
-
     return render(request, 'users/register.html', {
         'form': form,
-        'countries': countries,
+        'geo_version': geo_tree().version,
     })
 
 
@@ -68,5 +71,34 @@ def update_profile(request):
 
     return render(request, 'users/update_profile.html', {
         'form': form,
-        'countries': Country.objects.all(),
-    })
\ No newline at end of file
+        'geo_version': geo_tree().version,
+    })
+
+
+def geo_options(request, model, parent_param):
+    parent_id = request.GET.get(parent_param, '')
+    if not parent_id.isdigit():
+        return HttpResponseBadRequest(f'{parent_param} must be an id')
+    tree = geo_tree()
+    body, etag = tree.payload(model, parent_id)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    if request.GET.get('v') == str(tree.version):
+        # The page asked for this version of the tree; an edit changes the
+        # version and so the URL.
+        patch_cache_control(response, public=True, max_age=settings.GEO_CACHE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+@require_safe
+def get_states(request):
+    return geo_options(request, State, 'country_id')
+
+
+@require_safe
+def get_districts(request):
+    return geo_options(request, District, 'state_id')
\ No newline at end of file